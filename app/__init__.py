@@ -1,7 +1,7 @@
 from dotenv import load_dotenv
 import os
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
-from flask import Flask, session
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
@@ -18,8 +18,21 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # Trust X-Forwarded-* from this many reverse proxies (request.remote_addr
+    # is what rate limits key on)
+    hops = app.config.get('PROXY_FIX_HOPS', 0)
+    if hops:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
     # Initialize extensions
     db.init_app(app)
+    from app.utils.sqlite import init_sqlite
+    init_sqlite(app)
+    from app.utils.db_metrics import db_metrics
+    db_metrics.init_app(app)
+    from app.utils.query_audit import query_auditor
+    query_auditor.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     mail.init_app(app)
@@ -29,6 +42,8 @@ def create_app():
     login_manager.login_message_category = 'info'
 
     from app.models import User
+    from app.utils.catalog import catalog_cache
+    catalog_cache.init_app(app)
 
     # 🔥 REQUIRED: Load user from session
     @login_manager.user_loader
@@ -50,12 +65,15 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(admin_delivery_bp, url_prefix='/admin/delivery')
 
+    from app.utils.cart import init_cart, get_cart
+    init_cart(app)
+
     @app.context_processor
     def cart_context():
-        cart = session.get('cart', {})
-        # quantity-sum version → total = sum(d['quantity'] for d in cart.values())
+        cart = get_cart()
+        # quantity-sum version → total = sum(cart.values())
         total_items = len(cart)                      # distinct items
-        in_cart_ids   = {int(k) for k in cart.keys()}
+        in_cart_ids   = set(cart)
         return dict(total_items=total_items, in_cart_ids=in_cart_ids)
 
 
@@ -95,4 +113,68 @@ def create_app():
     with app.app_context():
         db.create_all()
 
+    # Full-text menu search (needs the tables above)
+    from app.utils.search import menu_search
+    menu_search.init_app(app)
+
+    # Dashboard rollups (incrementally maintained by model events)
+    from app.utils.stats import init_stats
+    init_stats(app)
+
+    # Email templates are compiled once per process
+    from app.utils.email_templates import email_templates
+    email_templates.init_app(app)
+
+    # Pub/sub bus for live order status (SSE)
+    from app.utils.events import event_bus
+    event_bus.init_app(app)
+
+    # Append-only order status log and its live tailer
+    from app.utils.status_log import status_log_tailer
+    status_log_tailer.init_app(app)
+    if app.config.get('EVENT_SOURCE') == 'log' and not app.testing:
+        status_log_tailer.start()
+
+    # Kitchen prep queue, kept current from the event bus
+    from app.utils.kitchen import kitchen_scheduler
+    kitchen_scheduler.init_app(app)
+    if app.config.get('KITCHEN_SCHEDULER') and not app.testing:
+        kitchen_scheduler.start()
+
+    # Delivery ETA lookups (tables learned from order status timestamps)
+    from app.utils.eta import eta_model
+    eta_model.init_app(app)
+
+    # Password hashing on a bounded pool
+    from app.utils.passwords import password_service
+    password_service.init_app(app)
+
+    # Token-bucket rate limits (see app.utils.ratelimit.rate_limit)
+    from app.utils.ratelimit import rate_limiter
+    rate_limiter.init_app(app)
+
+    # Coupon definitions are cached briefly per code
+    from app.utils.coupons import coupon_engine
+    coupon_engine.init_app(app)
+
+    # Background email delivery from the outbox table
+    from app.utils.outbox import outbox_worker
+    outbox_worker.init_app(app)
+    if app.config.get('EMAIL_OUTBOX_WORKERS') and not app.testing:
+        outbox_worker.start()
+
+    # Menu image variants (resized WebP/JPEG) and the menu_image() template helper
+    from app.utils.images import image_pipeline
+    image_pipeline.init_app(app)
+
+    # Pooled Paystack API client (timeouts, retries, circuit breaker)
+    from app.utils.paystack import paystack_client
+    paystack_client.init_app(app)
+
+    # Paystack webhook inbox
+    from app.utils.webhooks import webhook_worker
+    webhook_worker.init_app(app)
+    if app.config.get('PAYSTACK_WEBHOOK_WORKERS') and not app.testing:
+        webhook_worker.start()
+
     return app
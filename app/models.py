@@ -1,9 +1,10 @@
 from datetime import datetime
+from uuid import uuid4
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.passwords import password_service
 from app import db
-from sqlalchemy import event
+from sqlalchemy import event, inspect
 
 from sqlalchemy.dialects.postgresql import JSON
 
@@ -11,7 +12,7 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     phone = db.Column(db.String(20))
@@ -22,10 +23,17 @@ class User(UserMixin, db.Model):
     orders = db.relationship('Order', backref='customer', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_service.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """
+        True if ``password`` is right. A hash made with old parameters is
+        replaced; the caller commits it. Both may raise PasswordServiceBusy.
+        """
+        ok, new_hash = password_service.verify(self.password_hash, password)
+        if new_hash:
+            self.password_hash = new_hash
+        return ok
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -51,6 +59,11 @@ class MenuItem(db.Model):
     preparation_time = db.Column(db.Integer, default=15)  # in minutes
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_menu_item_available_id', 'is_available', 'id'),
+        db.Index('ix_menu_item_category_id_available', 'category_id', 'is_available'),
+    )
     
     order_items = db.relationship('OrderItem', backref='menu_item', lazy='dynamic')
     
@@ -71,7 +84,10 @@ class Order(db.Model):
     delivery_fee = db.Column(db.Float, default=0.0)
     
     total_amount = db.Column(db.Float, nullable=False, default=0.0)
-    status = db.Column(db.String(20), default='pending')
+    # active_history: the previous status is loaded even when it was expired
+    # (e.g. after a commit), so the flush listeners (stats, status log,
+    # events) always see old -> new
+    status = db.column_property(db.Column(db.String(20), default='pending'), active_history=True)
     payment_method = db.Column(db.String(50))
     delivery_address = db.Column(db.Text)
     phone_number = db.Column(db.String(20))
@@ -80,27 +96,58 @@ class Order(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     paystack_ref   = db.Column(db.String(40), unique=True, nullable=True)
     payment_status = db.Column(db.String(20), default='pending')
+    # First time the order reached each kitchen status (feeds app.utils.eta)
+    confirmed_at = db.Column(db.DateTime)
+    preparing_at = db.Column(db.DateTime)
+    delivered_at = db.Column(db.DateTime)
     
+    # Composite indexes for the order listings (keyset on created_at, id)
+    __table_args__ = (
+        db.Index('ix_order_created_at_id', 'created_at', 'id'),
+        db.Index('ix_order_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_order_customer_id_created_at_id', 'customer_id', 'created_at', 'id'),
+    )
+
     order_items = db.relationship('OrderItem', backref='order', lazy='dynamic', cascade='all, delete-orphan')
+    # Read-only list view of the same rows; unlike order_items it can be eager loaded
+    items = db.relationship('OrderItem', viewonly=True, order_by='OrderItem.id')
     # Relationship — FIX
     delivery_zone = db.relationship("DeliveryZone", backref="orders", lazy=True)
     
     
     def generate_order_number(self):
-        """Generate order number based on current date and order ID"""
+        """Generate order number from the current date and a random suffix.
+
+        It does not depend on the primary key, so it can be written with the
+        INSERT instead of a follow-up UPDATE.
+        """
         date_str = datetime.utcnow().strftime('%Y%m%d')
-        return f"LFD{date_str}{self.id:04d}"
-
-@event.listens_for(Order, 'after_insert')
-def receive_after_insert(mapper, connection, target):
-    """Automatically set order number after insert"""
-    order_table = Order.__table__
-    connection.execute(
-        order_table.update().
-        where(order_table.c.id == target.id).
-        values(order_number=target.generate_order_number())
-    )
-    
+        return f"LFD{date_str}{uuid4().hex[:9].upper()}"
+
+@event.listens_for(Order, 'before_insert')
+def receive_before_insert(mapper, connection, target):
+    """Automatically set order number before insert"""
+    if not target.order_number:
+        target.order_number = target.generate_order_number()
+    stamp_status(target)
+
+
+_STATUS_STAMPS = {'confirmed': 'confirmed_at', 'preparing': 'preparing_at', 'delivered': 'delivered_at'}
+
+
+def stamp_status(order):
+    """Record when the order first reached its current status."""
+    column = _STATUS_STAMPS.get(order.status)
+    if column and getattr(order, column) is None:
+        setattr(order, column, datetime.utcnow())
+
+
+@event.listens_for(Order, 'before_update')
+def receive_before_update(mapper, connection, target):
+    if inspect(target).attrs.status.history.has_changes():
+        stamp_status(target)
+
+
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -108,17 +155,145 @@ class OrderItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     unit_price = db.Column(db.Float, nullable=False)
     subtotal = db.Column(db.Float, nullable=False)
+
+    # Covering indexes: item counts per order, sales per menu item
+    __table_args__ = (
+        db.Index('ix_order_item_order_id', 'order_id', 'menu_item_id', 'quantity'),
+        db.Index('ix_order_item_menu_item_id', 'menu_item_id', 'order_id', 'quantity'),
+    )
     
     def __repr__(self):
         return f'<OrderItem {self.id}>'
     
     
 
+class CartItem(db.Model):
+    """Server-side cart line; the browser only holds the cart token."""
+    cart_token = db.Column(db.String(32), primary_key=True)
+    menu_item_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<CartItem {self.cart_token}:{self.menu_item_id} x{self.quantity}>'
+
+
+class EmailOutbox(db.Model):
+    """Outgoing email, written in the same transaction as the change it reports."""
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    text_body = db.Column(db.Text)  # plain text alternative of an HTML body
+    is_html = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(10), default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    locked_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status} to {self.recipient}>'
+
+
+class PaystackEvent(db.Model):
+    """Raw Paystack webhook event, stored on receipt and processed by app.utils.webhooks."""
+    id = db.Column(db.Integer, primary_key=True)
+    event_key = db.Column(db.String(128), unique=True, nullable=False)  # Paystack retries reuse it
+    event_type = db.Column(db.String(64), nullable=False)
+    reference = db.Column(db.String(100), index=True)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), default='pending')  # pending, processing, done, dead
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    locked_until = db.Column(db.DateTime)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    processed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_paystack_event_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<PaystackEvent {self.id} {self.event_type} {self.status}>'
+
+
+# --- Order status history (written by app.utils.status_log) ---
+class OrderStatusEvent(db.Model):
+    """
+    One row per status an order enters, appended in the same transaction as
+    the change. Never updated; the id doubles as a high-water mark for
+    consumers. order_id has no foreign key so history outlives deleted orders.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    old_status = db.Column(db.String(20))
+    at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_order_status_event_order_id_at', 'order_id', 'at'),
+        db.Index('ix_order_status_event_status_at', 'status', 'at'),
+    )
+
+    def __repr__(self):
+        return f'<OrderStatusEvent {self.id} order={self.order_id} {self.old_status}->{self.status}>'
+
+
+class ConsumerOffset(db.Model):
+    """Last OrderStatusEvent id a named consumer has applied."""
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# --- ETA lookup tables (rebuilt in batch by app.utils.eta) ---
+class EtaStat(db.Model):
+    """Learned minutes for one key: kind 'wait' (by hour), 'item' or 'zone'."""
+    kind = db.Column(db.String(10), primary_key=True)
+    key = db.Column(db.Integer, primary_key=True)
+    minutes = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+
+
+# --- Dashboard rollups (maintained by app.utils.stats) ---
+class StatCounter(db.Model):
+    """Named running total, e.g. 'orders', 'orders:pending', 'users'."""
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class OrderDailyStat(db.Model):
+    """Orders and revenue per day and status."""
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class MenuItemDailySales(db.Model):
+    """Order lines and quantity sold per day and menu item."""
+    day = db.Column(db.Date, primary_key=True)
+    menu_item_id = db.Column(db.Integer, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+
 class DeliveryZone(db.Model):
     id          = db.Column(db.Integer, primary_key=True)
     name        = db.Column(db.String(80), nullable=False, unique=True)   # GRA, Ugbowo …
     fee         = db.Column(db.Integer, nullable=False)                   # Naira
     eta         = db.Column(db.String(40), nullable=True)  # e.g., "20–30 mins"
+    aliases     = db.Column(db.Text, nullable=True)        # estates/streets, one per line or comma separated
     created_at  = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
@@ -167,6 +342,11 @@ class CouponUsage(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True)
     used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_coupon_usage_coupon_id_user_id', 'coupon_id', 'user_id'),
+        db.Index('ix_coupon_usage_order_id', 'order_id'),
+    )
     
     
 # class DeliveryArea(db.Model):
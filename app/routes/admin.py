@@ -1,13 +1,20 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response
 from flask_login import login_required, current_user
-from app.models import MenuItem, Category, Order, User, Coupon, DeliveryZone
+from app.models import MenuItem, Category, Order, OrderItem, User, Coupon, DeliveryZone
 from app import db
-import os
-from werkzeug.utils import secure_filename
+from functools import partial
 from flask import current_app
 from app.utils.email import send_order_status_update_email
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils import stats
+from app.utils.db_metrics import db_metrics
+from app.utils.images import image_pipeline, set_menu_item_image
+from app.utils import events
+from app.utils.events import event_bus, KITCHEN_CHANNEL
+from app.utils.kitchen import kitchen_scheduler, publish_rush, task_dict
+from app.utils import status_log
+from app.utils.passwords import PasswordServiceBusy
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 
 
 
@@ -51,7 +58,12 @@ def edit_user(user_id):
         # Optional password change
         new_password = request.form.get('password')
         if new_password:
-            user.password_hash = generate_password_hash(new_password)
+            try:
+                user.set_password(new_password)
+            except PasswordServiceBusy:
+                # Nothing committed; show the form again with the admin's edits
+                flash("The server is busy hashing passwords. Please try saving again in a few seconds.", "warning")
+                return render_template('admin/edit_user.html', user=user), 503, {'Retry-After': '5'}
 
         db.session.commit()
         flash("User updated successfully!", "success")
@@ -86,14 +98,66 @@ def delete_user(user_id):
 
 
 
+@bp.route('/orders/events')
+def orders_events():
+    """Server-Sent Events for the kitchen view: new orders and status changes."""
+    db.session.close()
+    subscription = event_bus.subscribe(KITCHEN_CHANNEL)
+    frames = events.stream(
+        subscription,
+        keepalive=current_app.config.get('SSE_KEEPALIVE', 15),
+        max_duration=current_app.config.get('SSE_MAX_DURATION', 300),
+    )
+    return Response(frames, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@bp.route('/kitchen')
+def kitchen():
+    """Kitchen display: prep tasks of confirmed orders, most urgent first."""
+    return render_template('admin/kitchen.html', board=kitchen_scheduler.board(),
+                           now=datetime.utcnow())
+
+
+@bp.route('/kitchen/next')
+def kitchen_next():
+    """What to cook next, overall and per station (read from the scheduler's heaps)."""
+    board = kitchen_scheduler.board(limit=request.args.get('limit', 20, type=int))
+    return jsonify({
+        'next': board['next'] and task_dict(board['next']),
+        'stations': {station: task_dict(task) for station, task in board['stations'].items()},
+        'upcoming': [task_dict(task) for task in board['upcoming']],
+        'queued': board['queued'],
+    })
+
+
+@bp.route('/kitchen/orders/<int:order_id>/rush', methods=['POST'])
+def kitchen_rush(order_id):
+    minutes = request.form.get('minutes', 10, type=int)
+    publish_rush(order_id, minutes)
+    flash(f'Order moved {minutes} minutes up the kitchen queue.', 'success')
+    return redirect(url_for('admin.kitchen'))
+
+
+@bp.route('/metrics/db')
+def db_metrics_view():
+    """Pool and per-endpoint SQL statistics for this worker process."""
+    if request.args.get('reset'):
+        db_metrics.reset()
+    return jsonify(db_metrics.snapshot())
+
+
 @bp.route('/dashboard')
 def dashboard():
-    total_orders = Order.query.count()
-    pending_orders = Order.query.filter_by(status='pending').count()
-    total_users = User.query.count()
-    total_items = MenuItem.query.count()
+    # Served from the rollup counters instead of COUNT(*) scans
+    counts = stats.counters()
+    total_orders = counts.get('orders', 0)
+    pending_orders = counts.get('orders:pending', 0)
+    total_users = counts.get('users', 0)
+    total_items = counts.get('menu_items', 0)
     
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+    recent_orders = Order.query.options(joinedload(Order.customer))\
+        .order_by(Order.created_at.desc()).limit(10).all()
     
     return render_template('admin/dashboard.html', 
                          total_orders=total_orders,
@@ -118,28 +182,26 @@ def add_menu_item():
     category_id = int(request.form.get('category_id'))
     preparation_time = int(request.form.get('preparation_time', 15))
 
-    # --- IMAGE UPLOAD HANDLING ---
-    image = request.files.get('image')
-    image_filename = None
-
-    if image and image.filename != "":
-        filename = secure_filename(image.filename)
-        image_path = os.path.join(current_app.root_path, 'static/images/menu', filename)
-        image.save(image_path)
-        image_filename = filename
-
     item = MenuItem(
         name=name,
         description=description,
         price=price,
         category_id=category_id,
         preparation_time=preparation_time,
-        image_url=image_filename
     )
 
     db.session.add(item)
     db.session.commit()
 
+    # --- IMAGE UPLOAD HANDLING ---
+    # Variants are built in the background; image_url is set when they are ready
+    image = request.files.get('image')
+    if image and image.filename != "":
+        try:
+            image_pipeline.submit(image, on_done=partial(set_menu_item_image, item.id))
+        except ValueError as e:
+            flash(f'Image not saved: {e}', 'warning')
+
     flash('Menu item added successfully!', 'success')
     return redirect(url_for('admin.menu_management'))
 
@@ -174,14 +236,15 @@ def edit_menu_item(item_id):
     # --- CHECK IF NEW IMAGE WAS UPLOADED ---
     new_image = request.files.get('image')
 
-    if new_image and new_image.filename != "":
-        filename = secure_filename(new_image.filename)
-        image_path = os.path.join(current_app.root_path, 'static/images/menu', filename)
-        new_image.save(image_path)
-        item.image_url = filename
-
     db.session.commit()
 
+    # The current image stays until the new variants are ready
+    if new_image and new_image.filename != "":
+        try:
+            image_pipeline.submit(new_image, on_done=partial(set_menu_item_image, item.id))
+        except ValueError as e:
+            flash(f'Image not saved: {e}', 'warning')
+
     flash('Menu item updated successfully!', 'success')
     return redirect(url_for('admin.menu_management'))
 
@@ -200,7 +263,10 @@ def orders():
     date_from = request.args.get('date_from')
     date_to = request.args.get('date_to')
     
-    query = Order.query
+    cursor = request.args.get('cursor')
+    page_size = current_app.config.get('ADMIN_ORDERS_PAGE_SIZE', 50)
+
+    query = Order.query.options(joinedload(Order.customer))
     
     if status:
         query = query.filter_by(status=status)
@@ -210,9 +276,37 @@ def orders():
     
     if date_to:
         query = query.filter(Order.created_at <= date_to)
-    
-    orders = query.order_by(Order.created_at.desc()).all()
-    return render_template('admin/orders.html', orders=orders)
+
+    # Keyset pagination on (created_at, id): the cursor is the last row shown
+    if cursor:
+        try:
+            cursor_at, cursor_id = cursor.rsplit('_', 1)
+            cursor_at, cursor_id = datetime.fromisoformat(cursor_at), int(cursor_id)
+        except ValueError:
+            flash('Invalid page cursor.', 'warning')
+            return redirect(url_for('admin.orders', status=status, date_from=date_from, date_to=date_to))
+        query = query.filter(db.tuple_(Order.created_at, Order.id) < (cursor_at, cursor_id))
+
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        last = orders[-1]
+        next_cursor = f'{last.created_at.isoformat()}_{last.id}'
+
+    # One grouped query for the item counts of the whole page
+    item_counts = {}
+    if orders:
+        item_counts = dict(
+            db.session.query(OrderItem.order_id, db.func.count(OrderItem.id))
+            .filter(OrderItem.order_id.in_([o.id for o in orders]))
+            .group_by(OrderItem.order_id)
+            .all()
+        )
+
+    return render_template('admin/orders.html', orders=orders, item_counts=item_counts,
+                           next_cursor=next_cursor, cursor=cursor)
 
 
 # @bp.route('/update_order_status/<int:order_id>', methods=['POST'])
@@ -243,6 +337,10 @@ def update_order_status(order_id):
         return redirect(url_for('admin.orders'))
 
     order.status = new_status
+
+    # Queue the notification email in the same transaction
+    email_queued = send_order_status_update_email(order, old_status, new_status)
+
     try:
         db.session.commit()
     except:
@@ -250,13 +348,10 @@ def update_order_status(order_id):
         flash('Failed to update order status.', 'danger')
         return redirect(url_for('admin.orders'))
 
-    # Now send the notification email
-    email_sent = send_order_status_update_email(order, old_status, new_status)
-
-    if email_sent:
-        flash(f'Order {order.order_number} status updated and customer notified.', 'success')
+    if email_queued:
+        flash(f'Order {order.order_number} status updated and customer notification queued.', 'success')
     else:
-        flash(f'Order updated but failed to send notification email.', 'warning')
+        flash(f'Order updated but failed to queue notification email.', 'warning')
 
     return redirect(url_for('admin.orders'))
 
@@ -299,7 +394,20 @@ def order_items_modal(order_id):
 @login_required
 def order_details_modal(order_id):
     order = Order.query.get_or_404(order_id)
-    return render_template("admin/modals/order_details_modal.html", order=order)
+    return render_template("admin/modals/order_details_modal.html", order=order,
+                           history=status_log.order_history(order_id))
+
+
+@bp.route('/orders/<int:order_id>/history')
+@login_required
+def order_history(order_id):
+    """Status timeline of an order from the status log (kept after the order is deleted)."""
+    return jsonify([{
+        'id': e.id,
+        'status': e.status,
+        'old_status': e.old_status,
+        'at': e.at.isoformat(),
+    } for e in status_log.order_history(order_id)])
 
 
 
@@ -18,10 +18,11 @@ def add():
         name = request.form.get('name').strip()
         fee  = int(request.form.get('fee'))
         eta = request.form.get("eta", "").strip()
+        aliases = request.form.get("aliases", "").strip()
         if DeliveryZone.query.filter_by(name=name).first():
             flash('Zone already exists', 'warning')
             return redirect(url_for('admin_delivery.add'))
-        db.session.add(DeliveryZone(name=name, fee=fee, eta=eta))
+        db.session.add(DeliveryZone(name=name, fee=fee, eta=eta, aliases=aliases))
         db.session.commit()
         flash('Zone added', 'success')
         return redirect(url_for('admin_delivery.index'))
@@ -38,6 +39,7 @@ def edit(zone_id):
         zone.name = request.form.get('name').strip()
         zone.fee  = int(request.form.get('fee'))
         zone.eta = request.form.get("eta", "").strip()
+        zone.aliases = request.form.get("aliases", "").strip()
         db.session.commit()
         flash('Zone updated', 'success')
         return redirect(url_for('admin_delivery.index'))
@@ -4,10 +4,27 @@ from flask_login import login_user, logout_user, login_required, current_user
 from urllib.parse import urlparse
 from app.models import User
 from app import db
+from app.utils.ratelimit import rate_limit
+from app.utils.passwords import PasswordServiceBusy, password_service
 
 bp = Blueprint('auth', __name__)
 
+
+def _login_username():
+    username = (request.form.get('username') or '').strip().lower()
+    return username and f'name:{username}'
+
+
+def _busy(template):
+    """Shed a sign-in while the password pool is full, instead of queueing it."""
+    flash('We are handling a lot of sign-ins right now. Please try again in a few seconds.', 'warning')
+    return render_template(template), 503, {'Retry-After': '5'}
+
+
+# Password checks are deliberately slow; throttle guessing per client and per account
 @bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('20/minute', key='ip', methods=['POST'])
+@rate_limit('5/minute', key=_login_username, burst=10, methods=['POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
@@ -19,10 +36,21 @@ def login():
 
         user = User.query.filter_by(username=username).first()
 
-        if user is None or not user.check_password(password):
+        try:
+            if user is None:
+                password_service.verify(None, password)     # same time as a wrong password
+                valid = False
+            else:
+                valid = user.check_password(password)
+        except PasswordServiceBusy:
+            return _busy('login.html')
+
+        if not valid:
             flash('Invalid username or password', 'danger')
             return redirect(url_for('auth.login'))
 
+        if db.session.is_modified(user):
+            db.session.commit()     # password hash upgraded to the current parameters
         login_user(user, remember=remember_me)
         next_page = request.args.get('next')
         # if not next_page or url_parse(next_page).netloc != '':
@@ -62,7 +90,10 @@ def register():
             last_name=last_name,
             phone=phone
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordServiceBusy:
+            return _busy('register.html')
 
         db.session.add(user)
         db.session.commit()
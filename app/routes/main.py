@@ -35,14 +35,15 @@ from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
 from app.models import MenuItem, Category, Order
 from app import db
+from app.utils.catalog import catalog_cache
 
 bp = Blueprint('main', __name__)
 
 @bp.route('/')
 def index():
-    featured_items = MenuItem.query.filter_by(is_available=True).limit(6).all()
-    categories = Category.query.all()
-    return render_template('index.html', featured_items=featured_items, categories=categories)
+    catalog = catalog_cache.get()
+    featured_items = catalog.items[:6]
+    return render_template('index.html', featured_items=featured_items, categories=catalog.categories)
 
 @bp.route('/about')
 def about():
@@ -1,28 +1,45 @@
 from flask import Blueprint, render_template, request, jsonify, flash
 from app.models import MenuItem, Category
 from app import db
+from app.utils.catalog import catalog_cache
+from app.utils.search import menu_search
+from app.utils.ratelimit import rate_limit
 
 bp = Blueprint('menu', __name__)
 
 @bp.route('/')
 def menu():
-    category_id = request.args.get('category')
+    category_id = request.args.get('category', type=int)
     search_query = request.args.get('search')
-    
-    query = MenuItem.query.filter_by(is_available=True)
-    
-    if category_id:
-        query = query.filter_by(category_id=category_id)
-    
+
+    catalog = catalog_cache.get()
+    items = catalog.items
+
     if search_query:
-        query = query.filter(MenuItem.name.contains(search_query))
-    
-    items = query.all()
-    categories = Category.query.all()
-    
-    return render_template('menu.html', items=items, categories=categories)
+        ids = menu_search.search(search_query, category_id=category_id)
+        items = [catalog.items_by_id[i] for i in ids if i in catalog.items_by_id]
+    elif category_id:
+        items = catalog.items_in_category(category_id)
+
+    return render_template('menu.html', items=items, categories=catalog.categories)
 
 @bp.route('/item/<int:item_id>')
 def item_detail(item_id):
     item = MenuItem.query.get_or_404(item_id)
-    return render_template('item_detail.html', item=item)
\ No newline at end of file
+    return render_template('item_detail.html', item=item)
+
+@bp.route('/search_suggestions')
+@rate_limit('120/minute', key='ip', burst=30)
+def search_suggestions():
+    query = request.args.get('q', '')
+    if len(query) < 2:
+        return jsonify([])
+    
+    suggestions = menu_search.suggest(query, limit=5)
+    
+    return jsonify([{
+        'id': item.id,
+        'name': item.name,
+        'price': item.price,
+        'image_url': item.image_url
+    } for item in suggestions])
@@ -1,16 +1,23 @@
 # order.py
 import time
-from uuid import uuid4
-from flask import Blueprint, render_template, request, flash, redirect, url_for, session, current_app, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, jsonify, abort, Response
 from flask_login import login_required, current_user
-from app.models import Order, OrderItem, MenuItem, DeliveryZone, Coupon, CouponUsage
+from app.models import Order, OrderItem, MenuItem, CouponUsage
 from app.models import db
-from datetime import datetime, timedelta
+from sqlalchemy.orm import selectinload
+from datetime import datetime
 from app.utils.email import send_order_confirmation_email, send_order_status_update_email
-from app.utils.paystack import init_payment  # your wrapper to create checkout
-from paystackapi.transaction import Transaction
-import hmac, hashlib
-from app.utils.delivery import get_delivery_fee
+from app.utils.paystack import init_payment, paystack_client, GatewayError, GatewayUnavailable
+from app.utils.delivery import get_delivery_quote, resolve_zone, DEFAULT_DELIVERY_FEE, DEFAULT_ETA
+from app.utils.catalog import catalog_cache
+from app.utils.eta import eta_model
+from app.utils.coupons import coupon_engine, reserve_coupon
+from app.utils.webhooks import confirm_payment, store_event, valid_signature
+from app.utils import cart as server_cart
+from app.utils import stats
+from app.utils import events
+from app.utils.events import event_bus, order_channel, order_payload
+from app.utils.ratelimit import rate_limit
 
 bp = Blueprint('orders', __name__)
 
@@ -18,27 +25,21 @@ bp = Blueprint('orders', __name__)
 @bp.route('/cart')
 @login_required
 def cart():
-    return render_template('cart.html')
+    return render_template('cart.html', cart_items=server_cart.cart_lines())
 
 
 @bp.route('/add_to_cart', methods=['POST'])
 @login_required
+@rate_limit('60/minute', key='user')
 def add_to_cart():
-    item_id = request.form.get('item_id')
+    item_id = request.form.get('item_id', type=int)
     quantity = int(request.form.get('quantity', 1))
-    item = MenuItem.query.get_or_404(item_id)
+    item = catalog_cache.get().items_by_id.get(item_id)
+    if item is None:
+        abort(404)
 
-    cart = session.get('cart', {})
-    if str(item_id) in cart:
-        cart[str(item_id)]['quantity'] += quantity
-    else:
-        cart[str(item_id)] = {
-            'name': item.name,
-            'price': float(item.price),
-            'quantity': quantity
-        }
-    session['cart'] = cart
-    cart_count = sum(i['quantity'] for i in cart.values())
+    server_cart.add_item(item.id, quantity)
+    cart_count = server_cart.cart_count()
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'success': True, 'message': f'{item.name} added', 'cart_count': cart_count}), 200
@@ -50,16 +51,10 @@ def add_to_cart():
 @bp.route('/update_cart', methods=['POST'])
 @login_required
 def update_cart():
-    item_id = request.form.get('item_id')
+    item_id = request.form.get('item_id', type=int)
     quantity = int(request.form.get('quantity', 1))
-    if 'cart' not in session:
-        session['cart'] = {}
-    cart = session['cart']
-    if quantity > 0:
-        cart[item_id]['quantity'] = quantity
-    else:
-        cart.pop(item_id, None)
-    session['cart'] = cart
+    if item_id in server_cart.get_cart():
+        server_cart.set_quantity(item_id, quantity)
     flash('Cart updated!', 'success')
     return redirect(url_for('orders.cart'))
 
@@ -67,10 +62,9 @@ def update_cart():
 @bp.route('/remove_from_cart', methods=['POST'])
 @login_required
 def remove_from_cart():
-    item_id = request.form.get('item_id')
-    if 'cart' in session:
-        session['cart'].pop(item_id, None)
-        session['cart'] = session['cart']
+    item_id = request.form.get('item_id', type=int)
+    if item_id is not None:
+        server_cart.remove_item(item_id)
     flash('Item removed from cart!', 'success')
     return redirect(url_for('orders.cart'))
 
@@ -80,123 +74,129 @@ def apply_coupon(code, subtotal, delivery_zone_id=None, user=None):
     """
     Return (discount_amount, message, coupon)
     """
-    if not code:
-        return 0.0, "No coupon provided", None
-
-    code = code.strip().upper()
-    coupon = Coupon.query.filter_by(code=code).first()
-    now = datetime.utcnow()
-
-    if not coupon:
-        return 0.0, "Invalid coupon code", None
-
-    if not coupon.is_active:
-        return 0.0, "This coupon is inactive", coupon
-
-    if coupon.starts_at and now < coupon.starts_at:
-        return 0.0, f"This coupon is not active until {coupon.starts_at}", coupon
+    check = coupon_engine.evaluate(code, subtotal, delivery_zone_id, user)
+    return check.discount, check.message, check.coupon
 
-    if coupon.expires_at and now > coupon.expires_at:
-        return 0.0, "This coupon has expired", coupon
 
-    if coupon.min_subtotal and subtotal < coupon.min_subtotal:
-        return 0.0, f"Order must be at least ₦{coupon.min_subtotal:.2f} to use this coupon", coupon
-
-    if coupon.max_uses is not None and coupon.uses_count >= coupon.max_uses:
-        return 0.0, "This coupon has reached its maximum number of uses", coupon
+def _zone_id(value):
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
 
-    if coupon.zones:
-        allowed_zone_ids = [z.id for z in coupon.zones]
-        if delivery_zone_id not in allowed_zone_ids:
-            return 0.0, "Coupon not valid for this delivery area", coupon
 
-    if user and coupon.max_uses_per_user is not None:
-        used_count = CouponUsage.query.filter_by(coupon_id=coupon.id, user_id=user.id).count()
-        if used_count >= coupon.max_uses_per_user:
-            return 0.0, "You have already used this coupon the maximum allowed times", coupon
+# One bucket for single and batch checks; every code checked takes a token,
+# so batches cannot be used to guess codes faster
+MAX_COUPON_BATCH = 10
 
-    if coupon.coupon_type == 'percent':
-        discount = subtotal * (coupon.amount / 100.0)
-    else:
-        discount = float(coupon.amount)
 
-    discount = min(discount, subtotal)
-    message = f"{int(coupon.amount)}% off" if coupon.coupon_type == 'percent' else f"₦{coupon.amount:.2f} off"
-    return discount, message, coupon
+def _codes_in_request():
+    data = request.get_json(silent=True) or {}
+    codes = data.get("codes")
+    return min(len(codes), MAX_COUPON_BATCH) if isinstance(codes, list) else 1
 
 
 @bp.route('/apply-coupon', methods=['POST'])
 @login_required
+@rate_limit('30/minute', key='ip', scope='coupon-check')
+@rate_limit('10/minute', key='user', scope='coupon-check')
 def apply_coupon_api():
     data = request.get_json()
     code = data.get("code", "").strip()
     subtotal = float(data.get("subtotal", 0))
-    delivery_zone_id = data.get("delivery_zone_id")  # may be None
-    if delivery_zone_id:
-        try:
-            delivery_zone_id = int(delivery_zone_id)
-        except Exception:
-            delivery_zone_id = None
+    delivery_zone_id = _zone_id(data.get("delivery_zone_id"))  # may be None
+
+    check = coupon_engine.evaluate(code, subtotal, delivery_zone_id, current_user)
+    return jsonify({"valid": check.valid, "discount": check.discount,
+                    "message": check.message, "reason": check.reason})
+
 
-    discount, message, coupon = apply_coupon(code, subtotal, delivery_zone_id, current_user)
-    return jsonify({"valid": discount > 0, "discount": discount, "message": message})
+@bp.route('/coupons/validate', methods=['POST'])
+@login_required
+@rate_limit('30/minute', key='ip', scope='coupon-check', cost=_codes_in_request)
+@rate_limit('10/minute', key='user', scope='coupon-check', cost=_codes_in_request)
+def validate_coupons_api():
+    """Batch check for promo pages: {"codes": [...], "subtotal": .., "delivery_zone_id": ..}."""
+    data = request.get_json(silent=True) or {}
+    codes = data.get("codes") or []
+    if not isinstance(codes, list) or len(codes) > MAX_COUPON_BATCH:
+        return jsonify({"error": f"codes must be a list of at most {MAX_COUPON_BATCH} codes"}), 400
+    subtotal = float(data.get("subtotal", 0))
+    delivery_zone_id = _zone_id(data.get("delivery_zone_id"))
+
+    results = coupon_engine.evaluate_many(codes, subtotal, delivery_zone_id, current_user)
+    return jsonify({"results": [check.as_dict() for check in results.values()]})
 
 
 # --- helpers ---
 def get_estimated_time(zone_identifier):
     if not zone_identifier:
-        return "30–50 mins"
+        return DEFAULT_ETA
     try:
-        zone_id = int(zone_identifier)
-        zone = DeliveryZone.query.get(zone_id)
-    except Exception:
-        zone_name = str(zone_identifier).lower()
-        zone = DeliveryZone.query.filter(DeliveryZone.name.ilike(f"%{zone_name}%")).first()
+        zone = catalog_cache.get().zones_by_id.get(int(zone_identifier))
+    except (TypeError, ValueError):
+        zone = resolve_zone(str(zone_identifier))
 
     if zone and zone.eta:
         return zone.eta
-
-    name = (zone.name.lower() if zone else "")
-    DEFAULTS = {
-        "gra": "20–30 mins",
-        "ugbowo": "25–40 mins",
-        "use": "15–25 mins",
-    }
-    for key, t in DEFAULTS.items():
-        if key in name:
-            return t
-    return "30–50 mins"
+    return f"about {eta_model.zone_minutes(zone.id if zone else None)} mins"
 
 
 # ---------- CREATE ORDER (do NOT clear cart here) ----------
 @bp.route('/checkout/create', methods=['POST'])
 @login_required
 def create_order():
-    cart = session.get("cart", {})
-    if not cart:
+    quantities = server_cart.get_cart()
+    if not quantities:
         flash("Your cart is empty", "warning")
         return redirect(url_for("menu.menu"))
 
-    subtotal = sum(d["price"] * d["quantity"] for d in cart.values())
-
-    delivery_zone_id = request.form.get("delivery_zone")
-    delivery_zone = DeliveryZone.query.get(int(delivery_zone_id)) if delivery_zone_id else None
-    delivery_fee = delivery_zone.fee if delivery_zone else get_delivery_fee(request.form.get('delivery_address', ''))
+    # Resolve every cart line in one query and price it from the database
+    menu_items = MenuItem.query.filter(MenuItem.id.in_(quantities.keys())).all()
+    unavailable = [m for m in menu_items if not m.is_available]
+    menu_items = [m for m in menu_items if m.is_available]
+    if not menu_items:
+        flash("The items in your cart are no longer available", "warning")
+        return redirect(url_for("menu.menu"))
+    if unavailable:
+        # Let the customer see the new total before ordering without them
+        for m in unavailable:
+            server_cart.remove_item(m.id)
+        flash("No longer available and removed from your cart: "
+              + ", ".join(m.name for m in unavailable), "warning")
+        return redirect(url_for("orders.cart"))
+
+    lines = [(m, quantities[m.id]) for m in menu_items]
+    subtotal = sum(m.price * qty for m, qty in lines)
+
+    # Zones come from the catalog cache; without an explicit choice the
+    # address is matched against zone names and aliases
+    delivery_zone_id = request.form.get("delivery_zone", type=int)
+    if delivery_zone_id:
+        delivery_zone = catalog_cache.get().zones_by_id.get(delivery_zone_id)
+        delivery_fee = delivery_zone.fee if delivery_zone else DEFAULT_DELIVERY_FEE
+    else:
+        delivery_fee, _, delivery_zone = get_delivery_quote(request.form.get('delivery_address', ''))
 
     coupon_code = request.form.get("coupon_code", "").strip()
     discount = 0
     applied_coupon = None
     if coupon_code:
-        discount, msg, applied_coupon = apply_coupon(coupon_code, subtotal, int(delivery_zone_id) if delivery_zone_id else None, current_user)
-        if discount <= 0:
-            flash(msg, "warning")
+        check = coupon_engine.evaluate(coupon_code, subtotal, delivery_zone.id if delivery_zone else None, current_user)
+        if not (check.valid and check.discount > 0):
+            flash(check.message, "warning")
+        elif reserve_coupon(check.coupon.id):
+            discount, applied_coupon = check.discount, check.coupon
+        else:
+            # Someone else took the last use since the check
+            coupon_engine.forget(check.code)
+            flash("This coupon has reached its maximum number of uses", "warning")
 
     tax = subtotal * 0.075
     total = subtotal + delivery_fee + tax - discount
     total = max(total, 0)
 
     order = Order(
-        order_number=f"LFD{uuid4().hex[:10].upper()}",
         customer_id=current_user.id,
         subtotal_amount=subtotal,
         discount_amount=discount,
@@ -215,30 +215,31 @@ def create_order():
     db.session.add(order)
     db.session.flush()
 
-    for item_id, d in cart.items():
-        menu_item = MenuItem.query.get(int(item_id))
-        if not menu_item:
-            continue
-        oi = OrderItem(
-            order_id=order.id,
-            menu_item_id=menu_item.id,
-            quantity=d["quantity"],
-            unit_price=d["price"],
-            subtotal=d["quantity"] * d["price"]
-        )
-        db.session.add(oi)
+    db.session.execute(db.insert(OrderItem), [
+        {
+            "order_id": order.id,
+            "menu_item_id": menu_item.id,
+            "quantity": qty,
+            "unit_price": menu_item.price,
+            "subtotal": qty * menu_item.price,
+        }
+        for menu_item, qty in lines
+    ])
+    # executemany bypasses mapper events, so feed the sales rollup directly
+    stats.record_item_sales(db.session.connection(), order.created_at.date(),
+                            [(menu_item.id, qty) for menu_item, qty in lines])
 
     if applied_coupon:
-        applied_coupon.uses_count = (applied_coupon.uses_count or 0) + 1
+        # uses_count was already taken by reserve_coupon()
         db.session.add(CouponUsage(coupon_id=applied_coupon.id, user_id=current_user.id, order_id=order.id))
 
-    db.session.commit()
-    
-    # EMAIL
+    # EMAIL (queued in the outbox, committed with the order)
     try:
         send_order_confirmation_email(order)
     except Exception as e:
-        current_app.logger.error(f"Failed to send order confirmation email: {e}")
+        current_app.logger.error(f"Failed to queue order confirmation email: {e}")
+
+    db.session.commit()
 
     # DO NOT clear the cart here — wait until payment confirmed (webhook/callback or COD confirmation)
     flash("Order created – choose payment method", "info")
@@ -252,7 +253,7 @@ def checkout():
     order_id = request.args.get("order_id", type=int)
     order = Order.query.get(order_id) if order_id else None
 
-    zones = DeliveryZone.query.order_by(DeliveryZone.name).all()
+    zones = catalog_cache.get().zones
 
     if order:
         items = order.order_items.all()   # dynamic relationship needs .all()
@@ -260,13 +261,12 @@ def checkout():
         subtotal = order.subtotal_amount
         discount = order.discount_amount
     else:
-        cart = session.get("cart", {})
-        items = list(cart.items())
-        subtotal = sum(d["price"] * d["quantity"] for d in cart.values())
+        items = list(server_cart.cart_lines().items())
+        subtotal = sum(line.price * line.quantity for _, line in items)
         discount = 0
         delivery_fee = 0
 
-    estimated_time = order.delivery_zone.eta if order and order.delivery_zone else None
+    estimated_time = f"about {eta_model.remaining_minutes(order)} mins" if order else None
 
     return render_template(
         "checkout.html",
@@ -322,23 +322,25 @@ def paystack_callback():
         flash('No reference returned', 'warning')
         return redirect(url_for('orders.my_orders'))
 
-    resp = Transaction.verify(reference=ref)
-    if resp['status'] and resp['data']['status'] == 'success':
-        order = Order.query.filter_by(paystack_ref=ref).first_or_404()
-        old_status = order.status
-        order.status = 'confirmed'
-        order.payment_status = 'paid'
-        order.payment_method = 'paystack'
-        order.updated_at = datetime.utcnow()
+    try:
+        data = paystack_client.verify(ref)
+    except GatewayUnavailable:
+        # The webhook confirms the order once Paystack reports the charge
+        flash('We could not confirm your payment yet. Your order will update '
+              'automatically once Paystack confirms it.', 'info')
+        return redirect(url_for('orders.my_orders'))
+    except GatewayError:
+        data = {}
+
+    if data.get('status') == 'success':
+        # The webhook may already have confirmed it; confirm_payment is idempotent
+        order, _ = confirm_payment(ref)
+        if order is None:
+            abort(404)
         db.session.commit()
 
         # Clear cart only after payment confirmed
-        session.pop('cart', None)
-
-        try:
-            send_order_status_update_email(order, old_status, 'confirmed')
-        except Exception as e:
-            current_app.logger.error(f"Status email failed: {e}")
+        server_cart.clear_cart()
 
         flash('Payment successful! Your order is confirmed.', 'success')
         return redirect(url_for('orders.order_confirmation', order_id=order.id))
@@ -347,33 +349,19 @@ def paystack_callback():
     return redirect(url_for('orders.my_orders'))
 
 
-# Paystack webhook (server-to-server)
+# Paystack webhook (server-to-server): store and acknowledge at once, the
+# inbox worker applies it. Paystack retries slow or failed deliveries.
 @bp.route('/pay/webhook', methods=['POST'])
 def paystack_webhook():
-    sig = request.headers.get('x-paystack-signature')
-    computed_sig = hmac.new(current_app.config['PAYSTACK_SECRET_KEY'].encode(), request.data, hashlib.sha512).hexdigest()
-    if computed_sig != sig:
+    if not valid_signature(current_app.config['PAYSTACK_SECRET_KEY'], request.get_data(),
+                           request.headers.get('x-paystack-signature')):
         return 'invalid signature', 400
 
-    event = request.get_json()
-    if event.get('event') == 'charge.success':
-        ref = event['data']['reference']
-        order = Order.query.filter_by(paystack_ref=ref).first()
-        if order and order.payment_status != 'paid':
-            old_status = order.status
-            order.payment_status = 'paid'
-            order.payment_method = 'paystack'
-            order.status = 'confirmed'
-            order.updated_at = datetime.utcnow()
-            db.session.commit()
-
-            # Optionally clear cart for server-side validation if you store cart server-side,
-            # but don't clear client session here (webhook cannot access client session).
-            try:
-                send_order_status_update_email(order, old_status, 'confirmed')
-            except Exception as e:
-                current_app.logger.error(f"Webhook email error: {e}")
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return 'invalid payload', 400
 
+    store_event(payload, request.get_data())   # False for a retried delivery: still 200
     return 'ok', 200
 
 
@@ -389,16 +377,17 @@ def confirm_cash_order(order_id):
     order.status = 'confirmed'
     order.payment_status = 'pending'
     order.updated_at = datetime.utcnow()
-    db.session.commit()
 
-    # Clear cart after confirming cash order
-    session.pop('cart', None)
-    
     # EMAIL
     try:
         send_order_confirmation_email(order)
     except Exception as e:
-        current_app.logger.error(f"Failed to send order confirmation email: {e}")
+        current_app.logger.error(f"Failed to queue order confirmation email: {e}")
+
+    db.session.commit()
+
+    # Clear cart after confirming cash order
+    server_cart.clear_cart()
 
     flash('Order placed – pay cash on delivery!', 'success')
     return redirect(url_for('orders.order_confirmation', order_id=order.id))
@@ -418,7 +407,7 @@ def order_confirmation(order_id):
         return redirect(url_for('main.index'))
 
     # Compute expected delivery time
-    estimated_delivery = order.created_at + timedelta(minutes=30)
+    estimated_delivery = eta_model.estimated_delivery(order)
 
     return render_template(
         'order_confirmation.html',
@@ -430,14 +419,36 @@ def order_confirmation(order_id):
 @bp.route('/my_orders')
 @login_required
 def my_orders():
-    orders = Order.query.filter_by(customer_id=current_user.id).order_by(Order.created_at.desc()).all()
-    return render_template('my_orders.html', orders=orders)
+    cursor = request.args.get('cursor')
+    page_size = current_app.config.get('MY_ORDERS_PAGE_SIZE', 20)
+
+    # Three queries per page: orders, their items, the items' menu names
+    query = Order.query.filter_by(customer_id=current_user.id).options(
+        selectinload(Order.items).selectinload(OrderItem.menu_item).load_only(MenuItem.name)
+    )
+
+    # Keyset pagination on (created_at, id): the cursor is the last row shown
+    if cursor:
+        try:
+            cursor_at, cursor_id = cursor.rsplit('_', 1)
+            cursor_at, cursor_id = datetime.fromisoformat(cursor_at), int(cursor_id)
+        except ValueError:
+            return redirect(url_for('orders.my_orders'))
+        query = query.filter(db.tuple_(Order.created_at, Order.id) < (cursor_at, cursor_id))
+
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        last = orders[-1]
+        next_cursor = f'{last.created_at.isoformat()}_{last.id}'
+
+    return render_template('my_orders.html', orders=orders, next_cursor=next_cursor, cursor=cursor)
 
 @bp.route('/cart_count')
 def cart_count():
-    if 'cart' not in session:
-        return {'count': 0}
-    return {'count': sum(item['quantity'] for item in session['cart'].values())}
+    return {'count': server_cart.cart_count()}
 
 
 @bp.route('/track_order/<order_number>')
@@ -460,11 +471,38 @@ def track_order(order_number):
         'track_order.html',
         order=order,
         status_order=status_order,
-        current_index=current_index
+        current_index=current_index,
+        estimated_delivery=eta_model.estimated_delivery(order)
     )
 
 
 
+@bp.route('/track_order/<order_number>/events')
+def track_order_events(order_number):
+    """Server-Sent Events: the current status, then every change."""
+    # Subscribe before reading the current status so no change falls in between
+    # (one that lands in between is also sent as an event; the page just redraws)
+    subscription = event_bus.subscribe(order_channel(order_number))
+    try:
+        order = Order.query.filter_by(order_number=order_number).first_or_404()
+        first = {'event': 'status', 'data': order_payload(order)}
+    except BaseException:
+        subscription.close()
+        raise
+    finally:
+        # Do not hold a database connection for the life of the stream
+        db.session.close()
+
+    frames = events.stream(
+        subscription, first,
+        keepalive=current_app.config.get('SSE_KEEPALIVE', 15),
+        max_duration=current_app.config.get('SSE_MAX_DURATION', 300),
+        until=lambda message: message['data']['status'] in ('delivered', 'cancelled'),
+    )
+    return Response(frames, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @bp.route('/cancel_order/<int:order_id>', methods=['POST'])
 @login_required
 def cancel_order(order_id):
@@ -489,13 +527,13 @@ def cancel_order(order_id):
     order.status = 'cancelled'
     order.updated_at = datetime.utcnow()
 
-    db.session.commit()
-
     # Send status update email
     try:
         send_order_status_update_email(order, old_status, 'cancelled')
     except Exception as e:
-        current_app.logger.error(f"Failed to send order cancellation email: {e}")
+        current_app.logger.error(f"Failed to queue order cancellation email: {e}")
+
+    db.session.commit()
 
     flash('Order cancelled successfully', 'success')
     return redirect(url_for('orders.my_orders' if not current_user.is_admin else 'admin.orders'))
@@ -510,13 +548,14 @@ def update_order_status(order_id):
 
     order.status = new_status
     order.updated_at = datetime.utcnow()
-    db.session.commit()
 
     # Send status update email
     try:
         send_order_status_update_email(order, old_status, new_status)
     except Exception as e:
-        current_app.logger.error(f"Failed to send order status update email: {e}")
+        current_app.logger.error(f"Failed to queue order status update email: {e}")
+
+    db.session.commit()
 
     flash(f'Order {order.order_number} status updated to {new_status}', 'success')
     return redirect(url_for('admin.orders'))
\ No newline at end of file
@@ -2,9 +2,10 @@ from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
 from app.models import MenuItem, Order, OrderItem
 from app import db
+from app.utils import stats
+from app.utils.eta import eta_model
 import os
 from werkzeug.utils import secure_filename
-from datetime import timedelta
 
 bp = Blueprint('utils', __name__)
 
@@ -43,32 +44,12 @@ def upload_image():
     
     return jsonify({'error': 'Invalid file type'}), 400
 
-@bp.route('/search_suggestions')
-def search_suggestions():
-    query = request.args.get('q', '')
-    if len(query) < 2:
-        return jsonify([])
-    
-    suggestions = MenuItem.query.filter(
-        MenuItem.name.ilike(f'%{query}%') |
-        MenuItem.description.ilike(f'%{query}%')
-    ).filter_by(is_available=True).limit(5).all()
-    
-    return jsonify([{
-        'id': item.id,
-        'name': item.name,
-        'price': item.price,
-        'image_url': item.image_url
-    } for item in suggestions])
-
-
-
 @bp.route('/order_tracking/<order_number>')
 def order_tracking(order_number):
     order = Order.query.filter_by(order_number=order_number).first_or_404()
     
-    # Calculate estimated delivery time
-    estimated_delivery = order.created_at + timedelta(minutes=order.preparation_time + 15)
+    # Learned per item, zone and hour, plus the current kitchen queue
+    estimated_delivery = eta_model.estimated_delivery(order)
     
     return jsonify({
         'order_number': order.order_number,
@@ -81,27 +62,18 @@ def order_tracking(order_number):
 
 @bp.route('/popular_items')
 def popular_items():
-    # Get most ordered items in the last 30 days
-    from datetime import datetime, timedelta
-    
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    popular_items = db.session.query(MenuItem, db.func.count(OrderItem.id).label('order_count'))\
-        .join(OrderItem)\
-        .join(Order)\
-        .filter(Order.created_at >= thirty_days_ago)\
-        .group_by(MenuItem)\
-        .order_by(db.func.count(OrderItem.id).desc())\
-        .limit(6)\
-        .all()
+    # Get most ordered items in the last 30 days (from the daily sales rollup)
+    popular = stats.popular_items(days=30, limit=6)
+    items = {item.id: item for item in
+             MenuItem.query.filter(MenuItem.id.in_([item_id for item_id, _ in popular])).all()}
     
     return jsonify([{
-        'id': item.MenuItem.id,
-        'name': item.MenuItem.name,
-        'price': item.MenuItem.price,
-        'image_url': item.MenuItem.image_url,
-        'order_count': item.order_count
-    } for item in popular_items])
+        'id': items[item_id].id,
+        'name': items[item_id].name,
+        'price': items[item_id].price,
+        'image_url': items[item_id].image_url,
+        'order_count': order_count
+    } for item_id, order_count in popular if item_id in items])
 
 @bp.route('/customer_stats')
 @login_required
@@ -0,0 +1,220 @@
+import secrets
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app, g, session
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import CartItem
+from app.utils.catalog import catalog_cache
+
+
+# What the cart templates render for one line (prices come from the catalog)
+CartLine = namedtuple('CartLine', 'item_id name price quantity')
+
+_TOKEN_KEY = 'cart_token'
+
+
+# --- stores ---
+# Every store speaks the subset of the Redis hash API the cart needs, so a
+# redis.Redis client can be used as-is. Keys are "cart:<token>", fields are
+# menu item ids and values are quantities.
+
+class MemoryCartStore:
+    """In-process stand-in for Redis (single worker, development, tests)."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._data.get(key, {}))
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            cart = self._data.setdefault(key, {})
+            cart[str(field)] = int(cart.get(str(field), 0)) + amount
+            return cart[str(field)]
+
+    def hset(self, key, field, value):
+        with self._lock:
+            self._data.setdefault(key, {})[str(field)] = int(value)
+            return 1
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            cart = self._data.get(key, {})
+            return sum(1 for f in fields if cart.pop(str(f), None) is not None)
+
+    def delete(self, key):
+        with self._lock:
+            return 1 if self._data.pop(key, None) is not None else 0
+
+    def expire(self, key, seconds):
+        return True
+
+
+class SQLCartStore:
+    """Default store: one CartItem row per (cart token, menu item)."""
+
+    @staticmethod
+    def _token(key):
+        return key.split(':', 1)[1]
+
+    def hgetall(self, key):
+        rows = db.session.query(CartItem.menu_item_id, CartItem.quantity)\
+            .filter_by(cart_token=self._token(key)).all()
+        return {str(item_id): qty for item_id, qty in rows}
+
+    def _upsert(self, token, item_id, quantity, add):
+        """
+        Set (or with ``add``, increase) one line in a single statement, so two
+        concurrent adds of the same item cannot both try to insert it.
+        """
+        table = CartItem.__table__
+        now = datetime.utcnow()
+        new_quantity = table.c.quantity + quantity if add else quantity
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            insert = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table)
+            db.session.execute(insert.values(
+                cart_token=token, menu_item_id=item_id, quantity=quantity, updated_at=now,
+            ).on_conflict_do_update(
+                index_elements=['cart_token', 'menu_item_id'],
+                set_={'quantity': new_quantity, 'updated_at': now},
+            ))
+        else:
+            result = db.session.execute(table.update().where(
+                table.c.cart_token == token, table.c.menu_item_id == item_id,
+            ).values(quantity=new_quantity, updated_at=now))
+            if result.rowcount == 0:
+                db.session.execute(table.insert().values(
+                    cart_token=token, menu_item_id=item_id, quantity=quantity, updated_at=now))
+
+    def hincrby(self, key, field, amount=1):
+        token, item_id = self._token(key), int(field)
+        self._upsert(token, item_id, amount, add=True)
+        quantity = db.session.query(CartItem.quantity)\
+            .filter_by(cart_token=token, menu_item_id=item_id).scalar()
+        db.session.commit()
+        return quantity
+
+    def hset(self, key, field, value):
+        self._upsert(self._token(key), int(field), int(value), add=False)
+        db.session.commit()
+        return 1
+
+    def hdel(self, key, *fields):
+        deleted = CartItem.query.filter(
+            CartItem.cart_token == self._token(key),
+            CartItem.menu_item_id.in_([int(f) for f in fields])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def delete(self, key):
+        deleted = CartItem.query.filter_by(cart_token=self._token(key))\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return 1 if deleted else 0
+
+    def expire(self, key, seconds):
+        # Rows carry updated_at; stale carts are removed by purge_expired_carts()
+        return True
+
+
+def init_cart(app):
+    """Pick the cart store from CART_BACKEND ('sql', 'redis' or 'memory')."""
+    backend = app.config.get('CART_BACKEND', 'sql')
+    if backend == 'redis':
+        import redis  # optional dependency, only needed for this backend
+        store = redis.Redis.from_url(app.config['CART_REDIS_URL'])
+    elif backend == 'memory':
+        store = MemoryCartStore()
+    else:
+        store = SQLCartStore()
+    app.extensions['cart_store'] = store
+
+
+def purge_expired_carts(max_age):
+    """Delete SQL cart lines not touched for ``max_age`` seconds."""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    deleted = CartItem.query.filter(CartItem.updated_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+# --- per-request cart API ---
+def _store():
+    return current_app.extensions['cart_store']
+
+
+def _key(create=False):
+    token = session.get(_TOKEN_KEY)
+    if token is None and create:
+        token = secrets.token_urlsafe(12)
+        session[_TOKEN_KEY] = token
+    return f'cart:{token}' if token else None
+
+
+def _touch(key):
+    _store().expire(key, current_app.config.get('CART_TTL', 7 * 24 * 3600))
+    g.pop('cart', None)
+
+
+def get_cart():
+    """Return the current cart as {menu_item_id: quantity} (cached per request)."""
+    if 'cart' not in g:
+        key = _key()
+        raw = _store().hgetall(key) if key else {}
+        g.cart = {int(k): int(v) for k, v in raw.items() if int(v) > 0}
+    return g.cart
+
+
+def add_item(item_id, quantity=1):
+    key = _key(create=True)
+    _store().hincrby(key, int(item_id), quantity)
+    _touch(key)
+
+
+def set_quantity(item_id, quantity):
+    key = _key(create=True)
+    if quantity > 0:
+        _store().hset(key, int(item_id), quantity)
+    else:
+        _store().hdel(key, int(item_id))
+    _touch(key)
+
+
+def remove_item(item_id):
+    key = _key()
+    if key:
+        _store().hdel(key, int(item_id))
+        _touch(key)
+
+
+def clear_cart():
+    key = _key()
+    if key:
+        _store().delete(key)
+    session.pop(_TOKEN_KEY, None)
+    g.pop('cart', None)
+
+
+def cart_count():
+    """Total quantity across all lines."""
+    return sum(get_cart().values())
+
+
+def cart_lines():
+    """Cart lines priced from the catalog cache, keyed by menu item id."""
+    items = catalog_cache.get().items_by_id
+    lines = OrderedDict()
+    for item_id, quantity in get_cart().items():
+        item = items.get(item_id)
+        if item is not None:
+            lines[item_id] = CartLine(item_id, item.name, item.price, quantity)
+    return lines
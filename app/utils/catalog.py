@@ -0,0 +1,165 @@
+import os
+import re
+import threading
+from collections import namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models import Category, MenuItem, DeliveryZone
+
+
+# Lightweight, read-only copies of catalog rows. They are safe to share
+# between requests and threads (no session attached, no lazy loads).
+CachedCategory = namedtuple('CachedCategory', 'id name description image_url')
+CachedMenuItem = namedtuple(
+    'CachedMenuItem',
+    'id name description price image_url is_available preparation_time category_id'
+)
+CachedZone = namedtuple('CachedZone', 'id name fee eta aliases')
+
+
+def split_aliases(value):
+    """Turn the free-text aliases column into a tuple of names."""
+    return tuple(a.strip() for a in re.split(r'[,\n]', value or '') if a.strip())
+
+
+class CatalogSnapshot:
+    """Immutable view of categories, available menu items and delivery zones."""
+
+    def __init__(self, generation, categories, items, zones):
+        self.generation = generation
+        self.categories = categories
+        self.items = items
+        self.zones = zones
+        self.items_by_id = {item.id: item for item in items}
+        self.zones_by_id = {zone.id: zone for zone in zones}
+
+    def items_in_category(self, category_id):
+        return [item for item in self.items if item.category_id == category_id]
+
+
+class CatalogCache:
+    """
+    Per-process catalog snapshot.
+
+    The snapshot is dropped whenever a commit touches MenuItem, Category or
+    DeliveryZone. Commits also rewrite a small marker file so that other
+    worker processes notice (via os.stat) that their copy is stale.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._generation = 0
+        self._marker_path = None
+        self._marker_stamp = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._marker_path = app.config.get('CATALOG_MARKER_PATH') or \
+            os.path.join(app.instance_path, 'catalog.generation')
+        os.makedirs(os.path.dirname(self._marker_path), exist_ok=True)
+        self._marker_stamp = self._stat_marker()
+        self._snapshot = None
+        app.extensions['catalog_cache'] = self
+
+    # --- reading ---
+    def get(self):
+        """Return the current snapshot, rebuilding it if it is stale."""
+        stamp = self._stat_marker()
+        snapshot = self._snapshot
+        if snapshot is not None and stamp == self._marker_stamp:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or stamp != self._marker_stamp:
+                self._generation = self._read_generation()
+                self._marker_stamp = stamp
+                self._snapshot = self._build(self._generation)
+            return self._snapshot
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def _build(self, generation):
+        categories = [
+            CachedCategory(c.id, c.name, c.description, c.image_url)
+            for c in Category.query.order_by(Category.id).all()
+        ]
+        items = [
+            CachedMenuItem(i.id, i.name, i.description, i.price, i.image_url,
+                           i.is_available, i.preparation_time, i.category_id)
+            for i in MenuItem.query.filter_by(is_available=True).order_by(MenuItem.id).all()
+        ]
+        zones = [
+            CachedZone(z.id, z.name, z.fee, z.eta, split_aliases(z.aliases))
+            for z in DeliveryZone.query.order_by(DeliveryZone.name).all()
+        ]
+        return CatalogSnapshot(generation, categories, items, zones)
+
+    # --- invalidation ---
+    def invalidate(self):
+        """Drop the local snapshot and tell other workers to do the same."""
+        with self._lock:
+            self._snapshot = None
+            self._generation = self._bump_generation()
+            self._marker_stamp = self._stat_marker()
+
+    def _stat_marker(self):
+        if not self._marker_path:
+            return None
+        try:
+            st = os.stat(self._marker_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_generation(self):
+        try:
+            with open(self._marker_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError, TypeError):
+            return 0
+
+    def _bump_generation(self):
+        generation = self._read_generation() + 1
+        if not self._marker_path:
+            return generation
+        tmp_path = f'{self._marker_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(generation))
+        # os.replace gives the marker a new inode, which other workers see on stat
+        os.replace(tmp_path, self._marker_path)
+        return generation
+
+
+catalog_cache = CatalogCache()
+
+
+# --- SQLAlchemy hooks ---
+_CATALOG_FLAG = 'catalog_dirty'
+
+
+def _flag_session(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_CATALOG_FLAG] = True
+
+
+for _model in (Category, MenuItem, DeliveryZone):
+    for _evt in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _evt, _flag_session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop(_CATALOG_FLAG, False):
+        catalog_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_flag_on_rollback(session):
+    session.info.pop(_CATALOG_FLAG, None)
@@ -0,0 +1,299 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models import Coupon, CouponUsage, Order, coupon_zone
+
+
+# Read-only copy of a coupon row plus the ids of the zones it is limited to
+# (empty means every zone). Safe to share between requests and threads.
+CachedCoupon = namedtuple(
+    'CachedCoupon',
+    'id code coupon_type amount starts_at expires_at min_subtotal '
+    'max_uses max_uses_per_user uses_count is_active zone_ids'
+)
+
+
+class CouponCheck(namedtuple('CouponCheck', 'code discount message reason coupon')):
+    """
+    Outcome of evaluating one code.
+
+    ``reason`` is None for a usable coupon, otherwise one of: 'missing',
+    'not_found', 'inactive', 'not_started', 'expired', 'min_subtotal',
+    'exhausted', 'zone', 'user_limit'.
+    """
+
+    @property
+    def valid(self):
+        return self.reason is None
+
+    def as_dict(self):
+        return {'code': self.code, 'valid': self.valid, 'discount': self.discount,
+                'message': self.message, 'reason': self.reason}
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+class CouponEngine:
+    """
+    Evaluates coupon codes against a cart.
+
+    Coupon definitions (with their zone ids) are cached per code for
+    COUPON_CACHE_TTL seconds and dropped in this process whenever a commit
+    touches a coupon. A cache miss costs one query that also returns the
+    user's usage count; a hit costs at most one usage count query, and only
+    for coupons with a per-user limit.
+
+    ``uses_count`` may lag by up to the TTL, so the global limit checked here
+    is advisory; the redemption at checkout is what enforces it.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 30
+        self._cache = {}            # code -> (expires_at, CachedCoupon or None)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('COUPON_CACHE_TTL', self.ttl)
+        self._cache = {}
+        app.extensions['coupon_engine'] = self
+
+    # --- cache ---
+    def clear(self):
+        with self._lock:
+            self._cache = {}
+
+    def forget(self, code):
+        with self._lock:
+            self._cache.pop(normalize_code(code), None)
+
+    def _cached(self, code, now):
+        entry = self._cache.get(code)
+        if entry is not None and entry[0] > now:
+            return True, entry[1]
+        return False, None
+
+    # --- loading ---
+    def _load(self, codes, user_id):
+        """
+        One round trip for a set of codes: coupon columns, one row per
+        allowed zone (outer join) and the user's usage count.
+        Returns ({code: CachedCoupon}, {coupon_id: used_count}).
+        """
+        used = db.literal(0)
+        if user_id is not None:
+            used = db.select(db.func.count(CouponUsage.id))\
+                .where(CouponUsage.coupon_id == Coupon.id, CouponUsage.user_id == user_id)\
+                .scalar_subquery()
+
+        rows = db.session.query(
+            Coupon.id, Coupon.code, Coupon.coupon_type, Coupon.amount,
+            Coupon.starts_at, Coupon.expires_at, Coupon.min_subtotal,
+            Coupon.max_uses, Coupon.max_uses_per_user, Coupon.uses_count,
+            Coupon.is_active, coupon_zone.c.zone_id, used,
+        ).outerjoin(coupon_zone, coupon_zone.c.coupon_id == Coupon.id)\
+            .filter(Coupon.code.in_(codes)).all()
+
+        columns, zones, usage = {}, {}, {}
+        for row in rows:
+            columns.setdefault(row[1], row[:11])
+            if row[11] is not None:
+                zones.setdefault(row[1], set()).add(row[11])
+            usage[row[0]] = row[12] or 0
+
+        coupons = {
+            code: CachedCoupon(*cols, frozenset(zones.get(code, ())))
+            for code, cols in columns.items()
+        }
+        return coupons, usage
+
+    def _usage_counts(self, coupon_ids, user_id):
+        rows = db.session.query(CouponUsage.coupon_id, db.func.count(CouponUsage.id))\
+            .filter(CouponUsage.coupon_id.in_(coupon_ids), CouponUsage.user_id == user_id)\
+            .group_by(CouponUsage.coupon_id).all()
+        return dict(rows)
+
+    # --- evaluation ---
+    def evaluate_many(self, codes, subtotal, delivery_zone_id=None, user=None):
+        """Evaluate several codes against the same cart. Returns {code: CouponCheck}."""
+        codes = [normalize_code(c) for c in codes]
+        wanted = {c for c in codes if c}
+        user_id = user.id if user is not None and getattr(user, 'is_authenticated', True) else None
+        now = time.monotonic()
+
+        coupons, missing = {}, []
+        for code in wanted:
+            hit, coupon = self._cached(code, now)
+            if hit:
+                if coupon is not None:
+                    coupons[code] = coupon
+            else:
+                missing.append(code)
+
+        usage = {}
+        if missing:
+            loaded, usage = self._load(missing, user_id)
+            expires = now + self.ttl
+            with self._lock:
+                for code in missing:
+                    self._cache[code] = (expires, loaded.get(code))
+            coupons.update(loaded)
+
+        if user_id is not None:
+            pending = [c.id for c in coupons.values()
+                       if c.max_uses_per_user is not None and c.id not in usage]
+            if pending:
+                usage.update(self._usage_counts(pending, user_id))
+
+        results = {}
+        for code in codes:
+            coupon = coupons.get(code)
+            used_count = None
+            if coupon is not None and user_id is not None:
+                used_count = usage.get(coupon.id, 0)
+            results[code] = self._check(code, coupon, subtotal, delivery_zone_id, used_count)
+        return results
+
+    def evaluate(self, code, subtotal, delivery_zone_id=None, user=None):
+        return self.evaluate_many([code], subtotal, delivery_zone_id, user)[normalize_code(code)]
+
+    @staticmethod
+    def _check(code, coupon, subtotal, delivery_zone_id, used_count):
+        def reject(reason, message):
+            return CouponCheck(code, 0.0, message, reason, coupon)
+
+        if not code:
+            return reject('missing', "No coupon provided")
+        if coupon is None:
+            return reject('not_found', "Invalid coupon code")
+
+        now = datetime.utcnow()
+        if not coupon.is_active:
+            return reject('inactive', "This coupon is inactive")
+        if coupon.starts_at and now < coupon.starts_at:
+            return reject('not_started', f"This coupon is not active until {coupon.starts_at}")
+        if coupon.expires_at and now > coupon.expires_at:
+            return reject('expired', "This coupon has expired")
+        if coupon.min_subtotal and subtotal < coupon.min_subtotal:
+            return reject('min_subtotal',
+                          f"Order must be at least ₦{coupon.min_subtotal:.2f} to use this coupon")
+        if coupon.max_uses is not None and (coupon.uses_count or 0) >= coupon.max_uses:
+            return reject('exhausted', "This coupon has reached its maximum number of uses")
+        if coupon.zone_ids and delivery_zone_id not in coupon.zone_ids:
+            return reject('zone', "Coupon not valid for this delivery area")
+        if used_count is not None and coupon.max_uses_per_user is not None \
+                and used_count >= coupon.max_uses_per_user:
+            return reject('user_limit', "You have already used this coupon the maximum allowed times")
+
+        if coupon.coupon_type == 'percent':
+            discount = subtotal * (coupon.amount / 100.0)
+            message = f"{int(coupon.amount)}% off"
+        else:
+            discount = float(coupon.amount)
+            message = f"₦{coupon.amount:.2f} off"
+        return CouponCheck(code, min(discount, subtotal), message, None, coupon)
+
+
+coupon_engine = CouponEngine()
+
+
+# --- redemption ---
+def reserve_coupon(coupon_id):
+    """
+    Take one use of a coupon in the current transaction.
+
+    The check and the increment are a single conditional UPDATE, so
+    concurrent checkouts can neither lose increments nor go past max_uses.
+    Returns False when the coupon is used up (or gone).
+    """
+    table = Coupon.__table__
+    uses = db.func.coalesce(table.c.uses_count, 0)
+    result = db.session.execute(
+        table.update()
+        .where(table.c.id == coupon_id,
+               or_(table.c.max_uses.is_(None), uses < table.c.max_uses))
+        .values(uses_count=uses + 1)
+    )
+    return result.rowcount == 1
+
+
+def release_coupon(connection, order_id):
+    """Give back the coupon use held by an order (no-op if it holds none)."""
+    usage = CouponUsage.__table__
+    coupons = Coupon.__table__
+    coupon_ids = connection.execute(
+        db.select(usage.c.coupon_id).where(usage.c.order_id == order_id)
+    ).scalars().all()
+    if not coupon_ids:
+        return
+    connection.execute(usage.delete().where(usage.c.order_id == order_id))
+    for coupon_id in coupon_ids:
+        connection.execute(
+            coupons.update()
+            .where(coupons.c.id == coupon_id, coupons.c.uses_count > 0)
+            .values(uses_count=coupons.c.uses_count - 1)
+        )
+
+
+def cancel_abandoned_orders(max_age):
+    """
+    Cancel unpaid pending orders older than ``max_age`` seconds that hold a
+    coupon, which releases their reservations. Returns the number cancelled.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    orders = Order.query.filter(
+        Order.status == 'pending',
+        Order.payment_status == 'pending',
+        Order.coupon_id.isnot(None),
+        Order.created_at < cutoff,
+    ).all()
+    for order in orders:
+        order.status = 'cancelled'
+    db.session.commit()
+    return len(orders)
+
+
+# --- cancelled or deleted orders give their coupon back ---
+@event.listens_for(Order, 'after_update')
+def _release_on_cancel(mapper, connection, target):
+    status = inspect(target).attrs.status.history
+    if target.status == 'cancelled' and status.deleted and status.deleted[0] != 'cancelled':
+        release_coupon(connection, target.id)
+
+
+@event.listens_for(Order, 'before_delete')
+def _release_on_delete(mapper, connection, target):
+    release_coupon(connection, target.id)
+
+
+# --- drop cached definitions when coupons change ---
+_COUPON_FLAG = 'coupons_dirty'
+
+
+@event.listens_for(Coupon, 'after_insert')
+@event.listens_for(Coupon, 'after_update')
+@event.listens_for(Coupon, 'after_delete')
+def _flag_coupons(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_COUPON_FLAG] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _clear_coupons(session):
+    if session.info.pop(_COUPON_FLAG, False):
+        coupon_engine.clear()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_coupon_flag(session):
+    session.info.pop(_COUPON_FLAG, None)
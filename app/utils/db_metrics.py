@@ -0,0 +1,143 @@
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app import db
+
+
+class DBMetrics:
+    """
+    Connection pool and per-request SQL statistics for this process.
+
+    Pool figures come from SQLAlchemy pool events; the time spent waiting
+    for a connection is measured around the pool's internal get, since the
+    pool has no event for the start of a checkout. Statement counts and SQL
+    time are kept per request in ``g`` and rolled up per endpoint.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def reset(self):
+        with self._lock:
+            self.pool = {
+                'connects': 0, 'checkouts': 0, 'checkins': 0, 'invalidations': 0,
+                'timeouts': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+                'in_use_max': 0,
+            }
+            self.endpoints = {}
+            self.background = {'queries': 0, 'sql_ms': 0.0}
+
+    def init_app(self, app):
+        with app.app_context():
+            engine = db.engine
+        self.engine = engine
+        self._instrument_pool(engine.pool)
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['db_metrics'] = self
+
+    # --- pool ---
+    def _instrument_pool(self, pool):
+        do_get = pool._do_get
+
+        def timed_get():
+            start = time.perf_counter()
+            try:
+                return do_get()
+            except PoolTimeout:
+                with self._lock:
+                    self.pool['timeouts'] += 1
+                raise
+            finally:
+                waited = (time.perf_counter() - start) * 1000
+                with self._lock:
+                    self.pool['wait_ms_total'] += waited
+                    self.pool['wait_ms_max'] = max(self.pool['wait_ms_max'], waited)
+
+        pool._do_get = timed_get
+        event.listen(pool, 'connect', lambda *a: self._count('connects'))
+        event.listen(pool, 'checkout', self._checked_out)
+        event.listen(pool, 'checkin', lambda *a: self._count('checkins'))
+        event.listen(pool, 'invalidate', lambda *a: self._count('invalidations'))
+
+    def _count(self, key):
+        with self._lock:
+            self.pool[key] += 1
+
+    def _checked_out(self, dbapi_connection, connection_record, connection_proxy):
+        in_use = self._in_use()
+        with self._lock:
+            self.pool['checkouts'] += 1
+            if in_use is not None:
+                self.pool['in_use_max'] = max(self.pool['in_use_max'], in_use)
+
+    def _in_use(self):
+        checkedout = getattr(self.engine.pool, 'checkedout', None)
+        return checkedout() if checkedout else None
+
+    # --- statements ---
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_start'] = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = (time.perf_counter() - conn.info.pop('query_start', time.perf_counter())) * 1000
+        if has_request_context() and 'db_queries' in g:
+            g.db_queries += 1
+            g.db_time += elapsed
+        else:
+            with self._lock:
+                self.background['queries'] += 1
+                self.background['sql_ms'] += elapsed
+
+    # --- requests ---
+    def _start_request(self):
+        g.db_queries = 0
+        g.db_time = 0.0
+
+    def _finish_request(self, response):
+        if 'db_queries' not in g:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'queries_max': 0, 'sql_ms': 0.0, 'sql_ms_max': 0.0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += g.db_queries
+            stats['queries_max'] = max(stats['queries_max'], g.db_queries)
+            stats['sql_ms'] += g.db_time
+            stats['sql_ms_max'] = max(stats['sql_ms_max'], g.db_time)
+        return response
+
+    # --- reporting ---
+    def snapshot(self):
+        pool = self.engine.pool
+        with self._lock:
+            pool_stats = dict(self.pool)
+            endpoints = {name: dict(s) for name, s in self.endpoints.items()}
+            background = dict(self.background)
+
+        pool_stats['wait_ms_avg'] = pool_stats['wait_ms_total'] / (pool_stats['checkouts'] or 1)
+        pool_stats['class'] = type(pool).__name__
+        pool_stats['status'] = pool.status()
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if method is not None:
+                pool_stats[name] = method()
+
+        for stats in endpoints.values():
+            stats['queries_avg'] = stats['queries'] / stats['requests']
+            stats['sql_ms_avg'] = stats['sql_ms'] / stats['requests']
+        return {'pool': pool_stats, 'endpoints': endpoints, 'background': background}
+
+
+db_metrics = DBMetrics()
@@ -11,18 +11,123 @@
 #     return R * c
 
 
-from app.models import DeliveryZone
+import threading
+from collections import deque
+
+from app.utils.catalog import catalog_cache
+
+
+DEFAULT_DELIVERY_FEE = 500      # Naira, when no zone matches
+DEFAULT_ETA = "30–50 mins"
+
+
+def normalize(text):
+    """Lower-case and collapse whitespace so patterns and addresses line up."""
+    return ' '.join((text or '').lower().split())
+
+
+class ZoneMatcher:
+    """
+    Aho–Corasick automaton over zone names and aliases.
+
+    One pass over the address finds every pattern it contains. Only whole
+    words count ("gra" does not match "Graceland"), and the longest match
+    wins, so "Ugbowo Campus" beats "Ugbowo" when both are patterns.
+    """
+
+    def __init__(self, zones):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]        # state -> [(pattern length, zone)]
+        for zone in zones:
+            for pattern in {normalize(zone.name), *map(normalize, zone.aliases)}:
+                if pattern:
+                    self._add(pattern, zone)
+        self._link()
+
+    def _add(self, pattern, zone):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), zone))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def match(self, address):
+        """Return the zone of the longest whole-word match, or None."""
+        text = normalize(address)
+        goto, fail, out = self._goto, self._fail, self._out
+        best_len, best_zone = 0, None
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state] or (end < len(text) and text[end].isalnum()):
+                continue
+            for length, zone in out[state]:
+                start = end - length
+                if length > best_len and (start == 0 or not text[start - 1].isalnum()):
+                    best_len, best_zone = length, zone
+        return best_zone
+
+
+_matcher = None
+_matcher_generation = None
+_matcher_lock = threading.Lock()
+
+
+def get_matcher():
+    """The zone matcher for the current catalog, rebuilt when zones change."""
+    global _matcher, _matcher_generation
+    catalog = catalog_cache.get()
+    if _matcher is not None and _matcher_generation == catalog.generation:
+        return _matcher
+    with _matcher_lock:
+        if _matcher is None or _matcher_generation != catalog.generation:
+            _matcher = ZoneMatcher(catalog.zones)
+            _matcher_generation = catalog.generation
+        return _matcher
+
+
+def resolve_zone(address):
+    """Best matching (cached) delivery zone for an address, or None."""
+    if not address:
+        return None
+    return get_matcher().match(address)
+
+
+def get_delivery_quote(address):
+    """
+    Return (fee, eta, zone) for an address.
+    Falls back to ₦500 and the default ETA when no zone matches.
+    """
+    zone = resolve_zone(address)
+    if zone is None:
+        return DEFAULT_DELIVERY_FEE, DEFAULT_ETA, None
+    return zone.fee, zone.eta or DEFAULT_ETA, zone
+
 
 def get_delivery_fee(address: str) -> int:
     """
     Return delivery fee in Naira.
     Falls back to ₦500 if no keyword matches.
     """
-    if not address:
-        return 500
-    address = address.lower()
-    zones   = DeliveryZone.query.all()
-    for z in zones:
-        if z.name.lower() in address:
-            return z.fee
-    return 500          # default
\ No newline at end of file
+    return get_delivery_quote(address)[0]
@@ -3,8 +3,11 @@ import traceback
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import smtplib
-from flask import current_app, render_template_string
+from flask import current_app
 from dotenv import load_dotenv
+from app import db
+from app.models import EmailOutbox
+from app.utils.email_templates import email_templates
 load_dotenv()
 
 # Gmail SMTP config
@@ -15,18 +18,40 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", 465))
 SMTP_DEBUG = int(os.getenv("SMTP_DEBUG", 0))
 
 
-def send_email(to, subject, body, is_html=False):
+def build_message(to, subject, body, is_html=False, text_body=None):
     """
-    Sends an email via Gmail SMTP.
-    Can send plain text or HTML formatted messages.
+    Build the MIME message for a plain text or HTML email.
+    HTML emails with a text_body are sent as multipart/alternative.
     """
-    msg = MIMEMultipart()
+    msg = MIMEMultipart("alternative" if is_html and text_body else "mixed")
     msg["From"] = GMAIL_USER
     msg["To"] = to
     msg["Subject"] = subject
 
+    if is_html and text_body:
+        msg.attach(MIMEText(text_body, "plain"))
     mime_type = "html" if is_html else "plain"
     msg.attach(MIMEText(body, mime_type))
+    return msg
+
+
+def queue_email(to, subject, body, is_html=False, text_body=None):
+    """
+    Add an email to the outbox in the current database transaction.
+    It is delivered by the outbox worker once the transaction commits.
+    """
+    db.session.add(EmailOutbox(recipient=to, subject=subject, body=body, is_html=is_html,
+                               text_body=text_body))
+    db.session.info['outbox_pending'] = True
+    return True
+
+
+def send_email(to, subject, body, is_html=False):
+    """
+    Sends an email via Gmail SMTP right away (bypasses the outbox).
+    Can send plain text or HTML formatted messages.
+    """
+    msg = build_message(to, subject, body, is_html)
 
     print("📧 Using Gmail user:", GMAIL_USER)
     print("🔑 Using Gmail pass:", "None" if not GMAIL_PASS else "*" * len(GMAIL_PASS))
@@ -50,79 +75,10 @@ def send_order_confirmation_email(order):
     subject = f'Order Confirmation - {order.order_number}'
     recipients = [order.customer.email]
 
-    text_body = f'''
-Dear {order.customer.first_name},
-
-Thank you for your order at Lauracious Foodies Delight!
-
-Order Number: {order.order_number}
-Total Amount: ₦{order.total_amount:.2f}
-Status: {order.status.title()}
-
-We are preparing your order with love and it will be delivered to:
-{order.delivery_address}
-
-Estimated delivery time: 30-45 minutes
-
-You can track your order status using your order number.
-
-Best regards,
-The Lauracious Foodies Delight Team
-'''
-
-    html_body = render_template_string('''
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-        .header { background: linear-gradient(135deg, #ff6b6b, #4ecdc4); color: white; padding: 20px; text-align: center; border-radius: 10px 10px 0 0; }
-        .content { background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }
-        .order-details { background: white; padding: 20px; border-radius: 10px; margin: 20px 0; }
-        .footer { text-align: center; margin-top: 30px; color: #666; }
-        .btn { display: inline-block; padding: 12px 24px; background: #ff6b6b; color: white; text-decoration: none; border-radius: 25px; margin: 10px 0; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>Order Confirmation</h1>
-        </div>
-        <div class="content">
-            <h2>Hello {{ order.customer.first_name }}!</h2>
-            <p>Thank you for your order at <strong>Lauracious Foodies Delight</strong>!</p>
-
-            <div class="order-details">
-                <h3>Order Details</h3>
-                <p><strong>Order Number:</strong> {{ order.order_number }}</p>
-                <p><strong>Total Amount:</strong> ₦{{ "%.2f"|format(order.total_amount) }}</p>
-                <p><strong>Status:</strong> {{ order.status.title() }}</p>
-                <p><strong>Delivery Address:</strong><br>{{ order.delivery_address }}</p>
-
-                <h4>Items Ordered:</h4>
-                <ul>
-                {% for order_item in order.order_items %}
-                    <li>{{ order_item.quantity }}x {{ order_item.menu_item.name }} - ₦{{ "%.2f"|format(order_item.subtotal) }}</li>
-                {% endfor %}
-                </ul>
-            </div>
-
-            <p><strong>Estimated delivery time:</strong> 30-45 minutes</p>
-            <p>We are preparing your order with love and care!</p>
-
-            <div class="footer">
-                <p>Best regards,<br>The Lauracious Foodies Delight Team</p>
-                <p><small>If you have any questions, please contact us at hello@lauraciousfoodies.com</small></p>
-            </div>
-        </div>
-    </div>
-</body>
-</html>
-    ''', order=order)
-
-    # Send email via Gmail SMTP
-    send_email(recipients[0], subject, html_body, is_html=True)
+    text_body, html_body = email_templates.render('order_confirmation', order=order)
+
+    # Delivered by the outbox worker after commit
+    return queue_email(recipients[0], subject, html_body, is_html=True, text_body=text_body)
 
 
 
@@ -130,50 +86,13 @@ def send_order_status_update_email(order, old_status, new_status):
     subject = f'Order Status Update - {order.order_number}'
     recipient = order.customer.email
 
-    html_body = render_template_string('''
-<!DOCTYPE html>
-<html>
-<head>
-    <style>
-        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-        .header { background: linear-gradient(135deg, #4ecdc4, #44a08d); color: white; padding: 20px; text-align: center; border-radius: 10px 10px 0 0; }
-        .content { background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }
-        .status-update { background: white; padding: 20px; border-radius: 10px; margin: 20px 0; text-align: center; }
-        .footer { text-align: center; margin-top: 30px; color: #666; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>Order Status Update</h1>
-        </div>
-        <div class="content">
-            <h2>Hello {{ order.customer.first_name }}!</h2>
-            <p>Your order status has been updated!</p>
-
-            <div class="status-update">
-                <h3>Order #{{ order.order_number }}</h3>
-                <p><strong>Previous Status:</strong> {{ old_status.title() }}</p>
-                <p><strong>New Status:</strong> {{ new_status.title() }}</p>
-            </div>
-
-            <div class="footer">
-                <p>Thank you for choosing <strong>Lauracious Foodies Delight</strong>!</p>
-                <p>Best regards,<br>The Lauracious Foodies Delight Team</p>
-            </div>
-        </div>
-    </div>
-</body>
-</html>
-    ''', order=order, old_status=old_status, new_status=new_status)
+    text_body, html_body = email_templates.render(
+        'order_status_update', order=order, old_status=old_status, new_status=new_status)
 
     try:
-        # send_email(to, subject, body, is_html)
-        success, _ = send_email(recipient, subject, html_body, is_html=True)
-        return success
+        return queue_email(recipient, subject, html_body, is_html=True, text_body=text_body)
     except Exception as e:
-        current_app.logger.exception(f"Failed to send order status email: {e}")
+        current_app.logger.exception(f"Failed to queue order status email: {e}")
         return False
     
 
@@ -182,22 +101,6 @@ def send_invoice_email(order):
     subject = f"Invoice for Order {order.order_number}"
     to = order.customer.email
 
-    html_body = render_template_string("""
-    <h2>Your Invoice is Ready</h2>
-    <p>Thank you for your payment. Below is your invoice:</p>
-
-    <p><strong>Order Number:</strong> {{ order.order_number }}</p>
-    <p><strong>Total Paid:</strong> ₦{{ "%.2f"|format(order.total_amount) }}</p>
-    <p><strong>Payment Method:</strong> {{ order.payment_method.title() }}</p>
-
-    <h3>Items</h3>
-    <ul>
-        {% for item in order.order_items %}
-            <li>{{ item.quantity }}× {{ item.menu_item.name }} — ₦{{ "%.2f"|format(item.subtotal) }}</li>
-        {% endfor %}
-    </ul>
-
-    <p>Best regards,<br>Lauracious Foodies Delight</p>
-    """, order=order)
+    text_body, html_body = email_templates.render('invoice', order=order)
 
-    return send_email(to, subject, html_body, is_html=True)
\ No newline at end of file
+    return queue_email(to, subject, html_body, is_html=True, text_body=text_body)
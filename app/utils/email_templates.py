@@ -0,0 +1,101 @@
+import os
+import re
+import threading
+
+
+_STYLE_RE = re.compile(r'<style[^>]*>(.*?)</style>\s*', re.S | re.I)
+_RULE_RE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+_TAG_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)(\s[^<>]*?)?(/?)>')
+_CLASS_RE = re.compile(r'\sclass="([^"]*)"')
+_STYLE_ATTR_RE = re.compile(r'\sstyle="([^"]*)"')
+
+
+def inline_css(source):
+    """
+    Move the rules of <style> blocks into style="" attributes.
+
+    Supports the selectors our emails use: ``tag``, ``.class`` and
+    ``tag.class``. Declarations already written inline win over the
+    stylesheet, as in a browser.
+    """
+    rules = []
+    for block in _STYLE_RE.findall(source):
+        for selectors, declarations in _RULE_RE.findall(block):
+            declarations = '; '.join(d.strip() for d in declarations.split(';') if d.strip())
+            for selector in selectors.split(','):
+                tag, _, cls = selector.strip().partition('.')
+                rules.append((tag.lower() or None, cls or None, declarations))
+    if not rules:
+        return source
+
+    def apply(match):
+        tag, attrs, self_closing = match.group(1), match.group(2) or '', match.group(3)
+        class_match = _CLASS_RE.search(attrs)
+        classes = set(class_match.group(1).split()) if class_match else set()
+        styles = [decl for rule_tag, rule_cls, decl in rules
+                  if (rule_tag is None or rule_tag == tag.lower())
+                  and (rule_cls is None or rule_cls in classes)]
+        if not styles:
+            return match.group(0)
+
+        style_match = _STYLE_ATTR_RE.search(attrs)
+        if style_match:
+            styles.append(style_match.group(1).strip().rstrip(';'))
+            attrs = _STYLE_ATTR_RE.sub('', attrs)
+        return f'<{tag}{attrs} style="{"; ".join(styles)}"{self_closing}>'
+
+    return _TAG_RE.sub(apply, _STYLE_RE.sub('', source))
+
+
+class EmailTemplateRegistry:
+    """
+    Compiled email templates, built once per process.
+
+    Each email has an HTML variant (CSS inlined before compilation) and an
+    optional plain text variant, stored as templates/emails/<name>.html and
+    templates/emails/<name>.txt.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._templates = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = os.path.join(app.root_path, app.template_folder, 'emails')
+        self._templates = {}
+        # Plain text must not be HTML-escaped
+        self._text_env = app.jinja_env.overlay(autoescape=False, trim_blocks=True, lstrip_blocks=True)
+        app.extensions['email_templates'] = self
+
+    def _compile(self, filename):
+        path = os.path.join(self.folder, filename)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        if filename.endswith('.html'):
+            return self.app.jinja_env.from_string(inline_css(source))
+        return self._text_env.from_string(source)
+
+    def get(self, filename):
+        try:
+            return self._templates[filename]
+        except KeyError:
+            pass
+        with self._lock:
+            if filename not in self._templates:
+                self._templates[filename] = self._compile(filename)
+            return self._templates[filename]
+
+    def render(self, name, **context):
+        """Return (text_body, html_body); text_body is None without a .txt variant."""
+        html = self.get(f'{name}.html')
+        text = self.get(f'{name}.txt')
+        return (text.render(**context) if text else None), html.render(**context)
+
+
+email_templates = EmailTemplateRegistry()
@@ -0,0 +1,233 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func
+
+from app import db
+from app.models import Order, OrderItem, MenuItem, EtaStat
+from app.utils import status_log
+from app.utils.catalog import catalog_cache
+from app.utils.kitchen import kitchen_scheduler
+
+
+# --- batch job ---
+def group_means(keys, values, size):
+    """Mean and count of ``values`` per integer key in range(size), in one pass."""
+    sums = [0.0] * size
+    counts = [0] * size
+    for key, value in zip(keys, values):
+        sums[key] += value
+        counts[key] += 1
+    return [s / c if c else 0.0 for s, c in zip(sums, counts)], counts
+
+
+def _index(ids):
+    """Dense 0..n-1 keys for ``ids``; returns (keys, list of ids by key)."""
+    positions = {}
+    keys = [positions.setdefault(i, len(positions)) for i in ids]
+    return keys, list(positions)
+
+
+def _minutes(later, earlier):
+    return (later - earlier).total_seconds() / 60.0
+
+
+def training_rows(since=None, order_ids=None):
+    """
+    (confirmed_at, preparing_at, delivered_at, zone_id, bottleneck item id)
+    for orders delivered since ``since`` and/or among ``order_ids``. The bottleneck is the item with
+    the longest preparation_time, picked with a window function.
+    """
+    ranked = db.session.query(
+        OrderItem.order_id.label('order_id'),
+        OrderItem.menu_item_id.label('item_id'),
+        func.row_number().over(
+            partition_by=OrderItem.order_id,
+            order_by=(MenuItem.preparation_time.desc(), OrderItem.menu_item_id),
+        ).label('rank'),
+    )
+    if order_ids is not None:
+        ranked = ranked.filter(OrderItem.order_id.in_(order_ids))
+    ranked = ranked.join(MenuItem, MenuItem.id == OrderItem.menu_item_id).subquery()
+
+    query = db.session.query(
+        Order.confirmed_at, Order.preparing_at, Order.delivered_at,
+        Order.delivery_zone_id, ranked.c.item_id,
+    ).join(ranked, and_(ranked.c.order_id == Order.id, ranked.c.rank == 1))\
+     .filter(Order.delivered_at.isnot(None),
+             Order.confirmed_at.isnot(None), Order.preparing_at.isnot(None))
+    if since is not None:
+        query = query.filter(Order.delivered_at >= since)
+    return query.all()
+
+
+def fit(rows, item_means=None):
+    """
+    Learn the lookup tables from training rows:
+
+    - wait[hour]: minutes from confirmed to preparing, by hour of confirmation
+    - item[id]: minutes from preparing to delivered, by bottleneck item
+      (key 0 holds the mean over all orders)
+    - zone[id]: what is left after the item mean, by delivery zone (0 = none)
+
+    ``item_means`` ({item id: minutes}) are the item means to take zone
+    residuals against; a small batch folded into stored tables must not use
+    its own (often single-sample) item means, which leave no residual.
+    Items missing from it use the batch mean.
+
+    Returns {kind: {key: (minutes, samples)}}.
+    """
+    rows = [r for r in rows if r[0] <= r[1] <= r[2]]
+    if not rows:
+        return {'wait': {}, 'item': {}, 'zone': {}}
+
+    hours = [r[0].hour for r in rows]
+    waits = [min(_minutes(r[1], r[0]), 180.0) for r in rows]
+    cooks = [min(_minutes(r[2], r[1]), 240.0) for r in rows]
+    item_keys, item_ids = _index(r[4] for r in rows)
+    zone_keys, zone_ids = _index(r[3] or 0 for r in rows)
+
+    wait_mean, wait_n = group_means(hours, waits, 24)
+    item_mean, item_n = group_means(item_keys, cooks, len(item_ids))
+    baseline = [item_mean[k] for k in range(len(item_ids))]
+    if item_means:
+        baseline = [item_means.get(item_ids[k], baseline[k]) for k in range(len(item_ids))]
+    residuals = [cook - baseline[key] for cook, key in zip(cooks, item_keys)]
+    zone_mean, zone_n = group_means(zone_keys, residuals, len(zone_ids))
+
+    items = {item_ids[k]: (item_mean[k], item_n[k]) for k in range(len(item_ids))}
+    items[0] = (sum(cooks) / len(cooks), len(cooks))
+    return {
+        'wait': {h: (wait_mean[h], wait_n[h]) for h in range(24) if wait_n[h]},
+        'item': items,
+        'zone': {zone_ids[k]: (zone_mean[k], zone_n[k]) for k in range(len(zone_ids))},
+    }
+
+
+def rebuild(window_days=30):
+    """Refit the model from recent orders and replace the stored tables."""
+    tables = fit(training_rows(datetime.utcnow() - timedelta(days=window_days)))
+    EtaStat.query.delete()
+    db.session.add_all(EtaStat(kind=kind, key=key, minutes=float(minutes), samples=int(samples))
+                       for kind, table in tables.items()
+                       for key, (minutes, samples) in table.items())
+    # Deliveries logged so far are in the fit; the consumer picks up from here
+    status_log.seek('eta')
+    db.session.commit()
+    eta_model.clear()
+    return tables
+
+
+def merge(tables):
+    """Fold freshly fitted tables into the stored ones as running means."""
+    stored = {(row.kind, row.key): row for row in EtaStat.query}
+    for kind, table in tables.items():
+        for key, (minutes, samples) in table.items():
+            minutes, samples = float(minutes), int(samples)
+            row = stored.get((kind, key))
+            if row is None:
+                db.session.add(EtaStat(kind=kind, key=key, minutes=minutes, samples=samples))
+            else:
+                total = row.samples + samples
+                row.minutes = (row.minutes * row.samples + minutes * samples) / total
+                row.samples = total
+
+
+@status_log.consumer('eta')
+def learn(events):
+    """Learn from the orders delivered in a batch of status log events."""
+    delivered = {e.order_id for e in events if e.status == 'delivered'}
+    if delivered:
+        stored = {row.key: row.minutes for row in EtaStat.query.filter_by(kind='item')}
+        merge(fit(training_rows(order_ids=delivered), item_means=stored))
+
+
+# --- lookups ---
+class EtaModel:
+    """
+    Delivery time estimates from the EtaStat tables.
+
+    The tables are read once per ETA_REFRESH seconds per process; a lookup
+    is then a few dict reads plus the kitchen queue length, with fallbacks
+    to MenuItem.preparation_time for keys with fewer than ETA_MIN_SAMPLES.
+    """
+
+    def __init__(self, app=None):
+        self._tables = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.refresh = config.get('ETA_REFRESH', 60)
+        self.min_samples = config.get('ETA_MIN_SAMPLES', 5)
+        self.default_wait = config.get('ETA_DEFAULT_WAIT', 5)
+        self.default_travel = config.get('ETA_DEFAULT_TRAVEL', 15)
+        self.load_per_task = config.get('ETA_LOAD_MINUTES_PER_TASK', 0.5)
+        self.window_days = config.get('ETA_WINDOW_DAYS', 30)
+        app.extensions['eta_model'] = self
+
+    def clear(self):
+        with self._lock:
+            self._tables = None
+
+    def tables(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._tables is not None and now - self._loaded_at < self.refresh:
+                return self._tables
+        tables = {'wait': {}, 'item': {}, 'zone': {}}
+        for row in EtaStat.query.filter(EtaStat.samples >= self.min_samples):
+            tables.setdefault(row.kind, {})[row.key] = row.minutes
+        with self._lock:
+            self._tables, self._loaded_at = tables, now
+        return tables
+
+    def _cook(self, tables, item_ids):
+        """Minutes from starting to cook until delivered: the slowest item decides."""
+        learned = tables['item']
+        catalog = catalog_cache.get().items_by_id
+        cooks = []
+        for item_id in item_ids:
+            if item_id in learned:
+                cooks.append(learned[item_id])
+            else:
+                item = catalog.get(item_id)
+                prep = item.preparation_time if item and item.preparation_time else 15
+                cooks.append(prep + self.default_travel)
+        return max(cooks, default=learned.get(0, 15 + self.default_travel))
+
+    def _load(self):
+        # Items already waiting in this process's kitchen queue
+        return len(kitchen_scheduler.queue) * self.load_per_task
+
+    def estimated_delivery(self, order):
+        """When ``order`` should arrive, given its status and the current kitchen load."""
+        if order.delivered_at is not None:
+            return order.delivered_at
+        now = datetime.utcnow()
+        tables = self.tables()
+        minutes = self._cook(tables, [line.menu_item_id for line in order.items])
+        minutes += tables['zone'].get(order.delivery_zone_id or 0, 0)
+
+        if order.status == 'preparing' and order.preparing_at is not None:
+            start = order.preparing_at
+        else:
+            start = order.confirmed_at or order.created_at
+            minutes += tables['wait'].get(start.hour, self.default_wait) + self._load()
+        return max(start + timedelta(minutes=minutes), now)
+
+    def remaining_minutes(self, order):
+        return max(0, round((self.estimated_delivery(order) - datetime.utcnow()).total_seconds() / 60))
+
+    def zone_minutes(self, zone_id):
+        """Typical minutes for a new order to ``zone_id``, before its items are known."""
+        tables = self.tables()
+        return round(tables['wait'].get(datetime.utcnow().hour, self.default_wait) + self._load()
+                     + self._cook(tables, []) + tables['zone'].get(zone_id or 0, 0))
+
+
+eta_model = EtaModel()
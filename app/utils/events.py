@@ -0,0 +1,223 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import Order
+
+
+KITCHEN_CHANNEL = 'kitchen'
+
+logger = logging.getLogger(__name__)
+
+
+def order_channel(order_number):
+    return f'order:{order_number}'
+
+
+# --- brokers ---
+class LocalSubscription:
+    def __init__(self, broker, channels, maxsize):
+        self._broker = broker
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout=None):
+        """Next message as a dict, or None after ``timeout`` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker._unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    In-process broker: each subscriber gets a bounded queue. Only reaches
+    clients connected to this worker process.
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                pass        # slow client; it resyncs on reconnect
+
+    def subscribe(self, channels):
+        subscription = LocalSubscription(self, list(channels), self.maxsize)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout=None):
+        message = self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout or 0)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    def close(self):
+        self._pubsub.close()
+
+
+class RedisBroker:
+    """Redis pub/sub, shared by every worker process."""
+
+    def __init__(self, url):
+        import redis  # optional dependency, only needed for this backend
+        self._redis = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._redis.publish(channel, json.dumps(message))
+
+    def subscribe(self, channels):
+        pubsub = self._redis.pubsub()
+        pubsub.subscribe(*channels)
+        return RedisSubscription(pubsub)
+
+
+# --- bus ---
+class EventBus:
+    """Publishes order events to subscribers through the configured broker."""
+
+    def __init__(self, app=None):
+        self.broker = LocalBroker()
+        self.source = 'commit'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('EVENT_BROKER', 'local')
+        if backend == 'redis':
+            self.broker = RedisBroker(app.config['EVENT_BROKER_URL'])
+        else:
+            self.broker = LocalBroker(app.config.get('EVENT_QUEUE_SIZE', 100))
+        self.source = app.config.get('EVENT_SOURCE', 'commit')
+        app.extensions['event_bus'] = self
+
+    def publish(self, channel, event_name, data):
+        self.broker.publish(channel, {'event': event_name, 'data': data})
+
+    def subscribe(self, *channels):
+        return self.broker.subscribe(channels)
+
+
+event_bus = EventBus()
+
+
+def order_payload(order, old_status=None):
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'status': order.status,
+        'old_status': old_status,
+        'payment_status': order.payment_status,
+        'total_amount': order.total_amount,
+    }
+
+
+def stream(subscription, first=None, keepalive=15, max_duration=300, until=None):
+    """
+    Yield SSE frames from ``subscription``: ``first`` (if given), then every
+    message, with a comment line every ``keepalive`` seconds. Stops after
+    ``max_duration`` seconds (EventSource reconnects by itself) or once
+    ``until(message)`` is true.
+    """
+    deadline = time.monotonic() + max_duration
+    try:
+        yield 'retry: 3000\n\n'
+        if first is not None:
+            yield format_sse(first)
+            if until and until(first):
+                return
+        while time.monotonic() < deadline:
+            message = subscription.get(timeout=keepalive)
+            if message is None:
+                yield format_sse(comment='keepalive')
+                continue
+            yield format_sse(message)
+            if until and until(message):
+                return
+    finally:
+        subscription.close()
+
+
+def format_sse(message=None, comment=None):
+    """One Server-Sent Events frame."""
+    if comment is not None:
+        return f': {comment}\n\n'
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+
+
+# --- publish order changes once they are committed ---
+# (with EVENT_SOURCE=log, status_log_tailer publishes them instead)
+_PENDING_KEY = 'order_events'
+
+
+@event.listens_for(Order, 'after_insert')
+def _order_created(mapper, connection, target):
+    if event_bus.source != 'commit':
+        return
+    session = inspect(target).session
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, []).append(
+            ((KITCHEN_CHANNEL,), 'created', order_payload(target)))
+
+
+@event.listens_for(Order, 'after_update')
+def _order_status_changed(mapper, connection, target):
+    if event_bus.source != 'commit':
+        return
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+    session = inspect(target).session
+    if session is not None:
+        old_status = history.deleted[0] if history.deleted else None
+        session.info.setdefault(_PENDING_KEY, []).append(
+            ((order_channel(target.order_number), KITCHEN_CHANNEL), 'status',
+             order_payload(target, old_status)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_order_events(session):
+    for channels, event_name, data in session.info.pop(_PENDING_KEY, ()):
+        for channel in channels:
+            try:
+                event_bus.publish(channel, event_name, data)
+            except Exception:
+                # The commit already happened; clients resync on their next connect
+                logger.exception('Failed to publish %s on %s', event_name, channel)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_order_events(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,99 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePaystackHandler(BaseHTTPRequestHandler):
+    """
+    Answers /transaction/initialize and /transaction/verify/<ref> like the
+    Paystack API. ``latency`` and ``fail_rate`` on the server simulate a
+    slow or flaky gateway.
+    """
+
+    protocol_version = 'HTTP/1.1'     # keep-alive, like the real API
+    disable_nagle_algorithm = True    # headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True    # the client timed out and hung up
+
+    def _simulate(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_rate and random.random() < server.fail_rate:
+            self._reply(503, {'status': False, 'message': 'Service unavailable'})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not self._simulate():
+            return
+        if self.path != '/transaction/initialize':
+            self._reply(404, {'status': False, 'message': 'Not found'})
+            return
+        reference = body.get('reference')
+        with self.server.lock:
+            self.server.transactions[reference] = body
+        self._reply(200, {'status': True, 'message': 'Authorization URL created', 'data': {
+            'authorization_url': f'https://checkout.paystack.test/{reference}',
+            'access_code': reference,
+            'reference': reference,
+        }})
+
+    def do_GET(self):
+        if not self._simulate():
+            return
+        prefix = '/transaction/verify/'
+        if not self.path.startswith(prefix):
+            self._reply(404, {'status': False, 'message': 'Not found'})
+            return
+        reference = self.path[len(prefix):]
+        with self.server.lock:
+            transaction = self.server.transactions.get(reference)
+        if transaction is None and not self.server.auto_success:
+            self._reply(400, {'status': False, 'message': 'Transaction reference not found'})
+            return
+        self._reply(200, {'status': True, 'message': 'Verification successful', 'data': {
+            'reference': reference,
+            'status': 'success',
+            'amount': (transaction or {}).get('amount', 0),
+            'currency': 'NGN',
+        }})
+
+
+def make_server(host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0, auto_success=True):
+    """A fake Paystack API server (not started). ``port=0`` picks a free port."""
+    server = ThreadingHTTPServer((host, port), FakePaystackHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.auto_success = auto_success    # verify unknown references as paid
+    server.transactions = {}
+    server.requests = 0
+    server.lock = threading.Lock()
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a fake server on a daemon thread; returns (server, base_url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name='fake-paystack', daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f'http://{host}:{port}'
@@ -0,0 +1,195 @@
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import url_for
+from markupsafe import Markup, escape
+from PIL import Image, ImageOps
+from werkzeug.utils import secure_filename
+
+
+# Variant widths in pixels; images are never scaled up
+SIZES = {'thumb': 160, 'card': 480, 'detail': 960}
+
+# Output formats, best first; the last one is the <img> fallback every browser reads
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 55}),
+    'webp': ('WEBP', 'image/webp', {'quality': 75, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+# "<stem>-<hash>-<size>.jpg" is what image_url holds for processed uploads
+_VARIANT_RE = re.compile(r'^(?P<base>.+-[0-9a-f]{12})-(?P<size>%s)\.jpg$' % '|'.join(SIZES))
+
+
+def supported_formats():
+    """FORMATS this Pillow build can write (AVIF needs Pillow 11.2+ or the plugin)."""
+    Image.init()
+    return [ext for ext, (fmt, _, _) in FORMATS.items() if fmt in Image.SAVE]
+
+
+def variant_base(data, filename):
+    """Content-hashed base name for an upload: '<stem>-<sha256[:12]>'."""
+    stem = os.path.splitext(secure_filename(filename))[0].lower()[:60] or 'image'
+    return f'{stem}-{hashlib.sha256(data).hexdigest()[:12]}'
+
+
+def variant_name(base, size, ext='jpg'):
+    return f'{base}-{size}.{ext}'
+
+
+def is_variant(image_url):
+    """True if ``image_url`` names a processed variant rather than a raw upload."""
+    return bool(_VARIANT_RE.match(image_url or ''))
+
+
+def process_image(data, base, out_dir, formats=None):
+    """
+    Write every size/format variant of ``data`` to ``out_dir`` and return
+    the image_url to store (the JPEG card variant). EXIF orientation is
+    applied and metadata (EXIF, ICC, comments) is not copied. Runs in a
+    worker process, so it must only use its arguments.
+    """
+    formats = formats or supported_formats()
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    os.makedirs(out_dir, exist_ok=True)
+    for size, width in SIZES.items():
+        variant = image
+        if image.width > width:
+            variant = image.resize((width, round(image.height * width / image.width)),
+                                   Image.LANCZOS)
+        for ext in formats:
+            path = os.path.join(out_dir, variant_name(base, size, ext))
+            if os.path.exists(path):
+                continue        # same content hash, already written
+            fmt, _, options = FORMATS[ext]
+            out = variant
+            if fmt == 'JPEG' and out.mode == 'RGBA':
+                out = Image.new('RGB', out.size, (255, 255, 255))
+                out.paste(variant, mask=variant.getchannel('A'))
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            out.save(tmp_path, fmt, **options)
+            os.replace(tmp_path, path)
+    return variant_name(base, 'card')
+
+
+class ImagePipeline:
+    """
+    Turns menu image uploads into resized, recompressed variants on a
+    process pool, so the request only reads the upload and hashes it.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.out_dir = os.path.join(app.root_path, 'static', 'images', 'menu')
+        self.workers = app.config.get('IMAGE_WORKERS', 2)
+        self.formats = supported_formats()
+        app.add_template_global(menu_image)
+        app.extensions['image_pipeline'] = self
+
+    def _pool(self):
+        # Created on first use, so each server worker process gets its own
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers or None)
+        return self._executor
+
+    def submit_data(self, data, filename):
+        """Queue raw image bytes on the pool; returns a future for the image_url."""
+        base = variant_base(data, filename)
+        return self._pool().submit(process_image, data, base, self.out_dir, self.formats)
+
+    def submit(self, upload, on_done=None):
+        """
+        Queue an uploaded FileStorage for processing. Returns the future;
+        ``on_done(image_url)`` is called in this process when it finishes.
+        With IMAGE_WORKERS = 0 the image is processed inline. Raises
+        ValueError if the upload is not an image Pillow can read.
+        """
+        data = upload.read()
+        try:
+            with Image.open(io.BytesIO(data)) as probe:
+                probe.verify()      # header check only; cheap enough for the request
+        except (OSError, SyntaxError, ValueError) as e:
+            raise ValueError(f'{upload.filename} is not a supported image') from e
+        if not self.workers:
+            image_url = process_image(data, variant_base(data, upload.filename),
+                                      self.out_dir, self.formats)
+            if on_done is not None:
+                on_done(image_url)
+            return image_url
+
+        future = self.submit_data(data, upload.filename)
+        if on_done is not None:
+            def _callback(f):
+                try:
+                    on_done(f.result())
+                except Exception:
+                    self.app.logger.exception(f'Image processing failed for {upload.filename}')
+            future.add_done_callback(_callback)
+        return future
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+image_pipeline = ImagePipeline()
+
+
+def set_menu_item_image(item_id, image_url):
+    """Point a menu item at its processed image (runs outside the request)."""
+    from app import db
+    from app.models import MenuItem
+    with image_pipeline.app.app_context():
+        item = db.session.get(MenuItem, item_id)
+        if item is not None:
+            item.image_url = image_url
+            db.session.commit()
+
+
+# --- template helper ---
+def menu_image(image_url, alt='', size='card', sizes=None, **attrs):
+    """
+    <picture> for a menu image: AVIF/WebP sources plus a JPEG <img>, each
+    with a srcset over every variant width. Images saved before the
+    pipeline existed get a plain <img>. Extra keyword arguments become
+    attributes of the <img> (``class_`` for class).
+    """
+    attrs = {key.rstrip('_').replace('_', '-'): value for key, value in attrs.items()}
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    img_attrs = ''.join(f' {key}="{escape(value)}"' for key, value in attrs.items())
+
+    match = _VARIANT_RE.match(image_url or '')
+    if match is None:
+        src = url_for('static', filename=f'images/menu/{image_url}')
+        return Markup(f'<img src="{escape(src)}" alt="{escape(alt)}"{img_attrs}>')
+
+    base = match.group('base')
+    sizes = sizes or f'(max-width: {SIZES[size]}px) 100vw, {SIZES[size]}px'
+
+    def srcset(ext):
+        return ', '.join(
+            f"{url_for('static', filename='images/menu/' + variant_name(base, name, ext))} {width}w"
+            for name, width in SIZES.items())
+
+    sources = ''.join(
+        f'<source type="{FORMATS[ext][1]}" srcset="{escape(srcset(ext))}" sizes="{escape(sizes)}">'
+        for ext in image_pipeline.formats if ext != 'jpg')
+    src = url_for('static', filename='images/menu/' + variant_name(base, size))
+    return Markup(
+        f'<picture>{sources}<img src="{escape(src)}" srcset="{escape(srcset("jpg"))}" '
+        f'sizes="{escape(sizes)}" alt="{escape(alt)}"{img_attrs}></picture>')
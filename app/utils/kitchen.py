@@ -0,0 +1,252 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from app import db
+from app.models import Order, OrderItem, MenuItem, Category, DeliveryZone
+from app.utils.events import event_bus, KITCHEN_CHANNEL
+
+
+PrepTask = namedtuple(
+    'PrepTask',
+    'order_id order_number menu_item_id name quantity station prep_minutes start_by due_at'
+)
+
+# Orders in this status are waiting for the kitchen
+QUEUED_STATUS = 'confirmed'
+
+_MINUTES_RE = re.compile(r'\d+')
+
+
+def promise_minutes(eta, default):
+    """Upper bound of a zone ETA such as '20-30 mins', else ``default``."""
+    numbers = [int(n) for n in _MINUTES_RE.findall(eta or '')]
+    return max(numbers) if numbers else default
+
+
+def task_dict(task):
+    data = task._asdict()
+    data['start_by'] = task.start_by.isoformat()
+    data['due_at'] = task.due_at.isoformat()
+    return data
+
+
+class PrepQueue:
+    """
+    Prep tasks ordered by latest start time, overall and per station.
+
+    Binary heaps with lazy deletion: push, remove and reprioritize are
+    O(log n); a replaced or removed entry is only marked dead and is dropped
+    when it reaches the top, so peeking at the next task is amortized O(1).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._stations = {}     # station -> heap
+        self._entries = {}      # (order_id, menu_item_id) -> [priority, seq, task]
+        self._by_order = {}     # order_id -> set of keys
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def push(self, task, priority):
+        """Add ``task``, or move it to ``priority`` if it is already queued."""
+        key = (task.order_id, task.menu_item_id)
+        self._kill(key)
+        entry = [priority, next(self._seq), task]
+        self._entries[key] = entry
+        self._by_order.setdefault(task.order_id, set()).add(key)
+        heapq.heappush(self._heap, entry)
+        heapq.heappush(self._stations.setdefault(task.station, []), entry)
+
+    def remove_order(self, order_id):
+        for key in self._by_order.pop(order_id, ()):
+            self._kill(key)
+
+    def order_tasks(self, order_id):
+        return [self._entries[key][2] for key in self._by_order.get(order_id, ())]
+
+    def _kill(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[2] = None
+
+    def peek(self, station=None):
+        """Next task overall or for ``station``, or None."""
+        heap = self._heap if station is None else self._stations.get(station, [])
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def stations(self):
+        return [station for station in self._stations if self.peek(station) is not None]
+
+    def upcoming(self, limit=20, station=None):
+        """The next ``limit`` tasks in order (O(n log limit); for display lists)."""
+        heap = self._heap if station is None else self._stations.get(station, [])
+        return [entry[2] for entry in heapq.nsmallest(limit, (e for e in heap if e[2] is not None))]
+
+
+class KitchenScheduler:
+    """
+    Keeps a PrepQueue of the items of every confirmed order.
+
+    A task's priority is the latest time it can start and still be ready by
+    the promised time (order time + zone ETA, or KITCHEN_PROMISE_MINUTES),
+    less any rush added by staff. The queue is built from the database once,
+    then kept current by a thread listening to the kitchen event channel, so
+    with EVENT_BROKER=redis every worker sees the same changes. It is rebuilt
+    every KITCHEN_RESYNC_INTERVAL seconds in case a message was missed.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.queue = PrepQueue()
+        self._rush = {}         # order_id -> minutes moved forward
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.promise = app.config.get('KITCHEN_PROMISE_MINUTES', 30)
+        self.resync_interval = app.config.get('KITCHEN_RESYNC_INTERVAL', 300)
+        app.extensions['kitchen_scheduler'] = self
+
+    # --- loading ---
+    def _load_tasks(self, order_ids=None):
+        query = db.session.query(
+            Order.id, Order.order_number, Order.created_at, DeliveryZone.eta,
+            OrderItem.menu_item_id, OrderItem.quantity,
+            MenuItem.name, MenuItem.preparation_time, Category.name,
+        ).join(OrderItem, OrderItem.order_id == Order.id)\
+         .join(MenuItem, MenuItem.id == OrderItem.menu_item_id)\
+         .join(Category, Category.id == MenuItem.category_id)\
+         .outerjoin(DeliveryZone, DeliveryZone.id == Order.delivery_zone_id)\
+         .filter(Order.status == QUEUED_STATUS)
+        if order_ids is not None:
+            query = query.filter(Order.id.in_(order_ids))
+
+        tasks = []
+        for (order_id, number, created_at, eta, item_id, quantity,
+             name, prep, station) in query:
+            due_at = created_at + timedelta(minutes=promise_minutes(eta, self.promise))
+            prep = prep or 0
+            tasks.append(PrepTask(order_id, number, item_id, name, quantity, station,
+                                  prep, due_at - timedelta(minutes=prep), due_at))
+        db.session.rollback()
+        return tasks
+
+    def _priority(self, task):
+        return task.start_by - timedelta(minutes=self._rush.get(task.order_id, 0))
+
+    def rebuild(self):
+        """Reload the queue from every confirmed order."""
+        with self.app.app_context():
+            tasks = self._load_tasks()
+        queue = PrepQueue()
+        with self._lock:
+            queued = {task.order_id for task in tasks}
+            self._rush = {order_id: minutes for order_id, minutes in self._rush.items()
+                          if order_id in queued}
+            for task in tasks:
+                queue.push(task, self._priority(task))
+            self.queue = queue
+
+    def add_order(self, order_id):
+        with self.app.app_context():
+            tasks = self._load_tasks([order_id])
+        with self._lock:
+            self.queue.remove_order(order_id)
+            for task in tasks:
+                self.queue.push(task, self._priority(task))
+
+    def remove_order(self, order_id):
+        with self._lock:
+            self.queue.remove_order(order_id)
+            self._rush.pop(order_id, None)
+
+    def rush(self, order_id, minutes):
+        """Move an order's tasks ``minutes`` earlier (O(k log n) for k items)."""
+        with self._lock:
+            self._rush[order_id] = self._rush.get(order_id, 0) + minutes
+            for task in self.queue.order_tasks(order_id):
+                self.queue.push(task, self._priority(task))
+
+    def apply(self, message):
+        """Update the queue from a kitchen channel message."""
+        data = message['data']
+        if message['event'] in ('created', 'status'):
+            if data['status'] == QUEUED_STATUS:
+                self.add_order(data['id'])
+            elif data.get('old_status') == QUEUED_STATUS:
+                self.remove_order(data['id'])
+        elif message['event'] == 'rush':
+            self.rush(data['id'], data['minutes'])
+
+    # --- reading ---
+    def next_task(self, station=None):
+        with self._lock:
+            return self.queue.peek(station)
+
+    def board(self, limit=20):
+        """Next task overall and per station, plus the upcoming list."""
+        with self._lock:
+            return {
+                'next': self.queue.peek(),
+                'stations': {station: self.queue.peek(station) for station in self.queue.stations()},
+                'upcoming': self.queue.upcoming(limit),
+                'queued': len(self.queue),
+            }
+
+    # --- listener thread ---
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        # Subscribe before the first rebuild so no change falls in between
+        subscription = event_bus.subscribe(KITCHEN_CHANNEL)
+        self._thread = threading.Thread(target=self._run, args=(subscription,),
+                                        name='kitchen-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, subscription):
+        next_rebuild = 0
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() >= next_rebuild:
+                    try:
+                        self.rebuild()
+                    except Exception:
+                        self.app.logger.exception('Kitchen queue rebuild failed')
+                    next_rebuild = time.monotonic() + self.resync_interval
+                message = subscription.get(timeout=1)
+                if message is None:
+                    continue
+                try:
+                    self.apply(message)
+                except Exception:
+                    self.app.logger.exception('Kitchen scheduler failed to apply %s', message)
+        finally:
+            subscription.close()
+
+
+kitchen_scheduler = KitchenScheduler()
+
+
+def publish_rush(order_id, minutes):
+    """Ask every worker's scheduler to bring an order forward."""
+    event_bus.publish(KITCHEN_CHANNEL, 'rush', {'id': order_id, 'minutes': minutes})
@@ -0,0 +1,252 @@
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import event, func, or_, and_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import EmailOutbox
+from app.utils import email as email_utils
+
+
+class SMTPConnectionPool:
+    """
+    Small pool of logged-in SMTP connections.
+
+    Connections are reused across messages and checked with NOOP when they
+    have been idle for a while, so a batch pays for one TLS handshake and
+    one login instead of one per email.
+    """
+
+    def __init__(self, host, port, username, password, size=2, keepalive=30, debug=0, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.debug = debug
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        server.set_debuglevel(self.debug)
+        server.login(self.username, self.password)
+        return server
+
+    def _get(self):
+        try:
+            server, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+        if time.monotonic() - last_used > self.keepalive:
+            try:
+                if server.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected('NOOP failed')
+            except smtplib.SMTPException:
+                self._discard(server)
+                return self._connect()
+        return server
+
+    def _discard(self, server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def connection(self):
+        server = self._get()
+        try:
+            yield server
+        except smtplib.SMTPServerDisconnected:
+            self._discard(server)
+            raise
+        else:
+            try:
+                self._idle.put_nowait((server, time.monotonic()))
+            except queue.Full:
+                self._discard(server)
+
+    def close_all(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(server)
+
+
+class OutboxWorker:
+    """
+    Drains EmailOutbox on a pool of background threads.
+
+    Rows are claimed with a lease (claimed_by/locked_until), so several
+    threads or processes can drain the same table. Failed sends are retried
+    with exponential backoff; after EMAIL_OUTBOX_MAX_ATTEMPTS a row is
+    marked 'dead' and left for inspection.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pool = None
+        self._threads = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.workers = config.get('EMAIL_OUTBOX_WORKERS', 1)
+        self.batch_size = config.get('EMAIL_OUTBOX_BATCH_SIZE', 20)
+        self.max_attempts = config.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+        self.backoff = config.get('EMAIL_OUTBOX_BACKOFF', 30)
+        self.lease = config.get('EMAIL_OUTBOX_LEASE', 300)
+        self.poll_interval = config.get('EMAIL_OUTBOX_POLL_INTERVAL', 5)
+        self.pool = SMTPConnectionPool(
+            email_utils.SMTP_SERVER, email_utils.SMTP_PORT,
+            email_utils.GMAIL_USER, email_utils.GMAIL_PASS,
+            size=config.get('SMTP_POOL_SIZE', 2),
+            keepalive=config.get('SMTP_KEEPALIVE', 30),
+            debug=email_utils.SMTP_DEBUG,
+        )
+        app.extensions['outbox_worker'] = self
+
+    # --- thread pool ---
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'outbox-worker-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.pool.close_all()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                self.app.logger.exception('Outbox worker failed')
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    # --- draining ---
+    def run_once(self):
+        """Claim and deliver one batch. Returns the number of rows handled."""
+        with self.app.app_context():
+            rows = self._claim_batch()
+            if not rows:
+                return 0
+            self._deliver(rows)
+            db.session.commit()
+            return len(rows)
+
+    def _claim_batch(self):
+        now = datetime.utcnow()
+        token = uuid4().hex
+        ready = or_(
+            and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+            and_(EmailOutbox.status == 'sending', EmailOutbox.locked_until < now),
+        )
+        ids = [row.id for row in db.session.query(EmailOutbox.id).filter(ready)
+               .order_by(EmailOutbox.id).limit(self.batch_size)]
+        if not ids:
+            db.session.rollback()
+            return []
+
+        # Only rows still unclaimed are taken; another worker may have won some.
+        # Every claim counts as an attempt, so a message whose send crashed or
+        # hung the worker (its lease expired) cannot be retried forever.
+        EmailOutbox.query.filter(EmailOutbox.id.in_(ids), ready).update({
+            'status': 'sending',
+            'claimed_by': token,
+            'locked_until': now + timedelta(seconds=self.lease),
+            'attempts': func.coalesce(EmailOutbox.attempts, 0) + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        rows = EmailOutbox.query.filter_by(claimed_by=token, status='sending')\
+            .order_by(EmailOutbox.id).all()
+
+        abandoned = [row for row in rows if row.attempts > self.max_attempts]
+        for row in abandoned:
+            row.status = 'dead'
+            row.claimed_by = None
+            row.last_error = row.last_error or 'Lease expired on every attempt'
+            self.app.logger.error(f'Email {row.id} to {row.recipient} dead-lettered after '
+                                  f'{self.max_attempts} attempts that never finished')
+        if abandoned:
+            db.session.commit()
+        return [row for row in rows if row.status == 'sending']
+
+    def _deliver(self, rows):
+        try:
+            with self.pool.connection() as server:
+                for row in rows:
+                    try:
+                        msg = email_utils.build_message(row.recipient, row.subject, row.body,
+                                                        row.is_html, row.text_body)
+                        server.send_message(msg)
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except Exception as e:
+                        self._failed(row, e)
+                    else:
+                        row.status = 'sent'
+                        row.sent_at = datetime.utcnow()
+                        row.claimed_by = None
+        except Exception as e:
+            # Connection-level failure: everything not yet sent is retried
+            for row in rows:
+                if row.status == 'sending':
+                    self._failed(row, e)
+
+    def _failed(self, row, error):
+        # row.attempts was already counted when the row was claimed
+        row.last_error = str(error)
+        row.claimed_by = None
+        if row.attempts >= self.max_attempts:
+            row.status = 'dead'
+            self.app.logger.error(f'Email {row.id} to {row.recipient} dead-lettered: {error}')
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=self.backoff * 2 ** (row.attempts - 1))
+
+
+outbox_worker = OutboxWorker()
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_worker(session):
+    if session.info.pop('outbox_pending', False):
+        outbox_worker.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _clear_outbox_flag(session):
+    session.info.pop('outbox_pending', None)
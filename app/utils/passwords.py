@@ -0,0 +1,119 @@
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordServiceBusy(Exception):
+    """Too many password hashes queued; the caller should ask the user to retry."""
+
+
+def _method(pwhash):
+    # 'pbkdf2:sha256:600000$salt$hash' -> 'pbkdf2:sha256:600000'
+    return (pwhash or '').split('$', 1)[0]
+
+
+class PasswordService:
+    """
+    Hashes and verifies passwords on a bounded pool.
+
+    PASSWORD_HASH_METHOD is any Werkzeug method string with its cost, e.g.
+    'pbkdf2:sha256:600000' or 'scrypt:32768:8:1'. Hashes made with other
+    parameters still verify, and verify() returns a fresh hash for them so
+    they are upgraded on the next login.
+
+    At most PASSWORD_WORKERS hashes run at once (hashlib releases the GIL,
+    so threads use every core; PASSWORD_POOL=process is also available),
+    which leaves the other request threads CPU to serve pages during a
+    login burst. Past PASSWORD_QUEUE_LIMIT hashes running or waiting, new
+    ones raise PasswordServiceBusy at once instead of queueing. With
+    PASSWORD_WORKERS = 0 hashing runs inline on the calling thread.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.method = 'pbkdf2:sha256:600000'
+        self.workers = 0
+        self.pool_kind = 'thread'
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._dummy_hash = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.use_method(config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'))
+        self.workers = config.get('PASSWORD_WORKERS', 2)
+        self.pool_kind = config.get('PASSWORD_POOL', 'thread')
+        self.queue_limit = config.get('PASSWORD_QUEUE_LIMIT') or 8 * max(self.workers, 1)
+        self._slots = threading.BoundedSemaphore(self.queue_limit)
+        app.extensions['password_service'] = self
+
+    def use_method(self, method):
+        """Hash new passwords with ``method`` from now on."""
+        self.method = method
+        # Hash for unknown users, so they take as long to reject as a wrong
+        # password; also shows what method string Werkzeug writes for ours.
+        # Built here once, not by whichever request threads get there first.
+        self._dummy_hash = generate_password_hash(secrets.token_hex(16), method)
+
+    def _pool(self):
+        # Created on first use, so each server worker process gets its own
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    pool = ProcessPoolExecutor if self.pool_kind == 'process' else ThreadPoolExecutor
+                    self._executor = pool(max_workers=self.workers)
+        return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordServiceBusy()
+        try:
+            future = self._pool().submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        """Hash ``password`` with the configured method. May raise PasswordServiceBusy."""
+        return self._run(generate_password_hash, password, self.method)
+
+    def needs_rehash(self, pwhash):
+        return _method(pwhash) != _method(self.dummy_hash())
+
+    def dummy_hash(self):
+        return self._dummy_hash
+
+    def verify(self, pwhash, password):
+        """
+        Check ``password`` against ``pwhash`` (None for an unknown user).
+        Returns (ok, new_hash); new_hash is set when the password was right
+        but the stored hash uses old parameters. May raise PasswordServiceBusy.
+        """
+        if not pwhash or password is None:
+            self._run(check_password_hash, self.dummy_hash(), password or '')
+            return False, None
+        ok = self._run(check_password_hash, pwhash, password)
+        if ok and self.needs_rehash(pwhash):
+            try:
+                return True, self.hash(password)
+            except PasswordServiceBusy:
+                pass            # upgrade on a quieter login
+        return ok, None
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+password_service = PasswordService()
@@ -1,24 +1,181 @@
+import threading
+import time
+import uuid
+
+import requests
 from flask import url_for
-from paystackapi.paystack import Paystack
-from paystackapi.transaction import Transaction
-import uuid, os
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from app.models import db
 
-paystack = Paystack(secret_key=os.getenv('PAYSTACK_SECRET_KEY'))
+
+class GatewayError(Exception):
+    """Paystack rejected the call or answered with an error."""
+
+
+class GatewayUnavailable(GatewayError):
+    """Paystack could not be reached in time, or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing gateway for a while.
+
+    After ``threshold`` consecutive failures the breaker opens and calls fail
+    at once for ``reset_timeout`` seconds; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class PaystackClient:
+    """
+    Paystack REST client for the request path.
+
+    One keep-alive ``requests.Session`` is shared by all threads, every call
+    has connect/read timeouts, idempotent GETs are retried a bounded number
+    of times, and a circuit breaker fails fast while Paystack is down so a
+    slow gateway cannot hold every worker thread. Successful verifications
+    are cached, so repeated callback hits for a reference are answered
+    locally.
+    """
+
+    def __init__(self, app=None):
+        self.session = None
+        self.breaker = CircuitBreaker()
+        self._verified = {}     # reference -> (expires, data)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.secret_key = config.get('PAYSTACK_SECRET_KEY')
+        self.base_url = config.get('PAYSTACK_BASE_URL', 'https://api.paystack.co').rstrip('/')
+        self.timeout = (config.get('PAYSTACK_CONNECT_TIMEOUT', 3.05),
+                        config.get('PAYSTACK_READ_TIMEOUT', 10))
+        self.verify_ttl = config.get('PAYSTACK_VERIFY_CACHE_TTL', 600)
+        self.breaker = CircuitBreaker(config.get('PAYSTACK_BREAKER_THRESHOLD', 5),
+                                      config.get('PAYSTACK_BREAKER_RESET', 30))
+        self.session = self._make_session(config.get('PAYSTACK_RETRIES', 2),
+                                          config.get('PAYSTACK_POOL_SIZE', 10))
+        app.extensions['paystack_client'] = self
+
+    def _make_session(self, retries, pool_size):
+        # Connection failures are retried for any method (nothing was sent);
+        # read errors and 5xx only for GET, so an initialize is never doubled
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({'GET'}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Authorization'] = f'Bearer {self.secret_key}'
+        return session
+
+    def _request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            raise GatewayUnavailable('Paystack circuit breaker is open')
+        try:
+            resp = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            raise GatewayUnavailable(f'Paystack unreachable: {e}') from e
+        if resp.status_code >= 500:
+            self.breaker.record_failure()
+            raise GatewayUnavailable(f'Paystack returned {resp.status_code}')
+        self.breaker.record_success()
+
+        try:
+            body = resp.json()
+        except ValueError:
+            raise GatewayError(f'Unexpected Paystack response ({resp.status_code})')
+        if not body.get('status'):
+            raise GatewayError(body.get('message') or f'Paystack returned {resp.status_code}')
+        return body['data']
+
+    def initialize(self, reference, amount, email, callback_url, metadata=None):
+        """Start a transaction; returns Paystack's data (authorization_url, reference, ...)."""
+        return self._request('POST', '/transaction/initialize', json={
+            'reference': reference, 'amount': amount, 'email': email,
+            'callback_url': callback_url, 'metadata': metadata or {},
+        })
+
+    def verify(self, reference):
+        """Transaction data for ``reference``; successful results are cached."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._verified.get(reference)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+
+        data = self._request('GET', f'/transaction/verify/{reference}')
+        if data.get('status') == 'success':
+            with self._lock:
+                if len(self._verified) >= 10000:
+                    self._verified = {ref: entry for ref, entry in self._verified.items()
+                                      if entry[0] > now}
+                self._verified[reference] = (now + self.verify_ttl, data)
+        return data
+
+
+paystack_client = PaystackClient()
+
 
 def init_payment(order, user):
-    """Call Paystack initialise API -> return checkout URL"""
+    """Call Paystack initialise API -> return checkout URL, or None if the gateway failed"""
     ref = str(uuid.uuid4())                 # unique for this payment
     amount_kobo = int(order.total_amount * 100)  # Paystack wants kobo
-    resp = Transaction.initialize(
-        reference=ref,
-        amount=amount_kobo,
-        email=user.email,
-        callback_url=url_for('orders.paystack_callback', _external=True),
-        metadata={'order_id': order.id}     # we’ll need this in webhook
-    )
-    if resp['status']:
-        order.paystack_ref = ref            # save so we can verify later
-        db.session.commit()
-        return resp['data']['authorization_url']
-    return None
\ No newline at end of file
+    try:
+        data = paystack_client.initialize(
+            reference=ref,
+            amount=amount_kobo,
+            email=user.email,
+            callback_url=url_for('orders.paystack_callback', _external=True),
+            metadata={'order_id': order.id}     # we’ll need this in webhook
+        )
+    except GatewayError:
+        return None
+    order.paystack_ref = ref            # save so we can verify later
+    db.session.commit()
+    return data['authorization_url']
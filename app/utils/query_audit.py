@@ -0,0 +1,206 @@
+import os
+import re
+import sys
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from app import db
+
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class NPlusOneError(AssertionError):
+    """A request ran the same parameterized query too many times."""
+
+
+def normalize_sql(statement):
+    """Reduce a statement to its shape: literals and IN lists become ``?``."""
+    sql = _STRING_RE.sub('?', statement)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(?...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def query_origin():
+    """
+    Where the current statement came from: the template line if it was
+    triggered while rendering, otherwise the innermost frame in app code.
+    """
+    frame = sys._getframe(1)
+    app_frame = None
+    while frame is not None:
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            lineno = template.get_corresponding_lineno(frame.f_lineno)
+            return f'{template.name or template.filename}:{lineno}'
+        filename = frame.f_code.co_filename
+        if app_frame is None and filename.startswith(_APP_DIR) and filename != __file__:
+            app_frame = f'{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} ' \
+                        f'in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return app_frame or 'unknown'
+
+
+class QueryLog:
+    """Statements seen while recording, grouped by normalized SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.groups = {}        # normalized sql -> [count, origin of first repeat]
+
+    def record(self, statement):
+        self.count += 1
+        key = normalize_sql(statement)
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = [1, None]
+            return
+        group[0] += 1
+        if group[1] is None:
+            group[1] = query_origin()
+
+    def repeated(self, threshold):
+        """[(count, origin, sql)] for shapes run ``threshold`` times or more, worst first."""
+        hits = [(count, origin, sql) for sql, (count, origin) in self.groups.items()
+                if count >= threshold]
+        return sorted(hits, reverse=True)
+
+
+class QueryAuditor:
+    """
+    Development/test mode N+1 detector.
+
+    Every statement of a request is grouped by its normalized SQL; at the end
+    of the request any shape repeated QUERY_AUDIT_THRESHOLD times or more is
+    logged with the template line (or app code line) that first repeated it.
+    With QUERY_AUDIT_RAISE the request fails with NPlusOneError instead.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.threshold = 5
+        self.raise_errors = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        enabled = app.config.get('QUERY_AUDIT')
+        if enabled is None:
+            enabled = app.debug or app.testing
+        if not enabled:
+            return
+        self.app = app
+        self.threshold = app.config.get('QUERY_AUDIT_THRESHOLD', self.threshold)
+        self.raise_errors = app.config.get('QUERY_AUDIT_RAISE', app.testing)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['query_auditor'] = self
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            log = g.get('query_log')
+            if log is not None:
+                log.record(statement)
+
+    def _start_request(self):
+        g.query_log = QueryLog()
+
+    def _finish_request(self, response):
+        log = g.pop('query_log', None)
+        if log is None:
+            return response
+        repeated = log.repeated(self.threshold)
+        if repeated:
+            report = '\n'.join(f'  {count}x at {origin}: {sql[:200]}' for count, origin, sql in repeated)
+            message = f'Possible N+1 in {request.method} {request.path} ' \
+                      f'({log.count} queries):\n{report}'
+            if self.raise_errors:
+                raise NPlusOneError(message)
+            self.app.logger.warning(message)
+        return response
+
+
+query_auditor = QueryAuditor()
+
+
+# --- helpers for checks and tests ---
+@contextmanager
+def count_queries(engine=None):
+    """Record every statement run on ``engine`` inside the block; yields a QueryLog."""
+    engine = engine or db.engine
+    log = QueryLog()
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        log.record(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        yield log
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_execute)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with AssertionError if the block runs more than ``limit`` statements."""
+    with count_queries(engine) as log:
+        yield log
+    if log.count > limit:
+        shapes = '\n'.join(f'  {count}x {sql[:200]}' for count, _, sql in log.repeated(1))
+        raise AssertionError(f'{log.count} queries, expected at most {limit}:\n{shapes}')
+
+
+@contextmanager
+def assert_no_n_plus_one(threshold=5, engine=None):
+    """Fail with NPlusOneError if any query shape repeats ``threshold`` times in the block."""
+    with count_queries(engine) as log:
+        yield log
+    repeated = log.repeated(threshold)
+    if repeated:
+        raise NPlusOneError('\n'.join(f'{count}x at {origin}: {sql[:200]}'
+                                      for count, origin, sql in repeated))
+
+
+# Statement budgets for the main pages. They must hold whatever the number
+# of rows, so a loop that lazy-loads per row shows up as a failure.
+QUERY_BUDGETS = {
+    '/': 4,
+    '/menu/': 4,
+    '/orders/cart': 4,
+    '/orders/my_orders': 4,
+    '/admin/orders': 5,
+    '/admin/dashboard': 5,
+    '/admin/delivery/': 4,
+}
+
+
+def check_query_budgets(app, user, budgets=None):
+    """
+    GET each page as ``user`` and compare its statement count to its budget.
+    Returns [(path, status_code, queries, budget, repeated shapes)].
+    """
+    results = []
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    for path, budget in (budgets or QUERY_BUDGETS).items():
+        # Under an already pushed app context (CLI) requests share the session
+        # and g; start each one cold so cached objects do not hide queries
+        db.session.remove()
+        for name in list(g):
+            g.pop(name)
+        with count_queries() as log:
+            response = client.get(path)
+        results.append((path, response.status_code, log.count, budget, log.repeated(2)))
+    return results
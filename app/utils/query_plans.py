@@ -0,0 +1,78 @@
+from collections import namedtuple
+from datetime import date
+
+from sqlalchemy import text
+
+from app import db
+from app.models import (Order, OrderItem, MenuItem, CouponUsage, EmailOutbox,
+                        MenuItemDailySales, OrderStatusEvent)
+
+
+PlanProblem = namedtuple('PlanProblem', 'query detail')
+
+
+def _hot_queries():
+    """The statements on our request hot paths, with representative parameters."""
+    newest = (Order.created_at.desc(), Order.id.desc())
+    return {
+        'my_orders': db.select(Order).where(Order.customer_id == 1).order_by(*newest).limit(20),
+        'admin_orders': db.select(Order).order_by(*newest).limit(50),
+        'admin_orders_by_status': db.select(Order).where(Order.status == 'pending')
+            .order_by(*newest).limit(50),
+        'paystack_ref': db.select(Order).where(Order.paystack_ref == 'ref'),
+        'order_item_counts': db.select(OrderItem.order_id, db.func.sum(OrderItem.quantity))
+            .where(OrderItem.order_id.in_([1, 2, 3])).group_by(OrderItem.order_id),
+        'menu_item_sales': db.select(OrderItem.order_id, OrderItem.quantity)
+            .where(OrderItem.menu_item_id == 1),
+        'catalog_items': db.select(MenuItem).where(MenuItem.is_available == True)  # noqa: E712
+            .order_by(MenuItem.id),
+        'category_items': db.select(MenuItem.id).where(MenuItem.category_id == 1,
+                                                       MenuItem.is_available == True),  # noqa: E712
+        'popular_items': db.select(MenuItemDailySales.menu_item_id,
+                                   db.func.sum(MenuItemDailySales.order_count))
+            .where(MenuItemDailySales.day >= date(2026, 1, 1))
+            .group_by(MenuItemDailySales.menu_item_id),
+        'coupon_usage_per_user': db.select(db.func.count(CouponUsage.id))
+            .where(CouponUsage.coupon_id == 1, CouponUsage.user_id == 1),
+        'coupon_usage_by_order': db.select(CouponUsage.coupon_id).where(CouponUsage.order_id == 1),
+        'outbox_ready': db.select(EmailOutbox.id).where(EmailOutbox.status == 'pending')
+            .order_by(EmailOutbox.id).limit(20),
+        'order_status_history': db.select(OrderStatusEvent).where(OrderStatusEvent.order_id == 1)
+            .order_by(OrderStatusEvent.at, OrderStatusEvent.id),
+        'status_counts': db.select(OrderStatusEvent.status, db.func.count(OrderStatusEvent.id))
+            .where(OrderStatusEvent.at >= date(2026, 1, 1), OrderStatusEvent.at < date(2026, 2, 1))
+            .group_by(OrderStatusEvent.status),
+    }
+
+
+def _sqlite_problems(connection, sql):
+    # "SCAN t" without an index is a full table scan; "SCAN t USING INDEX"
+    # walks an index in order and stops at the LIMIT, which is fine.
+    rows = connection.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+    return [row[-1] for row in rows
+            if row[-1].startswith('SCAN ') and 'USING' not in row[-1]]
+
+
+def _postgres_problems(connection, sql):
+    # Tiny tables make a seq scan the cheapest plan, so take it off the table
+    # and report any scan the planner still cannot avoid.
+    connection.execute(text('SET LOCAL enable_seqscan = off'))
+    rows = connection.execute(text('EXPLAIN ' + sql)).all()
+    return [row[0].strip() for row in rows if 'Seq Scan' in row[0]]
+
+
+def full_scans():
+    """Run EXPLAIN on every hot query; return a PlanProblem per full table scan."""
+    problems = []
+    dialect = db.engine.dialect
+    explain = {'sqlite': _sqlite_problems, 'postgresql': _postgres_problems}.get(dialect.name)
+    if explain is None:
+        raise RuntimeError(f'No query plan check for the {dialect.name} dialect')
+
+    with db.engine.connect() as connection:
+        for name, statement in _hot_queries().items():
+            sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            with connection.begin():
+                for detail in explain(connection, sql):
+                    problems.append(PlanProblem(name, detail))
+    return problems
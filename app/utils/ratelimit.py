@@ -0,0 +1,195 @@
+import math
+import re
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_login import current_user
+
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+
+def parse_limit(limit):
+    """'5/minute', '100/hour', '10/30 seconds' -> (count, period in seconds)."""
+    match = _LIMIT_RE.match(limit)
+    if match is None:
+        raise ValueError(f'Bad rate limit {limit!r}; expected e.g. "5/minute"')
+    count, multiple, unit = match.groups()
+    return int(count), int(multiple or 1) * _PERIODS[unit]
+
+
+# --- stores ---
+# Buckets use GCRA, the token bucket kept as one number per key: the
+# "theoretical arrival time" (tat) at which the bucket will be full again.
+# A hit is allowed if it would not push tat more than burst * interval past
+# now. A missing key is a full bucket, so expired keys can simply be dropped.
+
+class MemoryRateLimitStore:
+    """
+    Buckets in a dict in this process (per worker). No lock: a dict get and
+    set are each atomic under the GIL, and the only race (two threads reading
+    the same tat) lets one extra request through, which is fine for
+    throttling.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._tat = {}
+        self._next_sweep = 0.0
+
+    def hit(self, key, interval, burst, cost=1):
+        """Take ``cost`` tokens from ``key``; returns 0 if allowed, else seconds to wait."""
+        now = time.monotonic()
+        tat = self._tat.get(key, now)
+        if tat < now:
+            tat = now
+        step = cost * interval
+        allow_at = tat + step - burst * interval
+        if allow_at > now:
+            return allow_at - now
+        self._tat[key] = tat + step
+        if len(self._tat) > self.max_keys and now >= self._next_sweep:
+            self._sweep(now)
+        return 0.0
+
+    def _sweep(self, now):
+        # Full buckets are the same as no bucket
+        self._next_sweep = now + 1.0
+        for key, tat in list(self._tat.items()):
+            if tat <= now:
+                self._tat.pop(key, None)
+
+    def clear(self):
+        self._tat.clear()
+
+
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local step = tonumber(ARGV[3]) * interval
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+local allow_at = tat + step - burst * interval
+if allow_at > now then return tostring(allow_at - now) end
+redis.call('SET', KEYS[1], tostring(tat + step), 'PX', math.ceil((tat + step - now) * 1000))
+return '0'
+"""
+
+
+class RedisRateLimitStore:
+    """Buckets shared by every worker, updated atomically by a Lua script."""
+
+    def __init__(self, url, prefix='rl:'):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(_GCRA_LUA)
+
+    def hit(self, key, interval, burst, cost=1):
+        return float(self._script(keys=[self.prefix + key], args=[interval, burst, cost]))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+# --- limiter ---
+class RateLimiter:
+    """
+    Token-bucket rate limits declared on views with ``rate_limit``.
+
+    RATELIMIT_BACKEND picks the store: 'memory' (per process, the default)
+    or 'redis' (RATELIMIT_REDIS_URL, shared by all workers). If the shared
+    store is unreachable requests are let through rather than refused.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.store = MemoryRateLimitStore()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        if app.config.get('RATELIMIT_BACKEND', 'memory') == 'redis':
+            self.store = RedisRateLimitStore(app.config['RATELIMIT_REDIS_URL'])
+        else:
+            self.store = MemoryRateLimitStore(app.config.get('RATELIMIT_MAX_KEYS', 100000))
+        app.extensions['rate_limiter'] = self
+
+    def hit(self, key, interval, burst, cost=1):
+        try:
+            return self.store.hit(key, interval, burst, cost)
+        except Exception:
+            current_app.logger.warning('Rate limit store unavailable; allowing %s', key,
+                                       exc_info=True)
+            return 0.0
+
+
+rate_limiter = RateLimiter()
+
+
+def _client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def _client_user():
+    if current_user.is_authenticated:
+        return f'user:{current_user.get_id()}'
+    return _client_ip()
+
+
+_KEY_FUNCS = {'ip': _client_ip, 'user': _client_user}
+
+
+def too_many_requests(retry_after):
+    """429 response with Retry-After; JSON for API/XHR callers."""
+    seconds = max(1, math.ceil(retry_after))
+    message = f'Too many requests. Please try again in {seconds} seconds.'
+    accept = request.accept_mimetypes
+    if (request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            or (accept.accept_json and not accept.accept_html)):
+        response = jsonify({'error': message, 'message': message, 'retry_after': seconds})
+    else:
+        response = current_app.response_class(message, mimetype='text/plain')
+    response.status_code = 429
+    response.headers['Retry-After'] = str(seconds)
+    return response
+
+
+def rate_limit(limit, key='ip', burst=None, methods=None, scope=None, cost=None):
+    """
+    Limit a view to ``limit`` requests (e.g. '5/minute') per ``key``: 'ip',
+    'user' (the logged-in user, else the IP) or a function returning a key
+    string (an empty key falls back to the IP). ``burst`` is the bucket size
+    (default: the count in ``limit``); ``methods`` restricts the limit to
+    those HTTP methods. ``cost`` is a function returning how many tokens
+    the request takes (default 1). Views sharing a ``scope`` and limit share
+    buckets. Stack several for several buckets; put them under
+    @login_required when keyed on the user.
+    """
+    count, period = parse_limit(limit)
+    interval = period / count
+    burst = burst or count
+    key_func = _KEY_FUNCS.get(key, key)
+    methods = frozenset(m.upper() for m in methods) if methods else None
+
+    def decorator(view):
+        prefix = f'{scope or view.__module__ + "." + view.__name__}:{count}/{period}:'
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if rate_limiter.enabled and (methods is None or request.method in methods):
+                tokens = max(1, cost()) if cost is not None else 1
+                wait = rate_limiter.hit(prefix + (key_func() or _client_ip()), interval, burst, tokens)
+                if wait > 0:
+                    return too_many_requests(wait)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,332 @@
+import difflib
+import re
+import threading
+
+from sqlalchemy import event, text
+
+from app import db
+from app.models import MenuItem, Category
+from app.utils.catalog import catalog_cache
+
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    """Split a search string into lower-cased word tokens."""
+    return [t.lower() for t in _TOKEN_RE.findall(query or '')]
+
+
+# --- backends ---
+class SearchBackend:
+    """
+    Base class for menu search backends.
+
+    Every method receives a SQLAlchemy connection so index writes can run in
+    the same transaction as the menu change that triggered them.
+    Only available menu items are indexed.
+    """
+    name = None
+
+    def create(self, connection):
+        pass
+
+    def is_empty(self, connection):
+        return False
+
+    def rebuild(self, connection):
+        pass
+
+    def index_item(self, connection, item_id):
+        pass
+
+    def remove_item(self, connection, item_id):
+        pass
+
+    def reindex_category(self, connection, category_id):
+        pass
+
+    def remove_category(self, connection, category_id):
+        pass
+
+    def search(self, connection, terms, category_id=None, limit=None, pool=None):
+        """
+        Return matching menu item ids, best match first.
+
+        With ``pool`` only the first ``pool`` matches are ranked, which keeps
+        typeahead latency flat when a prefix matches thousands of items.
+        """
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index, keyed by menu_item.id (rowid), ranked with bm25."""
+    name = 'sqlite'
+
+    _SELECT_DOCS = '''
+        SELECT m.id, m.name, coalesce(m.description, ''), coalesce(c.name, ''), m.category_id
+        FROM menu_item m LEFT JOIN category c ON c.id = m.category_id
+        WHERE m.is_available = 1
+    '''
+
+    def create(self, connection):
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS menu_search USING fts5("
+            "name, description, category, category_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+
+    def is_empty(self, connection):
+        return connection.execute(text('SELECT count(*) FROM menu_search')).scalar() == 0
+
+    def rebuild(self, connection):
+        connection.execute(text('DELETE FROM menu_search'))
+        connection.execute(text(
+            'INSERT INTO menu_search(rowid, name, description, category, category_id) '
+            + self._SELECT_DOCS
+        ))
+
+    def index_item(self, connection, item_id):
+        self.remove_item(connection, item_id)
+        connection.execute(text(
+            'INSERT INTO menu_search(rowid, name, description, category, category_id) '
+            + self._SELECT_DOCS + ' AND m.id = :id'
+        ), {'id': item_id})
+
+    def remove_item(self, connection, item_id):
+        connection.execute(text('DELETE FROM menu_search WHERE rowid = :id'), {'id': item_id})
+
+    def reindex_category(self, connection, category_id):
+        self.remove_category(connection, category_id)
+        connection.execute(text(
+            'INSERT INTO menu_search(rowid, name, description, category, category_id) '
+            + self._SELECT_DOCS + ' AND m.category_id = :cid'
+        ), {'cid': category_id})
+
+    def remove_category(self, connection, category_id):
+        connection.execute(text('DELETE FROM menu_search WHERE category_id = :cid'),
+                           {'cid': category_id})
+
+    def search(self, connection, terms, category_id=None, limit=None, pool=None):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # Weights: name, description, category
+        sql = ('SELECT rowid, bm25(menu_search, 10.0, 1.0, 3.0) AS score '
+               'FROM menu_search WHERE menu_search MATCH :match')
+        params = {'match': match, 'limit': limit or -1, 'pool': pool or -1}
+        if category_id:
+            sql += ' AND category_id = :cid'
+            params['cid'] = category_id
+        sql = f'SELECT rowid FROM ({sql} LIMIT :pool) ORDER BY score LIMIT :limit'
+        return [row[0] for row in connection.execute(text(sql), params)]
+
+
+class PostgresFTSBackend(SearchBackend):
+    """Postgres tsvector index with a GIN index, ranked with ts_rank."""
+    name = 'postgresql'
+
+    _SELECT_DOCS = '''
+        SELECT m.id, m.category_id,
+               setweight(to_tsvector('simple', m.name), 'A') ||
+               setweight(to_tsvector('simple', coalesce(c.name, '')), 'B') ||
+               setweight(to_tsvector('simple', coalesce(m.description, '')), 'C')
+        FROM menu_item m LEFT JOIN category c ON c.id = m.category_id
+        WHERE m.is_available
+    '''
+
+    def create(self, connection):
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS menu_search ('
+            'item_id INTEGER PRIMARY KEY, category_id INTEGER, document TSVECTOR NOT NULL)'
+        ))
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_menu_search_document ON menu_search USING GIN (document)'
+        ))
+
+    def is_empty(self, connection):
+        return connection.execute(text('SELECT count(*) FROM menu_search')).scalar() == 0
+
+    def rebuild(self, connection):
+        connection.execute(text('DELETE FROM menu_search'))
+        connection.execute(text(
+            'INSERT INTO menu_search(item_id, category_id, document) ' + self._SELECT_DOCS
+        ))
+
+    def index_item(self, connection, item_id):
+        self.remove_item(connection, item_id)
+        connection.execute(text(
+            'INSERT INTO menu_search(item_id, category_id, document) '
+            + self._SELECT_DOCS + ' AND m.id = :id'
+        ), {'id': item_id})
+
+    def remove_item(self, connection, item_id):
+        connection.execute(text('DELETE FROM menu_search WHERE item_id = :id'), {'id': item_id})
+
+    def reindex_category(self, connection, category_id):
+        self.remove_category(connection, category_id)
+        connection.execute(text(
+            'INSERT INTO menu_search(item_id, category_id, document) '
+            + self._SELECT_DOCS + ' AND m.category_id = :cid'
+        ), {'cid': category_id})
+
+    def remove_category(self, connection, category_id):
+        connection.execute(text('DELETE FROM menu_search WHERE category_id = :cid'),
+                           {'cid': category_id})
+
+    def search(self, connection, terms, category_id=None, limit=None, pool=None):
+        sql = '''
+            SELECT item_id, ts_rank(document, q) AS score
+            FROM menu_search, to_tsquery('simple', :query) AS q
+            WHERE document @@ q
+        '''
+        params = {'query': ' & '.join(f'{term}:*' for term in terms),
+                  'limit': limit, 'pool': pool}
+        if category_id:
+            sql += ' AND category_id = :cid'
+            params['cid'] = category_id
+        sql = f'SELECT item_id FROM ({sql} LIMIT :pool) AS hits ORDER BY score DESC LIMIT :limit'
+        return [row[0] for row in connection.execute(text(sql), params)]
+
+
+class LikeBackend(SearchBackend):
+    """Fallback for databases without a full-text engine (unranked LIKE scan)."""
+    name = 'like'
+
+    def search(self, connection, terms, category_id=None, limit=None, pool=None):
+        query = MenuItem.query.with_entities(MenuItem.id).filter_by(is_available=True)
+        for term in terms:
+            query = query.filter(MenuItem.name.ilike(f'%{term}%') |
+                                 MenuItem.description.ilike(f'%{term}%'))
+        if category_id:
+            query = query.filter_by(category_id=category_id)
+        if limit:
+            query = query.limit(limit)
+        return [row[0] for row in query.all()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresFTSBackend,
+    'like': LikeBackend,
+}
+
+
+# --- public API ---
+class MenuSearch:
+    """
+    Ranked, prefix-matching menu search with a typo-tolerant fallback.
+
+    When a query finds nothing, each term is corrected against the words of
+    the cached catalog (difflib) and the search is retried once.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.suggest_pool = 500
+        self._vocab_lock = threading.Lock()
+        self._vocab = None
+        self._vocab_generation = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend_name = app.config.get('SEARCH_BACKEND')
+        self.suggest_pool = app.config.get('SEARCH_SUGGEST_POOL', self.suggest_pool)
+        with app.app_context():
+            if not backend_name:
+                backend_name = db.engine.dialect.name
+            self.backend = BACKENDS.get(backend_name, LikeBackend)()
+            with db.engine.begin() as connection:
+                self.backend.create(connection)
+                if self.backend.is_empty(connection):
+                    self.backend.rebuild(connection)
+        app.extensions['menu_search'] = self
+
+    def rebuild(self):
+        with db.engine.begin() as connection:
+            self.backend.create(connection)
+            self.backend.rebuild(connection)
+
+    def search(self, query, category_id=None, limit=None, pool=None):
+        """Return ranked menu item ids for a free-text query."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        connection = db.session.connection()
+        ids = self.backend.search(connection, terms, category_id, limit, pool)
+        if ids:
+            return ids
+
+        corrected = self._correct(terms)
+        if corrected != terms:
+            ids = self.backend.search(connection, corrected, category_id, limit, pool)
+        return ids
+
+    def suggest(self, query, limit=5):
+        """Typeahead: best matching available items from the catalog cache."""
+        catalog = catalog_cache.get()
+        ids = self.search(query, limit=limit, pool=self.suggest_pool)
+        return [catalog.items_by_id[i] for i in ids if i in catalog.items_by_id]
+
+    # --- typo handling ---
+    def _correct(self, terms):
+        vocab = self._vocabulary()
+        corrected = []
+        for term in terms:
+            bucket = vocab.get(term[0], ())
+            if term in bucket:
+                corrected.append(term)
+                continue
+            match = difflib.get_close_matches(term, bucket, n=1, cutoff=0.75)
+            corrected.append(match[0] if match else term)
+        return corrected
+
+    def _vocabulary(self):
+        """Catalog words bucketed by first letter, rebuilt per catalog generation."""
+        catalog = catalog_cache.get()
+        if self._vocab is not None and self._vocab_generation == catalog.generation:
+            return self._vocab
+
+        with self._vocab_lock:
+            words = set()
+            for item in catalog.items:
+                words.update(tokenize(item.name))
+                words.update(tokenize(item.description))
+            for category in catalog.categories:
+                words.update(tokenize(category.name))
+
+            vocab = {}
+            for word in words:
+                vocab.setdefault(word[0], []).append(word)
+            self._vocab = vocab
+            self._vocab_generation = catalog.generation
+            return vocab
+
+
+menu_search = MenuSearch()
+
+
+# --- keep the index in step with the menu (same transaction) ---
+@event.listens_for(MenuItem, 'after_insert')
+@event.listens_for(MenuItem, 'after_update')
+def _index_menu_item(mapper, connection, target):
+    if menu_search.backend is not None:
+        menu_search.backend.index_item(connection, target.id)
+
+
+@event.listens_for(MenuItem, 'after_delete')
+def _unindex_menu_item(mapper, connection, target):
+    if menu_search.backend is not None:
+        menu_search.backend.remove_item(connection, target.id)
+
+
+@event.listens_for(Category, 'after_update')
+def _reindex_category(mapper, connection, target):
+    if menu_search.backend is not None:
+        menu_search.backend.reindex_category(connection, target.id)
+
+
+@event.listens_for(Category, 'after_delete')
+def _unindex_category(mapper, connection, target):
+    if menu_search.backend is not None:
+        menu_search.backend.remove_category(connection, target.id)
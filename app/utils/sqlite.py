@@ -0,0 +1,99 @@
+import re
+import threading
+
+from sqlalchemy import event
+
+from app import db
+
+
+_WRITE_RE = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b', re.I)
+_HOLDS_LOCK = 'sqlite_write_lock'
+
+
+def pragma_settings(config):
+    """The PRAGMAs for the SQLite production profile, from app config."""
+    pragmas = {
+        'busy_timeout': config.get('SQLITE_BUSY_TIMEOUT', 5000),
+        'synchronous': config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': config.get('SQLITE_CACHE_SIZE', -20000),
+        'mmap_size': config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    }
+    if config.get('SQLITE_WAL', True):
+        pragmas['journal_mode'] = 'WAL'
+    return pragmas
+
+
+def set_pragmas(engine, pragmas):
+    """Run ``pragmas`` on every new DBAPI connection of ``engine``."""
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # journal_mode first: it is persistent and the others are per connection
+            if 'journal_mode' in pragmas:
+                cursor.execute(f"PRAGMA journal_mode={pragmas['journal_mode']}")
+            for name, value in pragmas.items():
+                if name != 'journal_mode':
+                    cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+class WriteQueue:
+    """
+    Serializes write transactions within this process.
+
+    A connection takes the lock on its first INSERT/UPDATE/DELETE and keeps
+    it until the transaction ends, so threads queue here instead of spinning
+    on "database is locked". SELECTs never take the lock; with WAL they run
+    alongside the single writer. Other processes are still arbitrated by
+    SQLite itself through busy_timeout.
+    """
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        # 'commit' fires just before the COMMIT itself; busy_timeout covers the gap
+        event.listen(engine, 'commit', self._release_connection)
+        event.listen(engine, 'rollback', self._release_connection)
+        # A connection returned to the pool mid-transaction is rolled back there
+        event.listen(engine, 'checkin', self._release_record)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get(_HOLDS_LOCK) or not _WRITE_RE.match(statement):
+            return
+        # On timeout carry on unserialized and let busy_timeout arbitrate
+        conn.info[_HOLDS_LOCK] = self._lock.acquire(timeout=self.timeout)
+
+    def _release(self, info):
+        if info.pop(_HOLDS_LOCK, False):
+            self._lock.release()
+
+    def _release_connection(self, conn):
+        self._release(conn.info)
+
+    def _release_record(self, dbapi_connection, connection_record):
+        self._release(connection_record.info)
+
+
+def configure_engine(engine, config):
+    """Apply the production profile to a SQLite engine; returns its WriteQueue or None."""
+    pragmas = pragma_settings(config)
+    set_pragmas(engine, pragmas)
+    if not config.get('SQLITE_WRITE_QUEUE', True):
+        return None
+    queue = WriteQueue(timeout=pragmas['busy_timeout'] / 1000.0)
+    queue.attach(engine)
+    return queue
+
+
+def init_sqlite(app):
+    """Configure the app's engine when DATABASE_URL points at SQLite."""
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    app.extensions['sqlite_write_queue'] = configure_engine(engine, app.config)
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta, date
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import (Order, OrderItem, User, MenuItem,
+                        StatCounter, OrderDailyStat, MenuItemDailySales)
+
+
+# --- low-level upsert ---
+def _bump(connection, model, keys, deltas):
+    """Add ``deltas`` to the row identified by ``keys``, creating it if needed."""
+    table = model.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table)
+        stmt = insert.values(**keys, **deltas).on_conflict_do_update(
+            index_elements=list(keys),
+            set_={col: table.c[col] + insert.excluded[col] for col in deltas},
+        )
+        connection.execute(stmt)
+        return
+
+    result = connection.execute(
+        table.update()
+        .where(*[table.c[k] == v for k, v in keys.items()])
+        .values({col: table.c[col] + delta for col, delta in deltas.items()})
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**keys, **deltas))
+
+
+def bump_counter(connection, name, delta=1):
+    _bump(connection, StatCounter, {'name': name}, {'value': delta})
+
+
+def record_order(connection, day, status, total, sign=1):
+    """Count one order (sign=-1 removes it) in the daily and global rollups."""
+    _bump(connection, OrderDailyStat, {'day': day, 'status': status},
+          {'order_count': sign, 'revenue': sign * (total or 0.0)})
+    bump_counter(connection, 'orders', sign)
+    bump_counter(connection, f'orders:{status}', sign)
+
+
+def record_item_sales(connection, day, lines, sign=1):
+    """Count order lines given as (menu_item_id, quantity) pairs."""
+    for menu_item_id, quantity in lines:
+        _bump(connection, MenuItemDailySales, {'day': day, 'menu_item_id': menu_item_id},
+              {'order_count': sign, 'quantity': sign * quantity})
+
+
+def _order_day(connection, order_id):
+    table = Order.__table__
+    created_at = connection.execute(
+        db.select(table.c.created_at).where(table.c.id == order_id)
+    ).scalar()
+    return (created_at or datetime.utcnow()).date()
+
+
+# --- reads ---
+def counters():
+    """All global counters as a dict, in one query."""
+    return dict(db.session.query(StatCounter.name, StatCounter.value).all())
+
+
+def popular_items(days=30, limit=6):
+    """[(menu_item_id, order_count)] over the last ``days`` days, best first."""
+    since = datetime.utcnow().date() - timedelta(days=days)
+    order_count = db.func.sum(MenuItemDailySales.order_count)
+    return db.session.query(MenuItemDailySales.menu_item_id, order_count)\
+        .filter(MenuItemDailySales.day >= since)\
+        .group_by(MenuItemDailySales.menu_item_id)\
+        .having(order_count > 0)\
+        .order_by(order_count.desc())\
+        .limit(limit)\
+        .all()
+
+
+# --- full rebuild ---
+def _as_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def rebuild_stats():
+    """Recompute every rollup from the orders, users and menu tables."""
+    for model in (StatCounter, OrderDailyStat, MenuItemDailySales):
+        db.session.query(model).delete(synchronize_session=False)
+
+    day = db.func.date(Order.created_at)
+    daily = db.session.query(day, Order.status, db.func.count(Order.id),
+                             db.func.coalesce(db.func.sum(Order.total_amount), 0.0))\
+        .group_by(day, Order.status).all()
+
+    totals = {'orders': 0, 'users': User.query.count(), 'menu_items': MenuItem.query.count()}
+    for _, status, count, _ in daily:
+        totals['orders'] += count
+        totals[f'orders:{status}'] = totals.get(f'orders:{status}', 0) + count
+
+    sales = db.session.query(day, OrderItem.menu_item_id, db.func.count(OrderItem.id),
+                             db.func.sum(OrderItem.quantity))\
+        .join(Order, Order.id == OrderItem.order_id)\
+        .group_by(day, OrderItem.menu_item_id).all()
+
+    if totals:
+        db.session.execute(db.insert(StatCounter),
+                           [{'name': k, 'value': v} for k, v in totals.items()])
+    if daily:
+        db.session.execute(db.insert(OrderDailyStat), [
+            {'day': _as_date(d), 'status': status, 'order_count': count, 'revenue': revenue}
+            for d, status, count, revenue in daily
+        ])
+    if sales:
+        db.session.execute(db.insert(MenuItemDailySales), [
+            {'day': _as_date(d), 'menu_item_id': item_id, 'order_count': count, 'quantity': qty}
+            for d, item_id, count, qty in sales
+        ])
+    db.session.commit()
+
+
+def init_stats(app):
+    """Build the rollups on first start against a database that has none."""
+    with app.app_context():
+        if StatCounter.query.first() is None:
+            rebuild_stats()
+
+
+# --- incremental maintenance ---
+@event.listens_for(Order, 'after_insert')
+def _order_inserted(mapper, connection, target):
+    record_order(connection, target.created_at.date(), target.status, target.total_amount)
+
+
+@event.listens_for(Order, 'after_update')
+def _order_updated(mapper, connection, target):
+    state = inspect(target)
+    status = state.attrs.status.history
+    total = state.attrs.total_amount.history
+    if not (status.has_changes() or total.has_changes()):
+        return
+
+    old_status = status.deleted[0] if status.deleted else target.status
+    old_total = total.deleted[0] if total.deleted else target.total_amount
+    day = target.created_at.date()
+    record_order(connection, day, old_status, old_total, sign=-1)
+    record_order(connection, day, target.status, target.total_amount)
+
+
+@event.listens_for(Order, 'after_delete')
+def _order_deleted(mapper, connection, target):
+    record_order(connection, target.created_at.date(), target.status, target.total_amount, sign=-1)
+
+
+# Bulk inserts (create_order) call record_item_sales themselves
+@event.listens_for(OrderItem, 'after_insert')
+def _order_item_inserted(mapper, connection, target):
+    record_item_sales(connection, _order_day(connection, target.order_id),
+                      [(target.menu_item_id, target.quantity)])
+
+
+@event.listens_for(OrderItem, 'after_delete')
+def _order_item_deleted(mapper, connection, target):
+    record_item_sales(connection, _order_day(connection, target.order_id),
+                      [(target.menu_item_id, target.quantity)], sign=-1)
+
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    bump_counter(connection, 'users')
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    bump_counter(connection, 'users', -1)
+
+
+@event.listens_for(MenuItem, 'after_insert')
+def _menu_item_inserted(mapper, connection, target):
+    bump_counter(connection, 'menu_items')
+
+
+@event.listens_for(MenuItem, 'after_delete')
+def _menu_item_deleted(mapper, connection, target):
+    bump_counter(connection, 'menu_items', -1)
@@ -0,0 +1,203 @@
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, func, inspect
+
+from app import db
+from app.models import Order, OrderStatusEvent, ConsumerOffset
+from app.utils.events import event_bus, order_channel, KITCHEN_CHANNEL
+
+
+ORDER_STATUSES = ('pending', 'confirmed', 'preparing', 'delivered', 'cancelled')
+
+
+# --- writing: same transaction as the status change ---
+def record(connection, order_id, status, old_status=None):
+    connection.execute(OrderStatusEvent.__table__.insert().values(
+        order_id=order_id, status=status, old_status=old_status, at=datetime.utcnow()))
+
+
+@event.listens_for(Order, 'after_insert')
+def _order_inserted(mapper, connection, target):
+    record(connection, target.id, target.status or 'pending')
+
+
+@event.listens_for(Order, 'after_update')
+def _order_updated(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if history.has_changes():
+        record(connection, target.id, target.status,
+               history.deleted[0] if history.deleted else None)
+
+
+# --- reading ---
+def order_history(order_id):
+    """Every status the order went through, oldest first (index on order_id, at)."""
+    return OrderStatusEvent.query.filter_by(order_id=order_id)\
+        .order_by(OrderStatusEvent.at, OrderStatusEvent.id).all()
+
+
+def status_counts(since, until=None):
+    """How many orders entered each status in [since, until), in one GROUP BY query."""
+    until = until or datetime.utcnow()
+    counts = dict.fromkeys(ORDER_STATUSES, 0)
+    counts.update(db.session.query(OrderStatusEvent.status, func.count(OrderStatusEvent.id))
+                  .filter(OrderStatusEvent.at >= since, OrderStatusEvent.at < until)
+                  .group_by(OrderStatusEvent.status).all())
+    return counts
+
+
+def latest_event_id():
+    return db.session.query(func.max(OrderStatusEvent.id)).scalar() or 0
+
+
+def _settled(query, settle):
+    # A transaction that took a lower id may commit after a higher one; only
+    # read events old enough that every earlier id is visible.
+    if settle:
+        query = query.filter(OrderStatusEvent.at <= datetime.utcnow() - timedelta(seconds=settle))
+    return query
+
+
+# --- consumers: projections that follow the log from a high-water mark ---
+CONSUMERS = {}
+
+
+def consumer(name):
+    """Register ``handler(events)`` as the consumer ``name``."""
+    def decorator(handler):
+        CONSUMERS[name] = handler
+        return handler
+    return decorator
+
+
+def _offset(name):
+    """The consumer's ConsumerOffset row, locked until commit (created at 0)."""
+    offset = db.session.execute(
+        db.select(ConsumerOffset).where(ConsumerOffset.name == name).with_for_update()
+    ).scalar_one_or_none()
+    if offset is None:
+        offset = ConsumerOffset(name=name, last_event_id=0)
+        db.session.add(offset)
+    return offset
+
+
+def seek(name, event_id=None):
+    """
+    Move consumer ``name`` to ``event_id`` (default: the newest event), e.g.
+    after its projection was rebuilt from scratch. Commits with the caller.
+    """
+    _offset(name).last_event_id = latest_event_id() if event_id is None else event_id
+
+
+def consume(name, batch_size=500, settle=None):
+    """
+    Apply the next batch of events to consumer ``name``. The handler's
+    writes and the new offset commit together, so a batch is applied once.
+    Returns the number of events handled.
+    """
+    if settle is None:
+        settle = current_app.config.get('EVENT_LOG_SETTLE', 2)
+    offset = _offset(name)
+    events = _settled(OrderStatusEvent.query.filter(OrderStatusEvent.id > offset.last_event_id),
+                      settle).order_by(OrderStatusEvent.id).limit(batch_size).all()
+    if events:
+        CONSUMERS[name](events)
+        offset.last_event_id = events[-1].id
+    db.session.commit()
+    return len(events)
+
+
+def run_consumers(batch_size=500, settle=None):
+    """Bring every consumer up to date. Returns {name: events handled}."""
+    handled = {}
+    for name in CONSUMERS:
+        handled[name] = 0
+        while True:
+            count = consume(name, batch_size, settle)
+            handled[name] += count
+            if count < batch_size:
+                break
+    return handled
+
+
+# --- live fan-out ---
+class StatusLogTailer:
+    """
+    Publishes logged status changes to the event bus from every worker
+    (EVENT_SOURCE=log). Each process follows the log from the newest id it
+    saw at start-up, so SSE clients on any worker hear about changes made on
+    the others, even with the in-process broker.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.mark = None
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.poll_interval = app.config.get('EVENT_LOG_POLL', 1.0)
+        self.settle = app.config.get('EVENT_LOG_SETTLE', 2)
+        app.extensions['status_log_tailer'] = self
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='status-log-tailer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception:
+                self.app.logger.exception('Status log tailer failed')
+            self._stop.wait(self.poll_interval)
+
+    def poll_once(self):
+        with self.app.app_context():
+            if self.mark is None:
+                self.mark = latest_event_id()
+            rows = _settled(db.session.query(
+                OrderStatusEvent.id, OrderStatusEvent.order_id, OrderStatusEvent.status,
+                OrderStatusEvent.old_status,
+                Order.order_number, Order.payment_status, Order.total_amount,
+            ).outerjoin(Order, Order.id == OrderStatusEvent.order_id)
+             .filter(OrderStatusEvent.id > self.mark), self.settle)\
+                .order_by(OrderStatusEvent.id).limit(500).all()
+            db.session.rollback()
+
+        for (event_id, order_id, status, old_status,
+             order_number, payment_status, total_amount) in rows:
+            self.mark = event_id
+            if order_number is None:
+                continue        # order deleted since
+            data = {
+                'id': order_id,
+                'order_number': order_number,
+                'status': status,
+                'old_status': old_status,
+                'payment_status': payment_status,
+                'total_amount': total_amount,
+            }
+            if old_status is None:
+                event_bus.publish(KITCHEN_CHANNEL, 'created', data)
+            else:
+                event_bus.publish(order_channel(order_number), 'status', data)
+                event_bus.publish(KITCHEN_CHANNEL, 'status', data)
+        return len(rows)
+
+
+status_log_tailer = StatusLogTailer()
@@ -0,0 +1,255 @@
+import hashlib
+import hmac
+import json
+import threading
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import func, or_, and_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Order, PaystackEvent
+from app.utils.email import send_order_status_update_email
+
+
+def valid_signature(secret, body, signature):
+    """Check Paystack's x-paystack-signature (HMAC-SHA512 of the raw body)."""
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def event_key(payload, body):
+    """
+    Stable key for an event, so a retried delivery maps to the same inbox
+    row: the event type plus Paystack's transaction id (or reference), or a
+    hash of the body when neither is present.
+    """
+    data = payload.get('data') or {}
+    ident = data.get('id') or data.get('reference')
+    if ident is None:
+        return 'sha256:' + hashlib.sha256(body).hexdigest()
+    return f"{payload.get('event')}:{ident}"
+
+
+def store_event(payload, body):
+    """Save a verified event to the inbox. Returns False if it was already there."""
+    data = payload.get('data') or {}
+    db.session.add(PaystackEvent(
+        event_key=event_key(payload, body),
+        event_type=payload.get('event') or 'unknown',
+        reference=data.get('reference'),
+        payload=body.decode('utf-8'),
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    webhook_worker.wake()
+    return True
+
+
+def confirm_payment(reference):
+    """
+    Mark the order paid by Paystack ``reference``, at most once.
+
+    The claim is a conditional UPDATE on payment_status, which every
+    database serializes (a SELECT ... FOR UPDATE takes no lock on SQLite),
+    so when the webhook worker and the browser callback race only one of
+    them changes the order and queues the email. The status itself is then
+    set through the ORM so the status log, stats and live events see it.
+    Returns (order or None, whether this call changed it).
+    """
+    table = Order.__table__
+    claimed = db.session.execute(
+        table.update()
+        .where(table.c.paystack_ref == reference,
+               or_(table.c.payment_status.is_(None), table.c.payment_status != 'paid'))
+        .values(payment_status='paid', payment_method='paystack')
+    ).rowcount == 1
+
+    order = db.session.execute(
+        db.select(Order).where(Order.paystack_ref == reference)
+        .execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+    if not claimed or order is None:
+        return order, False
+
+    old_status = order.status
+    order.status = 'confirmed'
+    order.updated_at = datetime.utcnow()
+    # Queued in the outbox, so it commits (or rolls back) with the order
+    send_order_status_update_email(order, old_status, 'confirmed')
+    return order, True
+
+
+# --- event handlers: must be safe to run more than once ---
+def _charge_success(data):
+    order, _ = confirm_payment(data['reference'])
+    if order is None:
+        # Retried with backoff in case the reference is not saved yet
+        raise LookupError(f"No order for reference {data['reference']}")
+
+
+HANDLERS = {
+    'charge.success': _charge_success,
+}
+
+
+class WebhookWorker:
+    """
+    Processes the PaystackEvent inbox on background threads.
+
+    Rows are claimed with a lease like EmailOutbox, and each event runs in
+    its own transaction. Failures are retried with exponential backoff; after
+    PAYSTACK_WEBHOOK_MAX_ATTEMPTS a row is marked 'dead'. Event types without
+    a handler are marked done.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._threads = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.workers = config.get('PAYSTACK_WEBHOOK_WORKERS', 1)
+        self.batch_size = config.get('PAYSTACK_WEBHOOK_BATCH_SIZE', 20)
+        self.max_attempts = config.get('PAYSTACK_WEBHOOK_MAX_ATTEMPTS', 8)
+        self.backoff = config.get('PAYSTACK_WEBHOOK_BACKOFF', 15)
+        self.lease = config.get('PAYSTACK_WEBHOOK_LEASE', 120)
+        self.poll_interval = config.get('PAYSTACK_WEBHOOK_POLL_INTERVAL', 5)
+        app.extensions['webhook_worker'] = self
+
+    # --- thread pool ---
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'webhook-worker-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                self.app.logger.exception('Webhook worker failed')
+                processed = 0
+            if not processed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    # --- processing ---
+    def run_once(self):
+        """Claim and process one batch. Returns the number of events handled."""
+        with self.app.app_context():
+            ids = self._claim_batch()
+            for event_id in ids:
+                self._process(event_id)
+            return len(ids)
+
+    def _claim_batch(self):
+        now = datetime.utcnow()
+        token = uuid4().hex
+        ready = or_(
+            and_(PaystackEvent.status == 'pending', PaystackEvent.next_attempt_at <= now),
+            and_(PaystackEvent.status == 'processing', PaystackEvent.locked_until < now),
+        )
+        ids = [row.id for row in db.session.query(PaystackEvent.id).filter(ready)
+               .order_by(PaystackEvent.id).limit(self.batch_size)]
+        if not ids:
+            db.session.rollback()
+            return []
+
+        # Only rows still unclaimed are taken; another worker may have won some.
+        # Every claim counts as an attempt, so an event whose handler crashed
+        # or hung the worker (its lease expired) is not retried forever.
+        PaystackEvent.query.filter(PaystackEvent.id.in_(ids), ready).update({
+            'status': 'processing',
+            'claimed_by': token,
+            'locked_until': now + timedelta(seconds=self.lease),
+            'attempts': func.coalesce(PaystackEvent.attempts, 0) + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        rows = db.session.query(PaystackEvent.id, PaystackEvent.attempts)\
+            .filter_by(claimed_by=token, status='processing').order_by(PaystackEvent.id).all()
+
+        abandoned = [row.id for row in rows if row.attempts > self.max_attempts]
+        if abandoned:
+            PaystackEvent.query.filter(PaystackEvent.id.in_(abandoned)).update({
+                'status': 'dead',
+                'claimed_by': None,
+                'last_error': func.coalesce(PaystackEvent.last_error, 'Lease expired on every attempt'),
+            }, synchronize_session=False)
+            db.session.commit()
+            self.app.logger.error(f'Webhook events {abandoned} dead-lettered after '
+                                  f'{self.max_attempts} attempts that never finished')
+        return [row.id for row in rows if row.attempts <= self.max_attempts]
+
+    def _process(self, event_id):
+        row = db.session.get(PaystackEvent, event_id)
+        try:
+            handler = HANDLERS.get(row.event_type)
+            if handler is not None:
+                handler(json.loads(row.payload).get('data') or {})
+            row.status = 'done'
+            row.processed_at = datetime.utcnow()
+            row.claimed_by = None
+            row.last_error = None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._failed(db.session.get(PaystackEvent, event_id), e)
+            db.session.commit()
+
+    def _failed(self, row, error):
+        # row.attempts was already counted when the row was claimed
+        row.last_error = str(error)
+        row.claimed_by = None
+        if row.attempts >= self.max_attempts:
+            row.status = 'dead'
+            self.app.logger.error(f'Paystack event {row.id} ({row.event_key}) dead-lettered: {error}')
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=self.backoff * 2 ** (row.attempts - 1))
+
+
+webhook_worker = WebhookWorker()
+
+
+def replay_events(since, until, event_type=None):
+    """Queue every event received in [since, until) for processing again."""
+    query = PaystackEvent.query.filter(PaystackEvent.received_at >= since,
+                                       PaystackEvent.received_at < until)
+    if event_type:
+        query = query.filter(PaystackEvent.event_type == event_type)
+    count = query.update({
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': datetime.utcnow(),
+        'claimed_by': None,
+        'locked_until': None,
+    }, synchronize_session=False)
+    db.session.commit()
+    return count
@@ -7,10 +7,36 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 load_dotenv()
 
+
+def engine_options(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS: pool sizing from DB_POOL_* variables."""
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1'],
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 1800),  # seconds
+    }
+    # In-memory SQLite uses a per-thread pool that takes no sizing options
+    if ':memory:' not in database_uri and database_uri != 'sqlite://':
+        options.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE') or 5),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW') or 10),
+            pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT') or 30),  # seconds
+        )
+    return options
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'lauracious-foodies-secret-key-2024'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///lauracious_foodies.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+
+    # SQLite production profile (ignored for other databases)
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', 'true').lower() in ['true', 'on', '1']
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)  # ms
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -20000)  # negative = KiB
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    SQLITE_WRITE_QUEUE = os.environ.get('SQLITE_WRITE_QUEUE', 'true').lower() in ['true', 'on', '1']
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 
     # Email configuration
@@ -21,9 +47,107 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
 
+    # Email outbox worker pool (0 workers = drain with `flask drain_outbox`)
+    EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS') or 1)
+    EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE') or 20)
+    EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS') or 5)
+    EMAIL_OUTBOX_BACKOFF = int(os.environ.get('EMAIL_OUTBOX_BACKOFF') or 30)  # seconds, doubles per attempt
+    EMAIL_OUTBOX_POLL_INTERVAL = int(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL') or 5)
+    # A claimed row is retried by another worker once its lease runs out
+    EMAIL_OUTBOX_LEASE = int(os.environ.get('EMAIL_OUTBOX_LEASE') or 300)  # seconds
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE') or 2)
+    SMTP_KEEPALIVE = int(os.environ.get('SMTP_KEEPALIVE') or 30)  # seconds idle before a NOOP check
+
+    # Paystack API client; webhook events go to an inbox table and are applied
+    # by a worker pool (0 workers = process with `flask drain-webhooks`)
+    PAYSTACK_SECRET_KEY = os.environ.get('PAYSTACK_SECRET_KEY')
+    PAYSTACK_BASE_URL = os.environ.get('PAYSTACK_BASE_URL') or 'https://api.paystack.co'
+    PAYSTACK_CONNECT_TIMEOUT = float(os.environ.get('PAYSTACK_CONNECT_TIMEOUT') or 3.05)  # seconds
+    PAYSTACK_READ_TIMEOUT = float(os.environ.get('PAYSTACK_READ_TIMEOUT') or 10)
+    PAYSTACK_RETRIES = int(os.environ.get('PAYSTACK_RETRIES') or 2)
+    PAYSTACK_POOL_SIZE = int(os.environ.get('PAYSTACK_POOL_SIZE') or 10)
+    PAYSTACK_BREAKER_THRESHOLD = int(os.environ.get('PAYSTACK_BREAKER_THRESHOLD') or 5)  # failures
+    PAYSTACK_BREAKER_RESET = int(os.environ.get('PAYSTACK_BREAKER_RESET') or 30)  # seconds open
+    PAYSTACK_VERIFY_CACHE_TTL = int(os.environ.get('PAYSTACK_VERIFY_CACHE_TTL') or 600)
+    PAYSTACK_WEBHOOK_WORKERS = int(os.environ.get('PAYSTACK_WEBHOOK_WORKERS') or 1)
+    PAYSTACK_WEBHOOK_BATCH_SIZE = int(os.environ.get('PAYSTACK_WEBHOOK_BATCH_SIZE') or 20)
+    PAYSTACK_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('PAYSTACK_WEBHOOK_MAX_ATTEMPTS') or 8)
+    PAYSTACK_WEBHOOK_BACKOFF = int(os.environ.get('PAYSTACK_WEBHOOK_BACKOFF') or 15)  # seconds, doubles per attempt
+
+    # Kitchen prep queue: promise used when the zone has no ETA; full reload interval
+    KITCHEN_SCHEDULER = os.environ.get('KITCHEN_SCHEDULER', 'true').lower() in ['true', 'on', '1']
+    KITCHEN_PROMISE_MINUTES = int(os.environ.get('KITCHEN_PROMISE_MINUTES') or 30)
+    KITCHEN_RESYNC_INTERVAL = int(os.environ.get('KITCHEN_RESYNC_INTERVAL') or 300)  # seconds
+
+    # Delivery ETA model: lookup tables rebuilt by `flask rebuild-eta-model`
+    ETA_WINDOW_DAYS = int(os.environ.get('ETA_WINDOW_DAYS') or 30)
+    ETA_MIN_SAMPLES = int(os.environ.get('ETA_MIN_SAMPLES') or 5)
+    ETA_REFRESH = int(os.environ.get('ETA_REFRESH') or 60)  # seconds between table reloads
+    ETA_DEFAULT_TRAVEL = int(os.environ.get('ETA_DEFAULT_TRAVEL') or 15)  # minutes, until learned
+    ETA_LOAD_MINUTES_PER_TASK = float(os.environ.get('ETA_LOAD_MINUTES_PER_TASK') or 0.5)
+
     # Upload configuration
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS') or 2)  # 0 = process uploads inline
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+    # Menu catalog cache: marker file shared by all workers (defaults to instance/)
+    CATALOG_MARKER_PATH = os.environ.get('CATALOG_MARKER_PATH')
+
+    # Menu search backend: 'sqlite' (FTS5), 'postgresql' (tsvector) or 'like';
+    # defaults to the database dialect
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND')
+    SEARCH_SUGGEST_POOL = int(os.environ.get('SEARCH_SUGGEST_POOL') or 500)
+
+    # Server-side cart: 'sql' (default), 'redis' or 'memory'
+    CART_BACKEND = os.environ.get('CART_BACKEND') or 'sql'
+    CART_REDIS_URL = os.environ.get('CART_REDIS_URL') or 'redis://localhost:6379/0'
+    CART_TTL = int(os.environ.get('CART_TTL') or 7 * 24 * 3600)  # seconds
+
+    # Live order updates (Server-Sent Events): 'local' broker or 'redis'
+    EVENT_BROKER = os.environ.get('EVENT_BROKER') or 'local'
+    EVENT_BROKER_URL = os.environ.get('EVENT_BROKER_URL') or 'redis://localhost:6379/1'
+    SSE_KEEPALIVE = int(os.environ.get('SSE_KEEPALIVE') or 15)  # seconds
+    SSE_MAX_DURATION = int(os.environ.get('SSE_MAX_DURATION') or 300)  # seconds, clients reconnect
+    # Where order events come from: 'commit' (the committing process publishes)
+    # or 'log' (every process tails the order status log)
+    EVENT_SOURCE = os.environ.get('EVENT_SOURCE') or 'commit'
+    EVENT_LOG_POLL = float(os.environ.get('EVENT_LOG_POLL') or 1.0)  # seconds
+    # Log readers skip events younger than this, so a slow transaction that
+    # took a lower id has committed before the high-water mark passes it
+    EVENT_LOG_SETTLE = int(os.environ.get('EVENT_LOG_SETTLE') or 2)  # seconds
+
+    # Rate limits on login, coupon, search and cart endpoints: 'memory' buckets
+    # (per worker) or 'redis' (shared by all workers)
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND') or 'memory'
+    RATELIMIT_REDIS_URL = os.environ.get('RATELIMIT_REDIS_URL') or 'redis://localhost:6379/2'
+    # Buckets are keyed on the client IP. Behind a reverse proxy every request
+    # comes from the proxy, so set this to the number of proxies in front of
+    # the app to take the IP (and scheme/host) from their X-Forwarded-* headers.
+    # Leave it at 0 when clients reach the app directly: the headers are then
+    # client-supplied and would let anyone pick their own bucket.
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS') or 0)
+
+    # Password hashing: any Werkzeug method with its cost ('pbkdf2:sha256:600000',
+    # 'scrypt:32768:8:1'); older hashes are upgraded at login. At most
+    # PASSWORD_WORKERS hashes run at once ('thread' or 'process' pool, 0 = inline);
+    # past PASSWORD_QUEUE_LIMIT waiting, sign-ins get a 503 and retry
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    PASSWORD_POOL = os.environ.get('PASSWORD_POOL') or 'thread'
+    PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS') or max(1, (os.cpu_count() or 2) // 2))
+    PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT') or 0)  # 0 = 8 per worker
+
+    # Order listings (keyset pages)
+    ADMIN_ORDERS_PAGE_SIZE = int(os.environ.get('ADMIN_ORDERS_PAGE_SIZE') or 50)
+    MY_ORDERS_PAGE_SIZE = int(os.environ.get('MY_ORDERS_PAGE_SIZE') or 20)
+
+    # N+1 query auditor; on by default only in debug/testing
+    QUERY_AUDIT = os.environ.get('QUERY_AUDIT', '').lower() in ['true', 'on', '1'] or None
+    QUERY_AUDIT_THRESHOLD = int(os.environ.get('QUERY_AUDIT_THRESHOLD') or 5)
+
+    # Coupon definitions cache (seconds); 0 disables caching
+    COUPON_CACHE_TTL = int(os.environ.get('COUPON_CACHE_TTL') or 30)
     
 
@@ -0,0 +1,28 @@
+"""order listing indexes
+
+Revision ID: 4f2a9c1e7b3d
+Revises: 83b1497a1725
+Create Date: 2026-10-18 09:12:41.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a9c1e7b3d'
+down_revision = '83b1497a1725'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_order_status_created_at_id', ['status', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_status_created_at_id')
+        batch_op.drop_index('ix_order_created_at_id')
@@ -0,0 +1,50 @@
+"""indexes for hot query paths
+
+Revision ID: 5b8c3e0d7a14
+Revises: 9d4e7a2b61c8
+Create Date: 2026-10-18 11:26:03.918350
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8c3e0d7a14'
+down_revision = '9d4e7a2b61c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('menu_item', schema=None) as batch_op:
+        batch_op.create_index('ix_menu_item_available_id', ['is_available', 'id'], unique=False)
+        batch_op.create_index('ix_menu_item_category_id_available', ['category_id', 'is_available'], unique=False)
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_customer_id_created_at_id', ['customer_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.create_index('ix_order_item_order_id', ['order_id', 'menu_item_id', 'quantity'], unique=False)
+        batch_op.create_index('ix_order_item_menu_item_id', ['menu_item_id', 'order_id', 'quantity'], unique=False)
+
+    with op.batch_alter_table('coupon_usage', schema=None) as batch_op:
+        batch_op.create_index('ix_coupon_usage_coupon_id_user_id', ['coupon_id', 'user_id'], unique=False)
+        batch_op.create_index('ix_coupon_usage_order_id', ['order_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('coupon_usage', schema=None) as batch_op:
+        batch_op.drop_index('ix_coupon_usage_order_id')
+        batch_op.drop_index('ix_coupon_usage_coupon_id_user_id')
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_item_menu_item_id')
+        batch_op.drop_index('ix_order_item_order_id')
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_customer_id_created_at_id')
+
+    with op.batch_alter_table('menu_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_menu_item_category_id_available')
+        batch_op.drop_index('ix_menu_item_available_id')
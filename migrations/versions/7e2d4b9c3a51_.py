@@ -0,0 +1,30 @@
+"""order status timestamps
+
+Revision ID: 7e2d4b9c3a51
+Revises: 5b8c3e0d7a14
+Create Date: 2026-10-18 15:41:09.218377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2d4b9c3a51'
+down_revision = '5b8c3e0d7a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('confirmed_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('preparing_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('delivered_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_column('delivered_at')
+        batch_op.drop_column('preparing_at')
+        batch_op.drop_column('confirmed_at')
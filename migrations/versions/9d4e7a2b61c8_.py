@@ -0,0 +1,26 @@
+"""delivery zone aliases
+
+Revision ID: 9d4e7a2b61c8
+Revises: 4f2a9c1e7b3d
+Create Date: 2026-10-18 10:02:17.553904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e7a2b61c8'
+down_revision = '4f2a9c1e7b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('delivery_zone', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('aliases', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('delivery_zone', schema=None) as batch_op:
+        batch_op.drop_column('aliases')
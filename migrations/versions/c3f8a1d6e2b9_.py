@@ -0,0 +1,32 @@
+"""wider password hashes
+
+Revision ID: c3f8a1d6e2b9
+Revises: 7e2d4b9c3a51
+Create Date: 2026-10-18 19:02:47.530164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a1d6e2b9'
+down_revision = '7e2d4b9c3a51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+                              existing_type=sa.String(length=128),
+                              type_=sa.String(length=256),
+                              existing_nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+                              existing_type=sa.String(length=256),
+                              type_=sa.String(length=128),
+                              existing_nullable=True)
@@ -1,4 +1,6 @@
 import os
+import time
+import click
 import requests
 from app import create_app, db
 from app.models import User, Category, MenuItem
@@ -15,6 +17,534 @@ def init_db():
     db.create_all()
     print('Database initialized.')
 
+@app.cli.command()
+def rebuild_search_index():
+    """Rebuild the full-text menu search index."""
+    from app.utils.search import menu_search
+    menu_search.rebuild()
+    print('Search index rebuilt.')
+
+@app.cli.command()
+def purge_carts():
+    """Delete server-side carts older than CART_TTL."""
+    from app.utils.cart import purge_expired_carts
+    deleted = purge_expired_carts(app.config['CART_TTL'])
+    print(f'Purged {deleted} stale cart lines.')
+
+@app.cli.command()
+def drain_outbox():
+    """Deliver all pending outbox emails, then exit."""
+    from app.utils.outbox import outbox_worker
+    sent = 0
+    while True:
+        processed = outbox_worker.run_once()
+        if not processed:
+            break
+        sent += processed
+    outbox_worker.pool.close_all()
+    print(f'Processed {sent} outbox emails.')
+
+def _drain_webhooks():
+    from app.utils.webhooks import webhook_worker
+    handled = 0
+    while True:
+        processed = webhook_worker.run_once()
+        if not processed:
+            return handled
+        handled += processed
+
+@app.cli.command()
+def drain_webhooks():
+    """Process all ready Paystack webhook events, then exit."""
+    print(f'Processed {_drain_webhooks()} webhook events.')
+
+@app.cli.command()
+@click.option('--since', type=click.DateTime(), required=True, help='Received at or after (UTC).')
+@click.option('--until', type=click.DateTime(), default=None, help='Received before (UTC); default now.')
+@click.option('--type', 'event_type', default=None, help='Only this event type, e.g. charge.success.')
+def replay_webhooks(since, until, event_type):
+    """Reprocess the Paystack webhook events received in a time range."""
+    from datetime import datetime
+    from app.utils.webhooks import replay_events
+    queued = replay_events(since, until or datetime.utcnow(), event_type)
+    print(f'Queued {queued} events; processed {_drain_webhooks()}.')
+
+@app.cli.command()
+@click.option('--count', default=500, help='Emails to render per variant.')
+def bench_email_templates(count):
+    """Compare per-email render cost: render_template_string vs precompiled registry."""
+    from types import SimpleNamespace
+    from flask import render_template_string
+    from app.utils.email_templates import email_templates
+
+    menu_item = SimpleNamespace(name='Jollof Rice')
+    order = SimpleNamespace(
+        order_number='LFD20260101ABCDEF012', total_amount=12500.0, status='confirmed',
+        payment_method='paystack', delivery_address='12 Airport Road, GRA',
+        customer=SimpleNamespace(first_name='Ada', email='ada@example.com'),
+        order_items=[SimpleNamespace(quantity=2, menu_item=menu_item, subtotal=3000.0)] * 5,
+    )
+    with open(os.path.join(email_templates.folder, 'order_status_update.html')) as f:
+        source = f.read()
+
+    with app.test_request_context():
+        start = time.perf_counter()
+        for _ in range(count):
+            render_template_string(source, order=order, old_status='confirmed', new_status='preparing')
+        per_string = (time.perf_counter() - start) / count
+
+        email_templates.render('order_status_update', order=order, old_status='confirmed', new_status='preparing')
+        start = time.perf_counter()
+        for _ in range(count):
+            email_templates.render('order_status_update', order=order, old_status='confirmed', new_status='preparing')
+        per_registry = (time.perf_counter() - start) / count
+
+    print(f'render_template_string: {per_string * 1e6:8.1f} us/email')
+    print(f'registry (html + text): {per_registry * 1e6:8.1f} us/email')
+    print(f'speedup: {per_string / per_registry:.1f}x')
+
+@app.cli.command()
+@click.option('--count', default=2000, help='Evaluations per scenario.')
+def bench_coupons(count):
+    """Time coupon evaluation: cold (one query per check) vs cached."""
+    from app.models import Coupon
+    from app.utils.coupons import coupon_engine
+
+    codes = [code for (code,) in db.session.query(Coupon.code).limit(20)]
+    if not codes:
+        print('No coupons in the database.')
+        return
+    user = User.query.first()
+
+    def run(batch):
+        start = time.perf_counter()
+        for n in range(count):
+            if batch:
+                coupon_engine.evaluate_many(codes, 10000.0, None, user)
+            else:
+                coupon_engine.evaluate(codes[n % len(codes)], 10000.0, None, user)
+        return (time.perf_counter() - start) / count
+
+    ttl = coupon_engine.ttl
+    try:
+        coupon_engine.ttl = 0
+        cold = run(False)
+        cold_batch = run(True)
+        coupon_engine.ttl = 60
+        coupon_engine.clear()
+        warm = run(False)
+        warm_batch = run(True)
+    finally:
+        coupon_engine.ttl = ttl
+        coupon_engine.clear()
+
+    print(f'single code, uncached:      {cold * 1e6:8.1f} us/check')
+    print(f'single code, cached:        {warm * 1e6:8.1f} us/check')
+    print(f'batch of {len(codes):2d}, uncached:     {cold_batch * 1e6:8.1f} us/batch')
+    print(f'batch of {len(codes):2d}, cached:       {warm_batch * 1e6:8.1f} us/batch')
+
+@app.cli.command()
+def optimize_images():
+    """Build resized WebP/JPEG variants for menu images uploaded before the pipeline."""
+    from concurrent.futures import as_completed
+    from app.utils.images import image_pipeline, is_variant
+
+    out_dir = image_pipeline.out_dir
+    jobs = {}
+    for item in MenuItem.query.filter(MenuItem.image_url.isnot(None)):
+        path = os.path.join(out_dir, item.image_url)
+        if is_variant(item.image_url) or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        jobs[image_pipeline.submit_data(data, item.image_url)] = (item, len(data))
+
+    before = after = 0
+    for future in as_completed(jobs):
+        item, size = jobs[future]
+        try:
+            item.image_url = future.result()
+        except Exception as e:
+            print(f'{item.name}: {e}')
+            continue
+        card = os.path.getsize(os.path.join(out_dir, item.image_url))
+        webp = os.path.join(out_dir, item.image_url[:-len('.jpg')] + '.webp')
+        if os.path.exists(webp):
+            card = min(card, os.path.getsize(webp))
+        before += size
+        after += card
+        print(f'{item.name:30s} {size / 1024:8.0f} KB -> {card / 1024:6.0f} KB (card)')
+    db.session.commit()
+    image_pipeline.shutdown()
+    if jobs:
+        print(f'{len(jobs)} images: {before / 1024:.0f} KB of originals -> {after / 1024:.0f} KB per menu card view')
+
+@app.cli.command()
+@click.option('--count', default=100000, help='Calls per scenario.')
+def bench_rate_limiter(count):
+    """Time the rate limiter on the allowed path: store hit and whole decorator."""
+    from app.utils.ratelimit import rate_limit, rate_limiter
+
+    def view():
+        return ''
+    limited = rate_limit(f'{count * 10}/second', key='ip', scope='bench')(view)
+
+    def run(func):
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        return (time.perf_counter() - start) / count
+
+    try:
+        store = run(lambda: rate_limiter.hit('bench:key', 1e-9, count * 10))
+        with app.test_request_context('/', environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+            bare = run(view)
+            decorated = run(limited)
+            over = rate_limit('1/minute', key='ip', scope='bench-deny')(view)
+            over()
+            refused = run(over)
+    finally:
+        rate_limiter.store.clear()
+
+    print(f'{type(rate_limiter.store).__name__}')
+    print(f'store hit:            {store * 1e6:8.2f} us')
+    print(f'decorator overhead:   {(decorated - bare) * 1e6:8.2f} us (allowed)')
+    print(f'refused (429 built):  {refused * 1e6:8.2f} us')
+
+@app.cli.command()
+@click.option('--port', default=8765, help='Port to listen on.')
+@click.option('--latency', default=0.0, help='Seconds to wait before every response.')
+@click.option('--fail-rate', default=0.0, help='Fraction of calls answered with 503.')
+def fake_paystack(port, latency, fail_rate):
+    """Run a local fake Paystack API (point PAYSTACK_BASE_URL at it)."""
+    from app.utils.fake_paystack import make_server
+    server = make_server(port=port, latency=latency, fail_rate=fail_rate)
+    print(f'Fake Paystack on http://127.0.0.1:{port} (latency {latency}s, fail rate {fail_rate})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+@app.cli.command()
+@click.option('--calls', default=300, help='Verify calls per scenario.')
+@click.option('--threads', default=8, help='Concurrent callers.')
+def bench_paystack(calls, threads):
+    """Compare per-call connections vs the pooled client, then a down gateway with the breaker."""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.utils.fake_paystack import start_in_thread
+    from app.utils.paystack import PaystackClient, GatewayError
+
+    server, base_url = start_in_thread(latency=0.002)
+
+    def run(call):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            outcomes = list(pool.map(call, range(calls)))
+        return time.perf_counter() - start, outcomes
+
+    def unpooled(n):
+        # what paystackapi does: a new connection for every call, no timeout
+        return requests.get(f'{base_url}/transaction/verify/ref-{n}').ok
+
+    client = PaystackClient()
+    client.init_app(app)
+    client.session = client._make_session(retries=0, pool_size=threads)
+    client.base_url = base_url
+
+    def pooled(n):
+        return client.verify(f'ref-{n}')['status'] == 'success'
+
+    def cached(n):
+        return client.verify(f'ref-{n % 10}')['status'] == 'success'
+
+    for name, call in (('new connection per call', unpooled), ('pooled session', pooled),
+                       ('pooled + verify cache', cached)):
+        elapsed, outcomes = run(call)
+        print(f'{name:26s} {elapsed / calls * 1e3:7.2f} ms/call  ({sum(outcomes)}/{calls} ok)')
+    server.shutdown()
+
+    # A gateway that hangs: each call costs the read timeout until the breaker opens
+    server, client.base_url = start_in_thread(latency=0.5)
+    client.timeout = (0.5, 0.2)
+
+    def down(n):
+        try:
+            client.verify(f'down-{n}')
+            return True
+        except GatewayError:
+            return False
+
+    elapsed, outcomes = run(down)
+    print(f'{"hung gateway + breaker":26s} {elapsed / calls * 1e3:7.2f} ms/call  '
+          f'({server.requests} reached the gateway, breaker {client.breaker.state})')
+    server.shutdown()
+
+@app.cli.command()
+@click.option('--minutes', default=120, help='Age after which an unpaid pending order is abandoned.')
+def release_abandoned_orders(minutes):
+    """Cancel stale unpaid orders so their coupon uses are released."""
+    from app.utils.coupons import cancel_abandoned_orders
+    cancelled = cancel_abandoned_orders(minutes * 60)
+    print(f'Cancelled {cancelled} abandoned orders.')
+
+@app.cli.command()
+@click.option('--threads', default=50, help='Concurrent redeemers.')
+@click.option('--max-uses', default=10, help='Uses allowed on the test coupon.')
+def stress_coupon_redemption(threads, max_uses):
+    """Redeem a limited coupon from many threads at once and check the count."""
+    import threading
+    from uuid import uuid4
+    from sqlalchemy.exc import OperationalError
+    from app.models import Coupon, CouponUsage
+    from app.utils.coupons import reserve_coupon
+
+    user = User.query.first()
+    if user is None:
+        raise click.ClickException('Create a user first.')
+    # Inactive, so it cannot be used at a real checkout while the test runs
+    coupon = Coupon(code=f'STRESS-{uuid4().hex}', amount=1, max_uses=max_uses,
+                    is_active=False, note='stress-coupon-redemption')
+    db.session.add(coupon)
+    db.session.commit()
+    coupon_id, user_id = coupon.id, user.id
+
+    barrier = threading.Barrier(threads)
+    outcomes = []
+
+    def redeem():
+        with app.app_context():
+            barrier.wait()
+            for _ in range(20):   # retry while the database is locked
+                try:
+                    won = reserve_coupon(coupon_id)
+                    if won:
+                        db.session.add(CouponUsage(coupon_id=coupon_id, user_id=user_id))
+                    db.session.commit()
+                    outcomes.append(won)
+                    return
+                except OperationalError:
+                    db.session.rollback()
+                    time.sleep(0.01)
+            outcomes.append(None)
+
+    workers = [threading.Thread(target=redeem) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    db.session.expire_all()
+    uses = db.session.get(Coupon, coupon_id).uses_count
+    usages = CouponUsage.query.filter_by(coupon_id=coupon_id).count()
+    won = outcomes.count(True)
+    gave_up = outcomes.count(None)
+    print(f'{threads} threads: {won} redeemed, {outcomes.count(False)} refused, '
+          f'{gave_up} gave up; uses_count={uses}, usage rows={usages}')
+    if gave_up:
+        print(f'{gave_up} threads gave up after repeated lock errors (not a redemption error).')
+
+    CouponUsage.query.filter_by(coupon_id=coupon_id).delete()
+    Coupon.query.filter_by(id=coupon_id).delete()
+    db.session.commit()
+
+    # Lock give-ups may leave uses unclaimed, but nothing may be over-redeemed
+    if not (won == uses == usages <= max_uses):
+        raise click.ClickException('Coupon redemption count is wrong.')
+    if not gave_up and won != min(max_uses, threads):
+        raise click.ClickException('Coupon uses were refused while still available.')
+    print('OK')
+
+@app.cli.command()
+def check_query_plans():
+    """EXPLAIN the hot queries; exit non-zero if any needs a full table scan."""
+    from app.utils.query_plans import full_scans
+    problems = full_scans()
+    for problem in problems:
+        print(f'{problem.query}: {problem.detail}')
+    if problems:
+        raise click.ClickException(f'{len(problems)} hot queries fall back to a full scan.')
+    print('All hot queries use an index.')
+
+@app.cli.command()
+@click.option('--writers', default=8, help='Threads placing orders.')
+@click.option('--readers', default=4, help='Threads listing orders.')
+@click.option('--seconds', default=5.0, help='Duration of each run.')
+def load_test_sqlite(writers, readers, seconds):
+    """Orders/second on a scratch SQLite file, default settings vs production profile."""
+    import tempfile
+    import threading
+    from uuid import uuid4
+    from datetime import datetime
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import OperationalError
+    from app.models import Order, OrderItem
+    from app.utils import stats
+    from app.utils.sqlite import configure_engine
+
+    order_t, item_t = Order.__table__, OrderItem.__table__
+
+    def place_order(connection, n):
+        now = datetime.utcnow()
+        order_id = connection.execute(order_t.insert().values(
+            order_number=f'LT{uuid4().hex[:16]}', customer_id=1 + n % 50,
+            subtotal_amount=3000.0, total_amount=3725.0, status='pending',
+            created_at=now, updated_at=now,
+        )).inserted_primary_key[0]
+        lines = [(1 + (n + k) % 20, 1 + k) for k in range(3)]
+        connection.execute(item_t.insert(), [
+            {'order_id': order_id, 'menu_item_id': item_id, 'quantity': qty,
+             'unit_price': 1000.0, 'subtotal': qty * 1000.0}
+            for item_id, qty in lines
+        ])
+        stats.record_order(connection, now.date(), 'pending', 3725.0)
+        stats.record_item_sales(connection, now.date(), lines)
+
+    def list_orders(connection, n):
+        connection.execute(
+            order_t.select().where(order_t.c.customer_id == 1 + n % 50)
+            .order_by(order_t.c.created_at.desc(), order_t.c.id.desc()).limit(20)
+        ).all()
+
+    def run(tuned):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Default pysqlite: rollback journal, 5 s lock wait, no write queue
+            engine = create_engine(f'sqlite:///{tmp}/load.db')
+            if tuned:
+                configure_engine(engine, app.config)
+            db.metadata.create_all(engine, tables=[order_t, item_t] + [
+                m.__table__ for m in (stats.StatCounter, stats.OrderDailyStat, stats.MenuItemDailySales)])
+
+            deadline = time.monotonic() + seconds
+            counts = {'orders': 0, 'reads': 0, 'errors': 0}
+            lock = threading.Lock()
+
+            def worker(action, key):
+                n = 0
+                while time.monotonic() < deadline:
+                    n += 1
+                    try:
+                        with engine.begin() as connection:
+                            action(connection, n)
+                    except OperationalError:
+                        key_hit = 'errors'
+                    else:
+                        key_hit = key
+                    with lock:
+                        counts[key_hit] += 1
+
+            threads = [threading.Thread(target=worker, args=(place_order, 'orders')) for _ in range(writers)]
+            threads += [threading.Thread(target=worker, args=(list_orders, 'reads')) for _ in range(readers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            engine.dispose()
+            return counts
+
+    for label, tuned in (('default', False), ('production profile', True)):
+        counts = run(tuned)
+        print(f'{label:>18}: {counts["orders"] / seconds:7.1f} orders/s, '
+              f'{counts["reads"] / seconds:7.1f} reads/s, {counts["errors"]} lock errors')
+
+@app.cli.command()
+@click.option('--username', default=None, help='User to browse as (defaults to the first admin).')
+def check_query_budgets(username):
+    """GET the main pages and fail if any runs more statements than its budget."""
+    from app.utils.query_audit import check_query_budgets as check
+    user = User.query.filter_by(username=username).first() if username \
+        else User.query.filter_by(is_admin=True).first()
+    if user is None:
+        raise click.ClickException('No such user.')
+
+    failed = 0
+    for path, status, queries, budget, repeated in check(app, user):
+        ok = queries <= budget and status < 500
+        failed += not ok
+        print(f'{"ok  " if ok else "FAIL"} {path:<22} {status} {queries:3d} queries (budget {budget})')
+        if not ok:
+            for count, origin, sql in repeated:
+                print(f'       {count}x at {origin}: {sql[:120]}')
+    if failed:
+        raise click.ClickException(f'{failed} pages over their query budget.')
+
+@app.cli.command()
+@click.option('--days', default=None, type=int, help='Training window (default ETA_WINDOW_DAYS).')
+def rebuild_eta_model(days):
+    """Refit the delivery ETA lookup tables from recent orders (run from cron)."""
+    from app.utils import eta
+    start = time.perf_counter()
+    tables = eta.rebuild(days or app.config['ETA_WINDOW_DAYS'])
+    orders = tables['item'].get(0, (0, 0))[1]
+    print(f"Fitted on {orders} orders in {time.perf_counter() - start:.2f}s: "
+          f"{len(tables['wait'])} hours, {len(tables['item']) - bool(orders)} items, "
+          f"{len(tables['zone'])} zones.")
+
+@app.cli.command()
+@click.option('--batch-size', default=500, help='Events per consumer transaction.')
+def project_status_events(batch_size):
+    """Bring the status log consumers (ETA learning, ...) up to date; run from cron."""
+    from app.utils import eta  # noqa: F401  (registers the 'eta' consumer)
+    from app.utils import status_log
+    for name, count in status_log.run_consumers(batch_size).items():
+        print(f'{name}: {count} events')
+
+
+@app.cli.command()
+def rebuild_stats():
+    """Rebuild the dashboard rollup tables from scratch."""
+    from app.utils.stats import rebuild_stats as rebuild
+    rebuild()
+    print('Dashboard statistics rebuilt.')
+
+@app.cli.command()
+@click.option('--seconds', default=5.0, help='How long to run.')
+@click.option('--clients', default=None, type=int, help='Concurrent logins (default 4 per pool worker).')
+@click.option('--method', default=None, help='Hash method to time (default PASSWORD_HASH_METHOD).')
+def bench_passwords(seconds, clients, method):
+    """Logins per second (per core) through the password pool, and how many were shed."""
+    import threading
+    from werkzeug.security import generate_password_hash
+    from app.utils.passwords import PasswordServiceBusy, password_service
+
+    configured = password_service.method
+    method = method or configured
+    password_service.use_method(method)
+    pwhash = generate_password_hash('correct horse', method)
+    clients = clients or 4 * max(password_service.workers, 1)
+    latencies, shed = [], [0]
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                password_service.verify(pwhash, 'correct horse')
+            except PasswordServiceBusy:
+                shed[0] += 1
+                time.sleep(0.01)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        password_service.use_method(configured)
+
+    cores = min(password_service.workers or 1, os.cpu_count() or 1)
+    latencies.sort()
+    rate = len(latencies) / seconds
+    print(f'{method} on {password_service.workers} {password_service.pool_kind} workers, '
+          f'{clients} clients, {os.cpu_count()} cores')
+    print(f'logins/s:           {rate:8.1f} ({rate / cores:.1f} per core)')
+    if latencies:
+        print(f'latency p50 / p95:  {latencies[len(latencies) // 2] * 1000:8.1f} / '
+              f'{latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms')
+    print(f'shed attempts:      {shed[0]:8d}')
+
 @app.cli.command()
 def create_admin():
     """Create admin user."""